@@ -1,10 +1,15 @@
-from typing import Callable, List, Tuple
+import functools
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 
 import python_helper_sympy as phs
 import sympy
 
 BigOGradingFunctionT = Callable[[str, str, List[str]], Tuple[float, str]]
 
+# The number of graded pairs of expressions that are kept around for each type.
+GRADE_CACHE_SIZE = 1024
+
 TYPE_ERROR_FEEDBACK = (
     "Your answer could not be processed by the autograder. Did you divide by 0?"
 )
@@ -30,9 +35,306 @@ THETA_LOWER_ORDER_TERMS_FEEDBACK = (
 )
 
 
-def grade_o_expression(
+# Grading compares how fast the answers grow as n goes to infinity, which
+# `sympy.limit()` is very slow at. Answers made up of constants, powers,
+# logarithms, exponentials and factorials of n are instead compared by their
+# dominant terms below. Anything else falls back to `sympy.limit()`, which
+# raises HasTimeoutError after `phs.COMPARISON_TIME_LIMIT`.
+
+# Exponents of n, log(n), log(log(n)) and log(log(log(n))) in a product of
+# their powers. Ordering these tuples lexicographically orders the products by
+# how fast they grow.
+Monomial = Tuple[sympy.Expr, sympy.Expr, sympy.Expr, sympy.Expr]
+
+# A sum of monomials, as a map from each monomial to its coefficient.
+LogPolynomial = Dict[Monomial, sympy.Expr]
+
+ONE: Monomial = (sympy.S.Zero, sympy.S.Zero, sympy.S.Zero, sympy.S.Zero)
+N: Monomial = (sympy.S.One, sympy.S.Zero, sympy.S.Zero, sympy.S.Zero)
+LOG_N: Monomial = (sympy.S.Zero, sympy.S.One, sympy.S.Zero, sympy.S.Zero)
+LOG_LOG_N: Monomial = (sympy.S.Zero, sympy.S.Zero, sympy.S.One, sympy.S.Zero)
+LOG_LOG_LOG_N: Monomial = (sympy.S.Zero, sympy.S.Zero, sympy.S.Zero, sympy.S.One)
+N_LOG_N: Monomial = (sympy.S.One, sympy.S.One, sympy.S.Zero, sympy.S.Zero)
+
+
+class UnsupportedGrowthError(Exception):
+    """The growth of an expression can't be found without `sympy.limit()`."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class DominantTerm:
+    """
+    Describes an expression that behaves like `coefficient * exp(exponent)`
+    as n goes to infinity, where every monomial in exponent goes to infinity.
+    If exact is True, the expression is equal to this.
+    """
+
+    coefficient: sympy.Expr
+    exponent: LogPolynomial
+    exact: bool
+
+
+def _is_zero(value: sympy.Expr) -> bool:
+    is_zero = value.is_zero
+    if is_zero is None:
+        raise UnsupportedGrowthError()
+    return is_zero
+
+
+def _is_positive(value: sympy.Expr) -> bool:
+    is_positive = value.is_extended_positive
+    if is_positive is None:
+        raise UnsupportedGrowthError()
+    return is_positive
+
+
+def _check_constant(value: sympy.Expr) -> sympy.Expr:
+    if not (value.is_extended_real and value.is_finite) or _is_zero(value):
+        raise UnsupportedGrowthError()
+    return value
+
+
+def _log(value: sympy.Expr) -> sympy.Expr:
+    if not _is_positive(value):
+        raise UnsupportedGrowthError()
+    return sympy.expand_log(sympy.log(value), force=True)
+
+
+def _add(
+    a: LogPolynomial, b: LogPolynomial, scale: sympy.Expr = sympy.S.One
+) -> LogPolynomial:
+    result = dict(a)
+    for monomial, coefficient in b.items():
+        result[monomial] = result.get(monomial, sympy.S.Zero) + scale * coefficient
+    return {m: c for m, c in result.items() if not _is_zero(c)}
+
+
+def _multiply(a: LogPolynomial, b: LogPolynomial) -> LogPolynomial:
+    result: LogPolynomial = {}
+    for monomial_a, coefficient_a in a.items():
+        for monomial_b, coefficient_b in b.items():
+            monomial = tuple(x + y for x, y in zip(monomial_a, monomial_b))
+            result = _add(result, {monomial: coefficient_a * coefficient_b})  # type: ignore
+    return result
+
+
+def _leading(polynomial: LogPolynomial) -> Optional[Tuple[Monomial, sympy.Expr]]:
+    """Returns the fastest growing monomial and its coefficient."""
+    try:
+        return max(polynomial.items(), default=None, key=lambda item: item[0])
+    except TypeError:
+        # The exponents can't be compared
+        raise UnsupportedGrowthError()
+
+
+def _from_exponent(polynomial: LogPolynomial) -> DominantTerm:
+    """Returns the dominant term of `exp(polynomial)`."""
+    constant = polynomial.get(ONE, sympy.S.Zero)
+    exponent = {m: c for m, c in polynomial.items() if m > ONE}
+    return DominantTerm(
+        sympy.exp(constant),
+        exponent,
+        exact=len(exponent) + (ONE in polynomial) == len(polynomial),
+    )
+
+
+def log_polynomial(expr: sympy.Expr, n: sympy.Symbol) -> LogPolynomial:
+    """
+    Returns expr as a sum of monomials, or raises UnsupportedGrowthError if it
+    can't be written as one.
+    """
+    if not expr.has(n):
+        return {ONE: _check_constant(expr)} if not _is_zero(expr) else {}
+    if expr == n:
+        return {N: sympy.S.One}
+    if isinstance(expr, sympy.Add):
+        result: LogPolynomial = {}
+        for arg in expr.args:
+            result = _add(result, log_polynomial(arg, n))
+        return result
+    if isinstance(expr, sympy.Mul):
+        result = {ONE: sympy.S.One}
+        for arg in expr.args:
+            result = _multiply(result, log_polynomial(arg, n))
+        return result
+    if isinstance(expr, sympy.Pow) and not expr.exp.has(n):
+        base = log_polynomial(expr.base, n)
+        if expr.exp.is_Integer and expr.exp >= 0:
+            result = {ONE: sympy.S.One}
+            for _ in range(int(expr.exp)):
+                result = _multiply(result, base)
+            return result
+        if len(base) == 1:
+            ((monomial, coefficient),) = base.items()
+            if _is_positive(coefficient):
+                return {
+                    tuple(x * expr.exp for x in monomial): coefficient**expr.exp  # type: ignore
+                }
+    if isinstance(expr, sympy.log):
+        term = dominant_term(expr.args[0], n)
+        if term.exact:
+            return _add(term.exponent, {ONE: _log(term.coefficient)})
+    raise UnsupportedGrowthError()
+
+
+def dominant_term(expr: sympy.Expr, n: sympy.Symbol) -> DominantTerm:
+    """
+    Returns the dominant term of expr as n goes to infinity, or raises
+    UnsupportedGrowthError if expr isn't made up of constants, powers,
+    logarithms, exponentials and factorials of n.
+    """
+    if not expr.has(n):
+        return DominantTerm(_check_constant(expr), {}, exact=True)
+
+    if expr == n:
+        return DominantTerm(sympy.S.One, {LOG_N: sympy.S.One}, exact=True)
+
+    if isinstance(expr, sympy.Mul):
+        coefficient = sympy.S.One
+        exponent: LogPolynomial = {}
+        exact = True
+        for arg in expr.args:
+            term = dominant_term(arg, n)
+            coefficient *= term.coefficient
+            exponent = _add(exponent, term.exponent)
+            exact = exact and term.exact
+        return DominantTerm(coefficient, exponent, exact)
+
+    if isinstance(expr, sympy.Add):
+        terms = [dominant_term(arg, n) for arg in expr.args]
+        dominant = terms[0]
+        for term in terms[1:]:
+            difference = _leading(_add(term.exponent, dominant.exponent, -1))
+            if difference is None:
+                dominant = DominantTerm(
+                    dominant.coefficient + term.coefficient, dominant.exponent, False
+                )
+            elif _is_positive(difference[1]):
+                dominant = term
+        if _is_zero(dominant.coefficient):
+            # The dominant terms cancel out
+            raise UnsupportedGrowthError()
+        return DominantTerm(dominant.coefficient, dominant.exponent, exact=False)
+
+    if isinstance(expr, sympy.Pow) and not expr.exp.has(n):
+        power = _check_constant(expr.exp)
+        term = dominant_term(expr.base, n)
+        if not (power.is_integer or _is_positive(term.coefficient)):
+            raise UnsupportedGrowthError()
+        return DominantTerm(
+            term.coefficient**power,
+            _add({}, term.exponent, power),
+            term.exact,
+        )
+
+    if isinstance(expr, sympy.Pow):
+        term = dominant_term(expr.base, n)
+        if not term.exact:
+            raise UnsupportedGrowthError()
+        log_base = _add(term.exponent, {ONE: _log(term.coefficient)})
+        return _from_exponent(_multiply(log_polynomial(expr.exp, n), log_base))
+
+    if isinstance(expr, sympy.exp):
+        return _from_exponent(log_polynomial(expr.args[0], n))
+
+    if isinstance(expr, sympy.log):
+        term = dominant_term(expr.args[0], n)
+        leading = _leading(term.exponent)
+        if leading is None:
+            # The argument goes to a constant, which must not be 1
+            return DominantTerm(
+                _check_constant(_log(term.coefficient)), {}, exact=False
+            )
+        monomial, coefficient = leading
+        if not _is_zero(monomial[3]):
+            raise UnsupportedGrowthError()
+        exponent = _add(
+            {},
+            {LOG_N: monomial[0], LOG_LOG_N: monomial[1], LOG_LOG_LOG_N: monomial[2]},
+        )
+        exact = (
+            term.exact and len(term.exponent) == 1 and _is_zero(_log(term.coefficient))
+        )
+        return DominantTerm(coefficient, exponent, exact)
+
+    if isinstance(expr, sympy.factorial):
+        # By Stirling's formula, log((a*n + b)!) is
+        # (a*n + b + 1/2) * log(a*n) - a*n + log(2*pi)/2 + o(1)
+        argument = log_polynomial(expr.args[0], n)
+        a = argument.pop(N, sympy.S.Zero)
+        b = argument.pop(ONE, sympy.S.Zero)
+        if argument or not _is_positive(a):
+            raise UnsupportedGrowthError()
+        return DominantTerm(
+            a ** (b + sympy.S.Half) * sympy.sqrt(2 * sympy.pi),
+            _add({}, {N_LOG_N: a, N: a * _log(a) - a, LOG_N: b + sympy.S.Half}),
+            exact=False,
+        )
+
+    if isinstance(expr, sympy.Abs):
+        term = dominant_term(expr.args[0], n)
+        return DominantTerm(abs(term.coefficient), term.exponent, term.exact)
+
+    raise UnsupportedGrowthError()
+
+
+def _limit(coefficient: sympy.Expr, exponent: LogPolynomial) -> sympy.Expr:
+    """Returns the limit of `coefficient * exp(exponent)`."""
+    leading = _leading(exponent)
+    if leading is None:
+        return coefficient
+    if _is_positive(leading[1]):
+        return sympy.oo if _is_positive(coefficient) else -sympy.oo
+    return sympy.S.Zero
+
+
+def limit_at_infinity(expr: sympy.Expr, n: sympy.Symbol) -> sympy.Expr:
+    """Returns the limit of expr as n goes to infinity."""
+    try:
+        term = dominant_term(expr, n)
+    except UnsupportedGrowthError:
+        with phs.time_limit(phs.COMPARISON_TIME_LIMIT):
+            return sympy.limit(expr, n, sympy.oo)
+    return _limit(term.coefficient, term.exponent)
+
+
+def limit_of_ratio(a: sympy.Expr, b: sympy.Expr, n: sympy.Symbol) -> sympy.Expr:
+    """Returns the limit of a / b as n goes to infinity."""
+    try:
+        term_a = dominant_term(a, n)
+        term_b = dominant_term(b, n)
+    except UnsupportedGrowthError:
+        with phs.time_limit(phs.COMPARISON_TIME_LIMIT):
+            return sympy.limit(sympy.simplify(a / b), n, sympy.oo)
+    coefficient = term_a.coefficient / term_b.coefficient
+    if not coefficient.is_Rational:
+        coefficient = sympy.simplify(coefficient)
+    return _limit(coefficient, _add(term_a.exponent, term_b.exponent, -1))
+
+
+@functools.lru_cache(maxsize=GRADE_CACHE_SIZE)
+def _check_equivalent(a: sympy.Expr, b: sympy.Expr) -> bool:
+    return phs.is_equivalent(a, b)
+
+
+def _is_equivalent(a: sympy.Expr, b: sympy.Expr) -> bool:
+    try:
+        return _check_equivalent(a, b)
+    except (phs.HasTimeoutError, TypeError):
+        # Grade the answer by its growth instead, which reports type errors. The
+        # cache doesn't keep errors, so a timed out comparison is tried again the
+        # next time the answer is graded.
+        return False
+
+
+def _parse_expressions(
     a_true: str, a_sub: str, variables: List[str]
-) -> Tuple[float, str]:
+) -> Tuple[sympy.Expr, sympy.Expr, bool]:
+    """
+    Parses both answers, and returns whether they are written the same way.
+    """
     sym_true, sym_true_source = phs.convert_string_to_sympy_with_source(
         a_true, variables, allow_complex=False, allow_trig_functions=False
     )
@@ -41,21 +343,32 @@ def grade_o_expression(
         a_sub, variables, allow_complex=False, allow_trig_functions=False
     )
 
-    if sym_true_source == sym_sub_source:
+    return sym_true, sym_sub, sym_true_source == sym_sub_source
+
+
+def grade_o_expression(
+    a_true: str, a_sub: str, variables: List[str]
+) -> Tuple[float, str]:
+    sym_true, sym_sub, same_source = _parse_expressions(a_true, a_sub, variables)
+
+    if same_source:
         return (1, CORRECT_UNCONDITIONAL_FEEDBACK)
+    elif _is_equivalent(sym_true, sym_sub):
+        return (1.0, CORRECT_COMPLEX_FEEDBACK)
+
+    return _grade_o(sym_true, sym_sub, variables[0])
 
-    try:
-        if sym_true.equals(sym_sub):
-            return (1.0, CORRECT_COMPLEX_FEEDBACK)
 
-        elif sympy.limit(sym_sub, sympy.Symbol(variables[0]), sympy.oo) < sympy.sympify(
-            0
-        ):
+@functools.lru_cache(maxsize=GRADE_CACHE_SIZE)
+def _grade_o(
+    sym_true: sympy.Expr, sym_sub: sympy.Expr, variable: str
+) -> Tuple[float, str]:
+    n = sympy.Symbol(variable)
+    try:
+        if limit_at_infinity(sym_sub, n) < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
 
-        L = sympy.limit(
-            sympy.simplify(sym_true / sym_sub), sympy.Symbol(variables[0]), sympy.oo
-        )
+        L = limit_of_ratio(sym_true, sym_sub, n)
 
         if L < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
@@ -74,32 +387,27 @@ def grade_o_expression(
 def grade_theta_expression(
     a_true: str, a_sub: str, variables: List[str]
 ) -> Tuple[float, str]:
-    sym_true, sym_true_source = phs.convert_string_to_sympy_with_source(
-        a_true, variables, allow_complex=False, allow_trig_functions=False
-    )
-
-    sym_sub, sym_sub_source = phs.convert_string_to_sympy_with_source(
-        a_sub, variables, allow_complex=False, allow_trig_functions=False
-    )
+    sym_true, sym_sub, same_source = _parse_expressions(a_true, a_sub, variables)
 
-    if sym_true_source == sym_sub_source:
+    if same_source:
         return (1, CORRECT_UNCONDITIONAL_FEEDBACK)
+    elif _is_equivalent(sym_true, sym_sub):
+        return (1.0, CORRECT_COMPLEX_FEEDBACK)
+
+    return _grade_theta(sym_true, sym_sub, variables[0])
 
-    try:
-        if sym_true.equals(sym_sub):
-            return (1.0, CORRECT_COMPLEX_FEEDBACK)
 
-        elif sympy.limit(sym_sub, sympy.Symbol(variables[0]), sympy.oo) < sympy.sympify(
-            0
-        ):
+@functools.lru_cache(maxsize=GRADE_CACHE_SIZE)
+def _grade_theta(
+    sym_true: sympy.Expr, sym_sub: sympy.Expr, variable: str
+) -> Tuple[float, str]:
+    n = sympy.Symbol(variable)
+    try:
+        if limit_at_infinity(sym_sub, n) < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
 
-        omega_L = sympy.limit(
-            sympy.simplify(sym_sub / sym_true), sympy.Symbol(variables[0]), sympy.oo
-        )
-        bigo_L = sympy.limit(
-            sympy.simplify(sym_true / sym_sub), sympy.Symbol(variables[0]), sympy.oo
-        )
+        omega_L = limit_of_ratio(sym_sub, sym_true, n)
+        bigo_L = limit_of_ratio(sym_true, sym_sub, n)
 
         if omega_L < sympy.sympify(0) or bigo_L < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
@@ -116,29 +424,26 @@ def grade_theta_expression(
 def grade_omega_expression(
     a_true: str, a_sub: str, variables: List[str]
 ) -> Tuple[float, str]:
-    sym_true, sym_true_source = phs.convert_string_to_sympy_with_source(
-        a_true, variables, allow_complex=False, allow_trig_functions=False
-    )
-
-    sym_sub, sym_sub_source = phs.convert_string_to_sympy_with_source(
-        a_sub, variables, allow_complex=False, allow_trig_functions=False
-    )
+    sym_true, sym_sub, same_source = _parse_expressions(a_true, a_sub, variables)
 
-    if sym_true_source == sym_sub_source:
+    if same_source:
         return (1, CORRECT_UNCONDITIONAL_FEEDBACK)
+    elif _is_equivalent(sym_true, sym_sub):
+        return (1, CORRECT_COMPLEX_FEEDBACK)
+
+    return _grade_omega(sym_true, sym_sub, variables[0])
 
-    try:
-        if sym_true.equals(sym_sub):
-            return (1, CORRECT_COMPLEX_FEEDBACK)
 
-        elif sympy.limit(sym_sub, sympy.Symbol(variables[0]), sympy.oo) < sympy.sympify(
-            0
-        ):
+@functools.lru_cache(maxsize=GRADE_CACHE_SIZE)
+def _grade_omega(
+    sym_true: sympy.Expr, sym_sub: sympy.Expr, variable: str
+) -> Tuple[float, str]:
+    n = sympy.Symbol(variable)
+    try:
+        if limit_at_infinity(sym_sub, n) < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
 
-        L = sympy.limit(
-            sympy.simplify(sym_true / sym_sub), sympy.Symbol(variables[0]), sympy.oo
-        )
+        L = limit_of_ratio(sym_true, sym_sub, n)
 
         if L < sympy.sympify(0):
             return (0.0, NEGATIVE_FEEDBACK)
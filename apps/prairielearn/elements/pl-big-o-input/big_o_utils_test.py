@@ -1,6 +1,9 @@
+import time
+
 import big_o_utils as bou
 import pytest
 import python_helper_sympy as phs
+import sympy
 
 VARIABLES = ["n"]
 
@@ -239,6 +242,84 @@ class TestBigOInput:
         assert score == 0.0
         assert feedback == bou.TYPE_ERROR_FEEDBACK
 
+    @pytest.mark.parametrize("grading_fn", ALL_GRADING_FUNCTIONS)
+    def test_comparison_timeout(
+        self, grading_fn: bou.BigOGradingFunctionT, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        def time_out(a: sympy.Expr, b: sympy.Expr) -> bool:
+            raise phs.HasTimeoutError()
+
+        bou._check_equivalent.cache_clear()
+        monkeypatch.setattr(phs, "is_equivalent", time_out)
+        score, feedback = grading_fn("n*(n + 1)", "n**2 + n", VARIABLES)
+
+        assert score < 1.0
+        assert "lower order" in feedback
+
+        # The timeout must not be remembered once the comparison succeeds
+        monkeypatch.undo()
+        score, feedback = grading_fn("n*(n + 1)", "n**2 + n", VARIABLES)
+
+        assert score == 1.0
+        assert feedback == bou.CORRECT_COMPLEX_FEEDBACK
+
+
+@pytest.mark.parametrize(
+    "a, b, limit",
+    [
+        ("n**2", "n**2 + n", "1"),
+        ("n**2", "3*n**2 + log(n)", "1/3"),
+        ("log(n)", "log(n**2)", "1/2"),
+        ("log(n)", "log(log(n))", "oo"),
+        ("2**n", "n**1000", "oo"),
+        ("(3/2)**n", "2**n", "0"),
+        ("4**n", "2**(2*n)", "1"),
+        ("n**n", "factorial(n)", "oo"),
+        ("factorial(n)", "sqrt(2*pi*n)*(n/e)**n", "1"),
+        ("factorial(n - 1)", "factorial(n)/n", "1"),
+        ("factorial(2*n)", "4**n * factorial(n)**2 / sqrt(pi*n)", "1"),
+        ("n**log(n)", "2**(log(n)**2)", "oo"),
+        ("-n**2", "n + 1", "-oo"),
+    ],
+)
+def test_limit_of_ratio(a: str, b: str, limit: str) -> None:
+    n = sympy.Symbol("n")
+    a_sympy = phs.convert_string_to_sympy(a, VARIABLES)
+    b_sympy = phs.convert_string_to_sympy(b, VARIABLES)
+
+    # These must not need `sympy.limit()`
+    bou.dominant_term(a_sympy, n)
+    bou.dominant_term(b_sympy, n)
+
+    assert bou.limit_of_ratio(a_sympy, b_sympy, n) == sympy.sympify(limit)
+
+
+@pytest.mark.parametrize(
+    "expr",
+    ["log(n + 1) - log(n)", "sqrt(n + 1) - sqrt(n)", "n**2 * factorial(n**2)"],
+)
+def test_limit_fallback(expr: str) -> None:
+    n = sympy.Symbol("n")
+    expr_sympy = phs.convert_string_to_sympy(expr, VARIABLES)
+    assert bou.limit_at_infinity(expr_sympy, n) == sympy.limit(expr_sympy, n, sympy.oo)
+
+
+def test_limit_fallback_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    def slow_limit(*args: object) -> sympy.Expr:
+        time.sleep(10)
+        return sympy.S.Zero
+
+    n = sympy.Symbol("n")
+    a = phs.convert_string_to_sympy("log(n + 1) - log(n)", VARIABLES)
+    b = phs.convert_string_to_sympy("n", VARIABLES)
+    monkeypatch.setattr(sympy, "limit", slow_limit)
+    monkeypatch.setattr(phs, "COMPARISON_TIME_LIMIT", 0.1)
+
+    with pytest.raises(phs.HasTimeoutError):
+        bou.limit_at_infinity(a, n)
+    with pytest.raises(phs.HasTimeoutError):
+        bou.limit_of_ratio(a, b, n)
+
 
 class TestExceptions:
     @pytest.mark.parametrize("a_sub", ["tan(n)", "sin(n)", "cos(n)", "arccos(n)"])
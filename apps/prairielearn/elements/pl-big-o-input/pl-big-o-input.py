@@ -11,6 +11,8 @@ import python_helper_sympy as phs
 import sympy
 from typing_extensions import assert_never
 
+PARSED_ELEMENT = True
+
 
 class BigOType(Enum):
     BIG_O = r"O"
@@ -43,8 +45,7 @@ PLACEHOLDER_DEFAULT = "asymptotic expression"
 BIG_O_INPUT_MUSTACHE_TEMPLATE_NAME = "pl-big-o-input.mustache"
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -84,8 +85,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
         data["correct_answers"][name] = a_true
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variable", VARIABLES_DEFAULT)
@@ -227,8 +227,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     assert_never(data["panel"])
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variable", VARIABLES_DEFAULT)
@@ -251,8 +250,7 @@ def parse(element_html: str, data: pl.QuestionData) -> None:
         data["submitted_answers"][name] = None
 
 
-def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variable", VARIABLES_DEFAULT)
@@ -266,16 +264,17 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
 
     big_o_type = pl.get_enum_attrib(element, "type", BigOType, BIG_O_TYPE_DEFAULT)
 
-    pl.grade_answer_parameterized(
-        data,
-        name,
-        lambda a_sub: GRADE_FUNCTION_DICT[big_o_type](a_tru, a_sub, variables),
-        weight=weight,
-    )
+    def grade_function(a_sub: str) -> tuple[float, Optional[str]]:
+        try:
+            return GRADE_FUNCTION_DICT[big_o_type](a_tru, a_sub, variables)
+        except phs.HasTimeoutError:
+            data["format_errors"][name] = phs.COMPARISON_TIMEOUT_MESSAGE
+            return 0.0, None
+
+    pl.grade_answer_parameterized(data, name, grade_function, weight=weight)
 
 
-def test(element_html: str, data: pl.ElementTestData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element: lxml.html.HtmlElement, data: pl.ElementTestData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
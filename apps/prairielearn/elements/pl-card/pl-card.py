@@ -4,6 +4,8 @@ import chevron
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 HEADER_DEFAULT = ""
 TITLE_DEFAULT = ""
 SUBTITLE_DEFAULT = ""
@@ -15,8 +17,7 @@ IMG_BOTTOM_ALT_DEFAULT = ""
 WIDTH_DEFAULT = "auto"
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = []
     optional_attribs = [
         "header",
@@ -32,9 +33,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     pl.check_attribs(element, required_attribs, optional_attribs)
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
-
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     header = pl.get_string_attrib(element, "header", HEADER_DEFAULT)
     title = pl.get_string_attrib(element, "title", TITLE_DEFAULT)
     subtitle = pl.get_string_attrib(element, "subtitle", SUBTITLE_DEFAULT)
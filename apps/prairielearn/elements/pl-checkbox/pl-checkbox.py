@@ -2,9 +2,10 @@ import math
 import random
 
 import chevron
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 FIXED_ORDER_DEFAULT = False
 INLINE_DEFAULT = False
@@ -21,9 +22,7 @@ MIN_SELECT_DEFAULT = 1
 FEEDBACK_DEFAULT = None
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
-
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -172,8 +171,7 @@ def prepare(element_html, data):
     data["correct_answers"][name] = correct_answer_list
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     partial_credit = pl.get_boolean_attrib(
         element, "partial-credit", PARTIAL_CREDIT_DEFAULT
@@ -476,8 +474,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     submitted_key = data["submitted_answers"].get(name, None)
@@ -520,8 +517,7 @@ def parse(element_html, data):
         return
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     partial_credit = pl.get_boolean_attrib(
@@ -575,8 +571,7 @@ def grade(element_html, data):
     }
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     partial_credit = pl.get_boolean_attrib(
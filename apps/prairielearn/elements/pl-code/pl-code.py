@@ -15,6 +15,8 @@ from pygments.styles import STYLE_MAP, get_style_by_name
 from pygments.token import Token
 from pygments_ansi_color import color_tokens
 
+PARSED_ELEMENT = True
+
 LANGUAGE_DEFAULT = None
 STYLE_DEFAULT = "friendly"
 NO_HIGHLIGHT_DEFAULT = False
@@ -107,8 +109,7 @@ def get_lexer_by_name(name: str) -> Optional[pygments.lexer.Lexer]:
             return None
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = []
     optional_attribs = [
         "language",
@@ -158,8 +159,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
             )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     language = pl.get_string_attrib(element, "language", LANGUAGE_DEFAULT)
     style = pl.get_string_attrib(element, "style", STYLE_DEFAULT)
     source_file_name = pl.get_string_attrib(
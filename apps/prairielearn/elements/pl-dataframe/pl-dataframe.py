@@ -8,6 +8,8 @@ import pandas as pd
 import prairielearn as pl
 from typing_extensions import assert_never
 
+PARSED_ELEMENT = True
+
 
 class DisplayLanguage(Enum):
     PYTHON = 1
@@ -60,8 +62,7 @@ def using_default_index(df: pd.DataFrame) -> bool:
     return df.index.is_integer() and pd.Index(range(len(df))).equals(df.index)
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     pl.check_attribs(
         element,
         required_attribs=["params-name"],
@@ -79,9 +80,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
-
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     varname = pl.get_string_attrib(element, "params-name")
     show_index = pl.get_boolean_attrib(element, "show-index", SHOW_INDEX_DEFAULT)
     show_header = pl.get_boolean_attrib(element, "show-header", SHOW_HEADER_DEFAULT)
@@ -9,6 +9,8 @@ import lxml.etree
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 
 def union_drawing_items(e1, e2):
     # Union two sets of drawing items, prioritizing e2 in cases of duplicates.
@@ -63,8 +65,7 @@ def check_attributes_rec(element):
         check_attributes_rec(child)
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     check_attributes_rec(element)
 
     w_button = None
@@ -248,8 +249,7 @@ def render_drawing_items(elem, curid=0, defaults={}):
     return (objects, curid)
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name", "")
     preview_mode = not pl.get_boolean_attrib(
         element, "gradable", defaults.element_defaults["gradable"]
@@ -373,8 +373,7 @@ def render(element_html, data):
     return chevron.render(template, html_params).strip()
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(
         element, "answers-name", defaults.element_defaults["answers-name"]
     )
@@ -398,8 +397,7 @@ def parse(element_html, data):
         data["submitted_answers"][name] = None
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     prev = not pl.get_boolean_attrib(
         element, "gradable", defaults.element_defaults["gradable"]
     )
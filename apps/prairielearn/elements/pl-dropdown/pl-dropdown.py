@@ -2,9 +2,10 @@ import random
 from enum import Enum
 
 import chevron
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 BLANK_ANSWER = " "
 BLANK_DEFAULT = True
@@ -48,8 +49,7 @@ def get_solution(element, data):
     return solution[0]
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     pl.check_attribs(
         element,
         required_attribs=["answers-name"],
@@ -67,8 +67,7 @@ def prepare(element_html, data):
         )
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     answers_name = pl.get_string_attrib(element, "answers-name")
     dropdown_options = get_options(element, data)
     submitted_answer = data["submitted_answers"].get(answers_name, None)
@@ -134,8 +133,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     answers_name = pl.get_string_attrib(element, "answers-name")
     answer = data["submitted_answers"].get(answers_name, None)
 
@@ -158,8 +156,7 @@ def parse(element_html, data):
         data["format_errors"][answers_name] = "Invalid option submitted."
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     answers_name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     submitted_answer = data["submitted_answers"].get(answers_name, None)
@@ -170,8 +167,7 @@ def grade(element_html, data):
         data["partial_scores"][answers_name] = {"score": 0, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     answers_name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -1,9 +1,10 @@
 import ansi2html.style as ansi2html_style
 import chevron
-import lxml.html
 import prairielearn as pl
 from ansi2html import Ansi2HTMLConverter
 
+PARSED_ELEMENT = True
+
 # No built-in support for custom schemes, so we'll monkey-patch our own colors
 # into the module. Colors borrowed from the "Dark Background" color preset in
 # iTerm2; blue tweaked a bit for better legibility on black.
@@ -39,8 +40,7 @@ def ansi_to_html(output):
         return f"[Error converting ANSI to HTML: {e}]\n\n{output}"
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = []
     optional_attribs = []
     pl.check_attribs(element, required_attribs, optional_attribs)
@@ -50,7 +50,7 @@ def round_value(val, digits=2):
     return format(val, f".{digits}f").rstrip("0").rstrip(".")
 
 
-def render(element_html, data):
+def render(element, data):
     if data["panel"] == "submission":
         html_params = {"submission": True, "graded": True, "uuid": pl.get_uuid()}
 
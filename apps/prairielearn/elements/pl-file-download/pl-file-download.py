@@ -5,6 +5,8 @@ import lxml.html
 import prairielearn as pl
 from typing_extensions import assert_never
 
+PARSED_ELEMENT = True
+
 
 class FileType(Enum):
     STATIC = 1
@@ -26,8 +28,7 @@ DIRECTORY_PATH_DICT = {
 }
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     pl.check_attribs(
         element,
         required_attribs=["file-name"],
@@ -58,9 +59,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
             )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
-
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     # Get file name or raise exception if one does not exist
     file_name = pl.get_string_attrib(element, "file-name")
 
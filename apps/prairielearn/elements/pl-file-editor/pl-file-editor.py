@@ -3,10 +3,11 @@ import hashlib
 import os
 
 import chevron
-import lxml.html
 import prairielearn as pl
 from text_unidecode import unidecode
 
+PARSED_ELEMENT = True
+
 EDITOR_CONFIG_FUNCTION_DEFAULT = None
 ACE_MODE_DEFAULT = None
 ACE_THEME_DEFAULT = None
@@ -33,8 +34,7 @@ def add_format_error(data, error_string):
     data["format_errors"]["_files"].append(error_string)
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["file-name"]
     optional_attribs = [
         "ace-mode",
@@ -69,11 +69,10 @@ def prepare(element_html, data):
             )
 
 
-def render(element_html, data):
+def render(element, data):
     if data["panel"] != "question":
         return ""
 
-    element = lxml.html.fragment_fromstring(element_html)
     file_name = pl.get_string_attrib(element, "file-name", "")
     answer_name = get_answer_name(file_name)
     editor_config_function = pl.get_string_attrib(
@@ -160,8 +159,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     file_name = pl.get_string_attrib(element, "file-name", "")
     answer_name = get_answer_name(file_name)
     normalize_to_ascii = pl.get_boolean_attrib(
@@ -7,6 +7,8 @@ import chevron
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 
 def get_file_names_as_array(raw_file_names: str) -> list[str]:
     reader = csv.reader(
@@ -34,8 +36,7 @@ def add_format_error(data: pl.QuestionData, error_string: str) -> None:
     data["format_errors"]["_files"].append(error_string)
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = ["file-names"]
     optional_attribs = []
     pl.check_attribs(element, required_attribs, optional_attribs)
@@ -46,11 +47,10 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     data["params"]["_required_file_names"].extend(file_names)
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     if data["panel"] != "question":
         return ""
 
-    element = lxml.html.fragment_fromstring(element_html)
     uuid = pl.get_uuid()
 
     raw_file_names = pl.get_string_attrib(element, "file-names", "")
@@ -83,8 +83,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         return chevron.render(f, html_params).strip()
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     raw_file_names = pl.get_string_attrib(element, "file-names", "")
     required_file_names = get_file_names_as_array(raw_file_names)
     answer_name = get_answer_name(raw_file_names)
@@ -6,14 +6,15 @@ import lxml.etree
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 # Based on the original hidden-hint element by Jason Xia
 
 PRIORITY_DEFAULT = -1
 HINT_NAME_DEFAULT = None
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     pl.check_attribs(element, [], [])
 
     # Parse hints from frontend
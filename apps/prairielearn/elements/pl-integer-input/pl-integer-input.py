@@ -3,10 +3,11 @@ import random
 from html import escape
 
 import chevron
-import lxml.html
 import numpy
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 CORRECT_ANSWER_DEFAULT = None
 LABEL_DEFAULT = None
@@ -20,8 +21,7 @@ BLANK_VALUE_DEFAULT = 0
 BASE_DEFAULT = 10
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -68,8 +68,7 @@ def prepare(element_html, data):
             )
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
     suffix = pl.get_string_attrib(element, "suffix", SUFFIX_DEFAULT)
@@ -224,8 +223,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     base = pl.get_integer_attrib(element, "base", BASE_DEFAULT)
 
@@ -278,8 +276,7 @@ def parse(element_html, data):
         data["submitted_answers"][name] = None
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     base = pl.get_integer_attrib(element, "base", BASE_DEFAULT)
 
@@ -311,8 +308,7 @@ def grade(element_html, data):
         data["partial_scores"][name] = {"score": 0, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     base = pl.get_integer_attrib(element, "base", BASE_DEFAULT)
@@ -2,9 +2,10 @@ import math
 import random
 
 import chevron
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 FIXED_STATEMENTS_ORDER_DEFAULT = False
 FIXED_OPTIONS_ORDER_DEFAULT = False
@@ -111,9 +112,7 @@ def categorize_matches(element, data):
     return list(options.values()), statements
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
-
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -240,8 +239,7 @@ def prepare(element_html, data):
     data["correct_answers"][name] = correct_matches
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     display_statements, display_options = data["params"].get(name)
     submitted_answers = data["submitted_answers"]
@@ -270,8 +268,7 @@ def parse(element_html, data):
                 ] = "The submitted answer is invalid."
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     display_statements, display_options = data["params"].get(name, ([], []))
     submitted_answers = data["submitted_answers"]
@@ -447,8 +444,7 @@ def render(element_html, data):
     return html
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     partial_credit = pl.get_boolean_attrib(
@@ -478,8 +474,7 @@ def grade(element_html, data):
     data["partial_scores"][name] = {"score": score, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -3,10 +3,11 @@ import random
 from html import escape
 
 import chevron
-import lxml.html
 import numpy as np
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 LABEL_DEFAULT = None
 COMPARISON_DEFAULT = "relabs"
@@ -19,8 +20,7 @@ ALLOW_BLANK_DEFAULT = False
 BLANK_VALUE_DEFAULT = 0
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -62,8 +62,7 @@ def prepare(element_html, data):
             )
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     # get the name of the element, in this case, the name of the array
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
@@ -324,8 +323,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     allow_fractions = pl.get_boolean_attrib(
         element, "allow-fractions", ALLOW_FRACTIONS_DEFAULT
@@ -379,8 +377,7 @@ def parse(element_html, data):
         data["submitted_answers"][name] = pl.to_json(A)
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     allow_partial_credit = pl.get_boolean_attrib(
         element, "allow-partial-credit", ALLOW_PARTIAL_CREDIT_DEFAULT
@@ -414,33 +411,35 @@ def grade(element_html, data):
     else:
         m, n = np.shape(a_tru)
 
-    number_of_correct = 0
-    feedback = {}
+    # Get submitted answer for every entry (if any does not exist, score is zero)
+    a_sub = []
     for i in range(m):
+        row = []
         for j in range(n):
             each_entry_name = name + str(n * i + j + 1)
-            a_sub = data["submitted_answers"].get(each_entry_name, None)
-            # Get submitted answer (if it does not exist, score is zero)
-            if a_sub is None:
+            entry = data["submitted_answers"].get(each_entry_name, None)
+            if entry is None:
                 data["partial_scores"][name] = {"score": 0, "weight": weight}
                 return
             # If submitted answer is in a format generated by pl.to_json, convert it
             # back to a standard type (otherwise, do nothing)
-            a_sub = pl.from_json(a_sub)
+            row.append(pl.from_json(entry))
+        a_sub.append(row)
+    a_sub = np.array(a_sub)
 
-            # Compare submitted answer with true answer
-            if comparison == "relabs":
-                correct = pl.is_correct_scalar_ra(a_sub, a_tru[i, j], rtol, atol)
-            elif comparison == "sigfig":
-                correct = pl.is_correct_scalar_sf(a_sub, a_tru[i, j], digits)
-            elif comparison == "decdig":
-                correct = pl.is_correct_scalar_dd(a_sub, a_tru[i, j], digits)
+    # Compare submitted answer with true answer, entry by entry
+    if comparison == "relabs":
+        correct = pl.get_correct_mask_ndarray2D_ra(a_sub, a_tru, rtol, atol)
+    elif comparison == "sigfig":
+        correct = pl.get_correct_mask_ndarray2D_sf(a_sub, a_tru, digits)
+    elif comparison == "decdig":
+        correct = pl.get_correct_mask_ndarray2D_dd(a_sub, a_tru, digits)
 
-            if correct:
-                number_of_correct += 1
-                feedback.update({each_entry_name: "correct"})
-            else:
-                feedback.update({each_entry_name: "incorrect"})
+    number_of_correct = int(np.count_nonzero(correct))
+    feedback = {
+        name + str(n * i + j + 1): "correct" if correct[i, j] else "incorrect"
+        for i, j in np.ndindex(m, n)
+    }
 
     if number_of_correct == m * n:
         data["partial_scores"][name] = {"score": 1, "weight": weight}
@@ -456,8 +455,7 @@ def grade(element_html, data):
         }
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     allow_partial_credit = pl.get_boolean_attrib(
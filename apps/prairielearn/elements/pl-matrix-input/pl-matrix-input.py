@@ -2,10 +2,11 @@ import math
 import random
 
 import chevron
-import lxml.html
 import numpy as np
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 LABEL_DEFAULT = None
 COMPARISON_DEFAULT = "relabs"
@@ -16,8 +17,7 @@ ALLOW_COMPLEX_DEFAULT = False
 SHOW_HELP_TEXT_DEFAULT = True
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -34,8 +34,7 @@ def prepare(element_html, data):
     pl.check_answers_names(data, name)
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
 
@@ -267,10 +266,9 @@ def get_format_string(message):
         return chevron.render(f, params).strip()
 
 
-def parse(element_html, data):
+def parse(element, data):
     # By convention, this function returns at the first error found
 
-    element = lxml.html.fragment_fromstring(element_html)
     name = pl.get_string_attrib(element, "answers-name")
     allow_complex = pl.get_boolean_attrib(
         element, "allow-complex", ALLOW_COMPLEX_DEFAULT
@@ -299,8 +297,7 @@ def parse(element_html, data):
     data["submitted_answers"]["_pl_matrix_input_format"][name] = info["format_type"]
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     # Get weight
@@ -356,8 +353,7 @@ def grade(element_html, data):
         data["partial_scores"][name] = {"score": 0, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -1,18 +1,17 @@
 import chevron
-import lxml.html
 import numpy as np
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 DIGITS_DEFAULT = 2
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     pl.check_attribs(element, required_attribs=[], optional_attribs=["digits"])
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     digits = pl.get_integer_attrib(element, "digits", DIGITS_DEFAULT)
 
     matlab_data = ""
@@ -4,9 +4,10 @@ import pathlib
 import random
 
 import chevron
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 SCORE_INCORRECT_DEFAULT = 0.0
 SCORE_CORRECT_DEFAULT = 1.0
 WEIGHT_DEFAULT = 1
@@ -107,8 +108,7 @@ def get_nota_aota_attrib(element, name, default):
     return string_value
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -311,8 +311,7 @@ def prepare(element_html, data):
     data["correct_answers"][name] = correct_answer
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     answers = data["params"].get(name, [])
@@ -436,8 +435,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     submitted_key = data["submitted_answers"].get(name, None)
@@ -454,8 +452,7 @@ def parse(element_html, data):
         return
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -481,8 +478,7 @@ def grade(element_html, data):
     }
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
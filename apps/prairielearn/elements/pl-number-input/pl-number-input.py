@@ -3,10 +3,11 @@ import random
 from html import escape
 
 import chevron
-import lxml.html
 import numpy as np
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 RTOL_DEFAULT = 1e-2
 ATOL_DEFAULT = 1e-8
 SIZE_DEFAULT = 35
@@ -24,8 +25,7 @@ BLANK_VALUE_DEFAULT = 0
 CUSTOM_FORMAT_DEFAULT = ".12g"
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -90,8 +90,7 @@ def format_true_ans(element, data, name):
     return a_tru
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", None)
     suffix = pl.get_string_attrib(element, "suffix", None)
@@ -337,8 +336,7 @@ def get_format_string(is_complex=False, allow_fractions=False, message=None):
         return chevron.render(f, params).strip()
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     allow_complex = pl.get_boolean_attrib(
         element, "allow-complex", ALLOW_COMPLEX_DEFAULT
@@ -363,8 +361,7 @@ def parse(element_html, data):
         data["submitted_answers"][name] = None
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     # Get weight
@@ -433,8 +430,7 @@ def grade(element_html, data):
         data["partial_scores"][name] = {"score": 0, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -1,10 +1,39 @@
-import itertools
 from collections import Counter
 from copy import deepcopy
-from typing import Iterable, Mapping, Optional
+from functools import lru_cache
+from typing import Mapping, Optional, Sequence, TypedDict
 
 import networkx as nx
 
+# The number of steps that `min_deletions` may take with groups, which takes under a second. A step is a
+# state of the dynamic program in `max_group_runs` or of the branch and bound search, and finding a set
+# without inversions in the search takes one step per position.
+SEARCH_BUDGET = 200_000
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised when `min_deletions` runs out of steps."""
+
+
+class SearchBudget:
+    def __init__(self, steps: int) -> None:
+        self.steps = steps
+
+    def spend(self, steps: int = 1) -> None:
+        self.steps -= steps
+        if self.steps < 0:
+            raise SearchBudgetExceeded
+
+
+class CompiledDag(TypedDict):
+    """A problem in the form used for grading, which can be stored in the question's params."""
+
+    tags: list[str]  # the blocks, in topological order
+    groups: list[Optional[str]]  # the group of each block
+    ancestors: list[
+        str
+    ]  # hex bitsets of the positions of the blocks that must come before each block
+
 
 def validate_grouping(
     graph: nx.DiGraph, group_belonging: Mapping[str, Optional[str]]
@@ -55,17 +84,21 @@ def solve_dag(
     return sort
 
 
-def check_topological_sorting(submission: list[str], graph: nx.DiGraph) -> int:
+def check_topological_sorting(
+    submission: list[str], index: Mapping[str, int], ancestors: Sequence[int]
+) -> int:
     """
     :param submission: candidate for topological sorting
-    :param graph: graph to check topological sorting over
+    :param index: the position of each block in the topological order
+    :param ancestors: bitsets of the positions of the blocks that must come before each block
     :return: index of first element not topologically sorted, or length of list if sorted
     """
-    seen = set()
+    seen = 0
     for i, node in enumerate(submission):
-        if node is None or not all(u in seen for (u, _) in graph.in_edges(node)):
+        position = index.get(node)
+        if position is None or ancestors[position] & ~seen:
             return i
-        seen.add(node)
+        seen |= 1 << position
     return len(submission)
 
 
@@ -149,6 +182,94 @@ def add_edges_for_groups(
         graph.remove_node(group_tag)
 
 
+def compile_dag(
+    depends_graph: Mapping[str, list[str]], group_belonging: Mapping[str, Optional[str]]
+) -> CompiledDag:
+    """Validate the given problem and convert it into the form used for grading, without NetworkX.
+    This only needs to be done once per question variant, and the result is JSON serializable.
+    :param depends_graph: The dependency graph between blocks specified in the question
+    :param group_belonging: which pl-block-group each block belongs to, specified in the question
+    :return: the blocks in topological order, the group of each block, and the blocks that must come
+    before each block, with the dependencies of and on each pl-block-group moved to its blocks
+    """
+    nodes: dict[str, None] = {}
+    for node, dependencies in depends_graph.items():
+        nodes[node] = None
+        nodes.update(dict.fromkeys(dependencies))
+        if not all(
+            group_belonging.get(dependency) == group_belonging.get(node)
+            for dependency in dependencies
+        ):
+            raise Exception(
+                "Blocks within in a `pl-block-group` are not allowed to depend on blocks outside their group."
+            )
+
+    groups: dict[str, list[str]] = {}
+    for tag, group_tag in group_belonging.items():
+        if group_tag is not None:
+            groups.setdefault(group_tag, []).append(tag)
+            nodes[tag] = None
+
+    # if a group G depends on a node N, all blocks in the group G should depend on Node N, and
+    # if a node N depends on a group G, node N should depend on all blocks in G
+    def expand(dependencies: list[str]) -> set[str]:
+        return {
+            tag
+            for dependency in dependencies
+            for tag in groups.get(dependency, [dependency])
+        }
+
+    blocks = [node for node in nodes if node not in groups]
+    parents: dict[str, set[str]] = {}
+    for block in blocks:
+        parents[block] = expand(depends_graph.get(block, []))
+        group_tag = group_belonging.get(block)
+        if group_tag is not None:
+            parents[block] |= expand(depends_graph.get(group_tag, []))
+
+    children: dict[str, list[str]] = {block: [] for block in blocks}
+    num_parents = {block: len(parents[block]) for block in blocks}
+    for block in blocks:
+        for parent in parents[block]:
+            children[parent].append(block)
+
+    order = [block for block in blocks if num_parents[block] == 0]
+    for block in order:
+        for child in children[block]:
+            num_parents[child] -= 1
+            if num_parents[child] == 0:
+                order.append(child)
+
+    if len(order) != len(blocks):
+        raise Exception(
+            "Dependency between blocks does not form a Directed Acyclic Graph; Problem unsolvable."
+        )
+
+    index = {tag: position for position, tag in enumerate(order)}
+    ancestors: list[int] = []
+    for block in order:
+        bits = 0
+        for parent in parents[block]:
+            bits |= ancestors[index[parent]] | 1 << index[parent]
+        ancestors.append(bits)
+
+    return {
+        "tags": order,
+        "groups": [group_belonging.get(block) for block in order],
+        "ancestors": [format(bits, "x") for bits in ancestors],
+    }
+
+
+def decode_dag(dag: CompiledDag) -> tuple[dict[str, int], list[int]]:
+    """
+    :param dag: the compiled problem
+    :return: tuple containing the position of each block in the topological order, and bitsets of the positions
+    of the blocks that must come before each block
+    """
+    index = {tag: position for position, tag in enumerate(dag["tags"])}
+    return index, [int(bits, 16) for bits in dag["ancestors"]]
+
+
 def grade_dag(
     submission: list[str],
     depends_graph: Mapping[str, list[str]],
@@ -163,20 +284,280 @@ def grade_dag(
     :return: tuple containing length of list that meets both correctness conditions, starting from the beginning,
     and the length of any correct solution
     """
-    graph = dag_to_nx(depends_graph, group_belonging)
+    return grade_compiled_dag(submission, compile_dag(depends_graph, group_belonging))
+
+
+def grade_compiled_dag(submission: list[str], dag: CompiledDag) -> tuple[int, int]:
+    """Same as `grade_dag`, for a problem converted with `compile_dag`."""
+    index, ancestors = decode_dag(dag)
 
-    top_sort_correctness = check_topological_sorting(submission, graph)
-    grouping_correctness = check_grouping(submission, group_belonging)
+    top_sort_correctness = check_topological_sorting(submission, index, ancestors)
+    grouping_correctness = check_grouping(
+        submission, dict(zip(dag["tags"], dag["groups"]))
+    )
 
-    return min(top_sort_correctness, grouping_correctness), graph.number_of_nodes()
+    return min(top_sort_correctness, grouping_correctness), len(dag["tags"])
 
 
-def is_vertex_cover(G: nx.DiGraph, vertex_cover: Iterable[str]) -> bool:
-    """this function from
-    https://docs.ocean.dwavesys.com/projects/dwave-networkx/en/latest/_modules/dwave_networkx/algorithms/cover.html#is_vertex_cover
+def max_antichain(
+    inversions: Sequence[Sequence[int]], deleted: frozenset[int]
+) -> tuple[int, list[int]]:
+    """Finds the largest set of positions that contains no inversion.
+    :param inversions: for each position i, the positions j > i that are out of order with i. This must be transitive.
+    :param deleted: positions to leave out
+    :return: tuple containing the size of a minimum set of positions that must be deleted to remove all inversions,
+    and the remaining positions in order
     """
-    cover = set(vertex_cover)
-    return all(u in cover or v in cover for u, v in G.edges)
+    # By Dilworth's theorem, the largest set without inversions has one position per chain in a minimum
+    # chain cover, whose size is the number of positions minus a maximum matching between the positions
+    # and the positions they are out of order with. Find the matching with augmenting paths.
+    positions = [i for i in range(len(inversions)) if i not in deleted]
+    match_right: dict[int, int] = {}
+
+    def augment(i: int, seen: set[int]) -> bool:
+        for j in inversions[i]:
+            if j in deleted or j in seen:
+                continue
+            seen.add(j)
+            if j not in match_right or augment(match_right[j], seen):
+                match_right[j] = i
+                return True
+        return False
+
+    for i in positions:
+        augment(i, set())
+
+    # Kőnig's theorem gives a minimum vertex cover from the positions reachable from unmatched positions
+    # by alternating paths. Positions that the cover leaves out on both sides of the matching form the
+    # largest set without inversions.
+    matched_left = set(match_right.values())
+    reachable_left = {i for i in positions if i not in matched_left}
+    reachable_right: set[int] = set()
+    stack = list(reachable_left)
+    while stack:
+        i = stack.pop()
+        for j in inversions[i]:
+            if j in deleted or j in reachable_right:
+                continue
+            reachable_right.add(j)
+            k = match_right[j]
+            if k not in reachable_left:
+                reachable_left.add(k)
+                stack.append(k)
+
+    kept = [i for i in positions if i in reachable_left and i not in reachable_right]
+    return len(match_right), kept
+
+
+def find_group_violation(
+    kept: Sequence[int], groups: Sequence[Optional[str]]
+) -> Optional[tuple[int, int, int]]:
+    """
+    :param kept: positions in order
+    :param groups: the group of the block at each position
+    :return: positions i < j < k such that i and k are in the same group but j isn't, or None if each group
+    is contiguous
+    """
+    last_seen: dict[str, int] = {}
+    for index, position in enumerate(kept):
+        group = groups[position]
+        if group is None:
+            continue
+        if group in last_seen and last_seen[group] != index - 1:
+            return kept[last_seen[group]], kept[last_seen[group] + 1], position
+        last_seen[group] = index
+    return None
+
+
+def max_group_runs(
+    before: Sequence[int],
+    groups: Sequence[Optional[str]],
+    runs: Mapping[int, Sequence[tuple[int, int]]],
+    deleted: frozenset[int],
+    budget: SearchBudget,
+) -> tuple[int, list[tuple[int, int]]]:
+    """Finds the largest number of grouped positions that can be kept with the blocks of each group
+    contiguous and the groups in an allowed order, leaving out the ungrouped positions. This is a dynamic
+    program over the positions that tracks the groups which can no longer be started, so its cost grows
+    exponentially with the number of groups, but not with the number of blocks.
+    :param before: for each position, a bitset of the positions that must come before it
+    :param groups: the group of the block at each position
+    :param runs: for each position, the last positions of the runs of its group that can start there,
+    and the number of positions each run can keep
+    :param deleted: positions to leave out
+    :param budget: spent once for each state of the dynamic program
+    :return: tuple containing the number of kept positions, and the first and last position of each run
+    """
+    group_index = {
+        group: index
+        for index, group in enumerate(dict.fromkeys(g for g in groups if g is not None))
+    }
+    grouped = [
+        position
+        for position, group in enumerate(groups)
+        if group is not None and position not in deleted
+    ]
+    next_index = {position: index + 1 for index, position in enumerate(grouped)}
+
+    # the groups that must come before each group, which can't be started after it
+    groups_before = [0] * len(group_index)
+    for position in grouped:
+        for other in grouped:
+            if before[position] >> other & 1 and groups[other] != groups[position]:
+                groups_before[group_index[groups[position]]] |= (
+                    1 << group_index[groups[other]]
+                )
+
+    # the groups with a position at each index or later
+    groups_after = [0] * (len(grouped) + 1)
+    for index in reversed(range(len(grouped))):
+        groups_after[index] = groups_after[index + 1] | (
+            1 << group_index[groups[grouped[index]]]
+        )
+
+    @lru_cache(maxsize=None)
+    def kept(index: int, blocked: int) -> tuple[int, tuple[tuple[int, int], ...]]:
+        if index == len(grouped):
+            return 0, ()
+        budget.spend()
+        blocked &= groups_after[index]
+        best = kept(index + 1, blocked)
+        position = grouped[index]
+        group = group_index[groups[position]]
+        if not blocked >> group & 1:
+            blocked |= groups_before[group] | 1 << group
+            for last, size in runs[position]:
+                if last in deleted:
+                    continue
+                rest_size, rest_runs = kept(next_index[last], blocked)
+                if size + rest_size > best[0]:
+                    best = size + rest_size, ((position, last), *rest_runs)
+        return best
+
+    size, found_runs = kept(0, 0)
+    return size, list(found_runs)
+
+
+def min_deletions(
+    before: Sequence[int],
+    groups: Sequence[Optional[str]],
+    budget: int = SEARCH_BUDGET,
+) -> int:
+    """Finds the minimum number of positions that must be deleted so that no inversion remains and each
+    group is contiguous. This is NP-hard with groups, but once the run of each group is fixed, only the
+    inversions are left. So a branch and bound search fixes the runs one group at a time, by deleting the
+    group's positions outside the run and the other positions inside it. Each search state is bounded by
+    the largest set of positions without inversions, and by the largest runs of the groups (see
+    `max_group_runs`) plus the largest set of ungrouped positions without inversions. If the largest
+    set without inversions also has contiguous groups, it is the best solution for the state.
+    The search can take exponential time in the number of groups, so it stops after `budget` steps. The
+    best solution found by then is used, which is never worse than the first one the search would reach:
+    following the largest set without inversions at each branch, which takes polynomial time. Deletions
+    can then be overcounted, which only ever lowers the partial credit.
+    :param before: for each position, a bitset of the positions that must come before it
+    :param groups: the group of the block at each position
+    :param budget: the number of steps to search for, see `SEARCH_BUDGET`
+    :return: the minimum number of deletions, or an upper bound if the search ran out of steps
+    """
+    # if a later position must come before an earlier one, the pair is an inversion
+    inversions = [
+        [j for j in range(i + 1, len(groups)) if before[i] >> j & 1]
+        for i in range(len(groups))
+    ]
+    members: dict[str, list[int]] = {}
+    for position, group in enumerate(groups):
+        if group is not None:
+            members.setdefault(group, []).append(position)
+    all_positions = frozenset(range(len(groups)))
+    grouped_positions = frozenset(
+        position for positions in members.values() for position in positions
+    )
+
+    # the number of positions that each run of a group can keep
+    runs: dict[int, list[tuple[int, int]]] = {}
+    for positions in members.values():
+        for first in range(len(positions)):
+            for last in range(first, len(positions)):
+                run = positions[first : last + 1]
+                cover_size, _ = max_antichain(inversions, all_positions.difference(run))
+                runs.setdefault(run[0], []).append((run[-1], len(run) - cover_size))
+
+    def fix_run(deleted: frozenset[int], first: int, last: int) -> frozenset[int]:
+        group = groups[first]
+        return deleted.union(
+            (position for position in members[group] if not first <= position <= last),
+            (
+                position
+                for position in range(first, last + 1)
+                if groups[position] != group
+            ),
+        )
+
+    steps = SearchBudget(budget)
+
+    def runs_bound(deleted: frozenset[int]) -> int:
+        runs_size, _ = max_group_runs(before, groups, runs, deleted, steps)
+        steps.spend(len(groups))
+        _, ungrouped_kept = max_antichain(inversions, deleted | grouped_positions)
+        return runs_size + len(ungrouped_kept)
+
+    _, kept = max_antichain(inversions, frozenset())
+    if find_group_violation(kept, groups) is None:
+        return len(groups) - len(kept)
+
+    def branches(
+        deleted: frozenset[int], group: str, budget: Optional[SearchBudget]
+    ) -> list[tuple[frozenset[int], list[int]]]:
+        # the run of the group, or deleting it, with the largest sets without inversions first
+        positions = [position for position in members[group] if position not in deleted]
+        children = [deleted.union(positions)] + [
+            fix_run(deleted, positions[first], positions[last])
+            for first in range(len(positions))
+            for last in range(first, len(positions))
+        ]
+        if budget is not None:
+            budget.spend(len(children) * len(groups))
+        results = [(child, max_antichain(inversions, child)[1]) for child in children]
+        results.sort(key=lambda result: len(result[1]), reverse=True)
+        return results
+
+    # the first solution that the search reaches, found without spending the budget
+    deleted, first_kept = frozenset(), kept
+    violation = find_group_violation(kept, groups)
+    while violation is not None:
+        deleted, first_kept = branches(deleted, groups[violation[0]], None)[0]
+        violation = find_group_violation(first_kept, groups)
+    best = len(first_kept)
+    searched: set[frozenset[int]] = set()
+
+    def search(deleted: frozenset[int], kept: list[int]) -> None:
+        nonlocal best
+        if len(kept) <= best or deleted in searched:
+            return
+        searched.add(deleted)
+        steps.spend()
+
+        violation = find_group_violation(kept, groups)
+        if violation is None:
+            best = len(kept)
+            return
+        if runs_bound(deleted) <= best:
+            return
+
+        for child, kept in branches(deleted, groups[violation[0]], steps):
+            search(child, kept)
+
+    try:
+        # start from the best runs of the groups, with the ungrouped positions around them
+        _, best_runs = max_group_runs(before, groups, runs, frozenset(), steps)
+        deleted = grouped_positions
+        for first, last in best_runs:
+            deleted = fix_run(deleted - set(members[groups[first]]), first, last)
+        best = max(best, len(max_antichain(inversions, deleted)[1]))
+        search(frozenset(), kept)
+    except SearchBudgetExceeded:
+        pass
+    return len(groups) - best
 
 
 def lcs_partial_credit(
@@ -189,12 +570,10 @@ def lcs_partial_credit(
     The naive solution would be to enumerate all topological sorts, then get the edit distance to each of them,
     but this would be too slow. Instead, our algorithm is as follows:
         1. Remove all distractors from the student solution
-        2. Construct the 'problematic subgraph'. We do this by finding the subset of nodes in the
-        graph that have some 'problematic' relation, meaning that there is a node before it in the
-        student solution that should be after it, or one after it that must be before, or nodes that
-        belong to the same pl-block-group are not contiguous with one another.
-        3. Find the minimum set of nodes to delete from the submission which will solve all problematic
-        relationships found in step 2.
+        2. Find the 'inversions' in the student solution, meaning pairs of blocks where the block that
+        occurs later must be before the other in any correct solution.
+        3. Find the minimum set of blocks to delete from the submission which will remove all inversions
+        and leave the blocks of each pl-block-group contiguous (see `min_deletions`).
         4. Once we know the minimum required deletions, you may simply add nodes to the student
         solution until it is the correct solution, so you can directly calculate the edit distance.
     For more details, see the paper: https://arxiv.org/abs/2204.04196
@@ -203,66 +582,29 @@ def lcs_partial_credit(
     :param group_belonging: which pl-block-group each block belongs to, specified in the question
     :return: edit distance from the student submission to some correct solution
     """
-    graph = dag_to_nx(depends_graph, group_belonging)
-    trans_clos = nx.transitive_closure(graph)
-    submission_no_distractors = [node for node in submission if node in depends_graph]
-
-    # if node1 must occur before node2 in any correct solution, but node2 occurs before
-    # node1 in the submission, add them both and an edge between them to the problematic subgraph
-    seen = set()
-    problematic_subgraph = nx.DiGraph()
-    for node1 in submission_no_distractors:
-        for node2 in seen:
-            if trans_clos.has_edge(node1, node2):
-                problematic_subgraph.add_edge(node1, node2)
-        seen.add(node1)
-
-    # if two nodes are in the same `pl-block-group`, but don't occur next to one another in the
-    # submission, add them and all nodes in between to the problematic subgraph
-    for i in range(len(submission_no_distractors)):
-        for j in range(i + 2, len(submission_no_distractors)):
-            node1, node2 = submission_no_distractors[i], submission_no_distractors[j]
-            if group_belonging.get(node1) is None or group_belonging.get(
-                node1
-            ) != group_belonging.get(node2):
-                continue
-            if not all(
-                [
-                    group_belonging[x] == group_belonging[node1]
-                    for x in submission_no_distractors[i : j + 1]
-                ]
-            ):
-                problematic_subgraph.add_nodes_from(
-                    submission_no_distractors[i : j + 1]
-                )
-
-    if problematic_subgraph.number_of_nodes() == 0:
-        mvc_size = 0
-    else:
-        mvc_size = problematic_subgraph.number_of_nodes() - 1
-        for i in range(1, problematic_subgraph.number_of_nodes() - 1):
-            for subset in itertools.combinations(problematic_subgraph, i):
-                # make sure deleting subset will resolve blocks out of order
-                if not is_vertex_cover(problematic_subgraph, subset):
-                    continue
+    return lcs_partial_credit_compiled(
+        submission, compile_dag(depends_graph, group_belonging)
+    )
+
+
+def lcs_partial_credit_compiled(submission: list[str], dag: CompiledDag) -> int:
+    """Same as `lcs_partial_credit`, for a problem converted with `compile_dag`."""
+    index, ancestors = decode_dag(dag)
+    positions = [index[node] for node in submission if node in index]
+
+    # the positions in the submission of the blocks that must occur before each block
+    before = [
+        sum(
+            1 << j
+            for j, other in enumerate(positions)
+            if ancestors[position] >> other & 1
+        )
+        for position in positions
+    ]
+    groups = [dag["groups"][position] for position in positions]
+    mvc_size = min_deletions(before, groups)
 
-                # make sure deleting subset will resolve a separated pl-block-group
-                edited_submission = [
-                    x for x in submission_no_distractors if x not in subset
-                ]
-                edited_group_belonging = {
-                    key: group_belonging.get(key) for key in edited_submission
-                }
-                if len(edited_submission) == check_grouping(
-                    edited_submission, edited_group_belonging
-                ):
-                    mvc_size = len(subset)
-                    break
-
-            if mvc_size < problematic_subgraph.number_of_nodes() - 1:
-                break
-
-    num_distractors = len(submission) - len(submission_no_distractors)
+    num_distractors = len(submission) - len(positions)
     deletions_needed = num_distractors + mvc_size
-    insertions_needed = graph.number_of_nodes() - (len(submission) - deletions_needed)
+    insertions_needed = len(dag["tags"]) - (len(submission) - deletions_needed)
     return deletions_needed + insertions_needed
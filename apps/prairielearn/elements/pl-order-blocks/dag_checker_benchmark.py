@@ -0,0 +1,148 @@
+# Micro-benchmark for grading over random problems and submissions with up to
+# 100 blocks. Each problem has a random dependency graph, and some of its blocks
+# are in `pl-block-group`s. Submissions are correct solutions with some blocks
+# left out, swapped or shuffled, plus a few distractors. Problems made only of
+# independent groups of 5 blocks, with shuffled submissions, are timed
+# separately, because keeping the groups contiguous is the hard part of partial
+# credit. From around 60 blocks, these use up the search budget of
+# `min_deletions()`, which bounds their grading time. `compile_dag()` runs once per variant, and `grade_compiled_dag()` with
+# `lcs_partial_credit_compiled()` once per submission. Run it with:
+#
+#     python dag_checker_benchmark.py [--repeat N] [--submissions N]
+
+import argparse
+import random
+import timeit
+from typing import Optional
+
+from dag_checker import (
+    compile_dag,
+    grade_compiled_dag,
+    lcs_partial_credit_compiled,
+    solve_dag,
+)
+
+SIZES = (10, 25, 50, 100)
+GROUP_SIZES = (25, 50, 75, 100)
+
+
+def random_problem(
+    rng: random.Random, num_blocks: int
+) -> tuple[dict[str, list[str]], dict[str, Optional[str]]]:
+    depends_graph: dict[str, list[str]] = {}
+    group_belonging: dict[str, Optional[str]] = {}
+    units: list[str] = []
+    block = 0
+    while block < num_blocks:
+        # Any earlier block or group can be a dependency
+        dependencies = [unit for unit in units[-10:] if rng.random() < 0.2]
+        if rng.random() < 0.1:
+            group = f"group{len(units)}"
+            depends_graph[group] = dependencies
+            members: list[str] = []
+            for _ in range(min(rng.randint(2, 6), num_blocks - block)):
+                tag = f"block{block}"
+                depends_graph[tag] = [m for m in members if rng.random() < 0.5]
+                group_belonging[tag] = group
+                members.append(tag)
+                block += 1
+            units.append(group)
+        else:
+            tag = f"block{block}"
+            depends_graph[tag] = dependencies
+            group_belonging[tag] = None
+            units.append(tag)
+            block += 1
+    return depends_graph, group_belonging
+
+
+def random_group_problem(
+    rng: random.Random, num_blocks: int
+) -> tuple[dict[str, list[str]], dict[str, Optional[str]]]:
+    depends_graph: dict[str, list[str]] = {}
+    group_belonging: dict[str, Optional[str]] = {}
+    for block in range(num_blocks):
+        group = f"group{block // 5}"
+        depends_graph.setdefault(group, [])
+        tag = f"block{block}"
+        depends_graph[tag] = [
+            member
+            for member in depends_graph
+            if group_belonging.get(member) == group and rng.random() < 0.5
+        ]
+        group_belonging[tag] = group
+    return depends_graph, group_belonging
+
+
+def random_submission(
+    rng: random.Random,
+    depends_graph: dict[str, list[str]],
+    group_belonging: dict[str, Optional[str]],
+) -> list[str]:
+    submission = [
+        tag for tag in solve_dag(depends_graph, group_belonging) if rng.random() < 0.9
+    ]
+    if rng.random() < 0.2:
+        rng.shuffle(submission)
+    for _ in range(rng.randint(0, len(submission) // 5)):
+        i = rng.randrange(len(submission))
+        j = min(len(submission) - 1, i + rng.randint(1, 5))
+        submission[i], submission[j] = submission[j], submission[i]
+    for i in range(rng.randint(0, 3)):
+        submission.insert(rng.randint(0, len(submission)), f"distractor{i}")
+    return submission
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--submissions", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cases = [("", num_blocks, random_problem) for num_blocks in SIZES] + [
+        (" in groups", num_blocks, random_group_problem) for num_blocks in GROUP_SIZES
+    ]
+    for label, num_blocks, make_problem in cases:
+        compile_timings = []
+        grade_timings = []
+        for _ in range(args.submissions):
+            depends_graph, group_belonging = make_problem(rng, num_blocks)
+            if make_problem is random_group_problem:
+                submission = list(group_belonging)
+                rng.shuffle(submission)
+            else:
+                submission = random_submission(rng, depends_graph, group_belonging)
+            dag = compile_dag(depends_graph, group_belonging)
+            compile_timings.append(
+                min(
+                    timeit.repeat(
+                        lambda: compile_dag(depends_graph, group_belonging),
+                        number=1,
+                        repeat=args.repeat,
+                    )
+                )
+            )
+            grade_timings.append(
+                min(
+                    timeit.repeat(
+                        lambda: (
+                            grade_compiled_dag(submission, dag),
+                            lcs_partial_credit_compiled(submission, dag),
+                        ),
+                        number=1,
+                        repeat=args.repeat,
+                    )
+                )
+            )
+        for name, timings in [("compile", compile_timings), ("grade", grade_timings)]:
+            timings.sort()
+            print(
+                f"{num_blocks:3d} blocks{label:10s} {name:7s}:"
+                f" median {timings[len(timings) // 2] * 1000:8.3f} ms"
+                f" max {timings[-1] * 1000:8.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
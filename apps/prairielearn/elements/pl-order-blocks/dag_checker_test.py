@@ -1,5 +1,16 @@
+import json
+
 import pytest
-from dag_checker import dag_to_nx, grade_dag, lcs_partial_credit, solve_dag
+from dag_checker import (
+    compile_dag,
+    dag_to_nx,
+    grade_compiled_dag,
+    grade_dag,
+    lcs_partial_credit,
+    lcs_partial_credit_compiled,
+    min_deletions,
+    solve_dag,
+)
 
 problem_1_dag = {
     "1": [],
@@ -150,6 +161,27 @@ def test_problem_validation():
     dag_to_nx(problem_3_dag, problem_3_groups)
 
 
+def test_compile_dag():
+    for depends_graph, group_belonging in [
+        (problem_3_invalid_dag_1, problem_3_groups),
+        (problem_3_invalid_dag_2, problem_3_groups),
+        (problem_3_invalid_dag_3, problem_3_groups),
+        ({"1": ["2"], "2": ["1"]}, {}),
+    ]:
+        with pytest.raises(Exception):
+            compile_dag(depends_graph, group_belonging)
+
+    # The groups are replaced by their blocks, and the result survives being stored in the params
+    dag = json.loads(json.dumps(compile_dag(problem_2_dag, problem_2_groups)))
+    assert sorted(dag["tags"]) == [str(i) for i in range(1, 8)]
+    assert dag["tags"][-1] == "7"
+    for submission, expected, expected_ed in zip(
+        problem_2_submissions, problem_2_expected, problem_2_expected_ed_groups
+    ):
+        assert grade_compiled_dag(submission, dag) == (expected, 7)
+        assert lcs_partial_credit_compiled(submission, dag) == expected_ed
+
+
 def test_solve_dag():
     problems = [
         (problem_1_dag, problem_1_groups),
@@ -159,3 +191,40 @@ def test_solve_dag():
     for depends_graph, group_belonging in problems:
         solution = solve_dag(depends_graph, group_belonging)
         assert len(solution) == grade_dag(solution, depends_graph, group_belonging)[0]
+
+
+def test_lcs_partial_credit_large():
+    # A chain of blocks submitted in reverse keeps only one of them
+    chain = {str(i): [str(i - 1)] if i else [] for i in range(30)}
+    submission = [str(i) for i in reversed(range(30))]
+    assert lcs_partial_credit(submission, chain, {}) == 2 * 29
+
+    # Two interleaved groups keep a prefix of one and a suffix of the other
+    groups = {f"{group}{i}": group for group in "ab" for i in range(10)}
+    depends_graph = {"a": [], "b": [], **{tag: [] for tag in groups}}
+    submission = [f"{group}{i}" for i in range(10) for group in "ab"]
+    assert lcs_partial_credit(submission, depends_graph, groups) == 2 * 9
+
+    # With eight groups spread over the whole submission, the best solution keeps one group and one
+    # block of each of the others
+    groups = {f"{group}{i}": group for group in "abcdefgh" for i in range(5)}
+    depends_graph = {
+        **{group: [] for group in "abcdefgh"},
+        **{tag: [] for tag in groups},
+    }
+    submission = [f"{group}{i}" for i in range(5) for group in "abcdefgh"]
+    assert lcs_partial_credit(submission, depends_graph, groups) == 2 * 28
+
+
+def test_min_deletions_budget():
+    # Six shuffled groups of four independent blocks
+    groups = list("fcfefdbccbabaeedfddacaeb")
+    before = [0] * len(groups)
+    assert min_deletions(before, groups) == 10
+
+    # Out of steps, the first solution of the search deletes more than needed
+    assert min_deletions(before, groups, budget=0) == 13
+
+    # Twenty groups spread over the whole submission stay within the budget
+    groups = [group for _ in range(5) for group in "abcdefghijklmnopqrst"]
+    assert min_deletions([0] * len(groups), groups) == 100 - (5 + 19)
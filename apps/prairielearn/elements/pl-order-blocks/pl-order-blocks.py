@@ -10,10 +10,18 @@ from typing import Optional, TypedDict
 import chevron
 import lxml.html
 import prairielearn as pl
-from dag_checker import grade_dag, lcs_partial_credit, solve_dag
+from dag_checker import (
+    CompiledDag,
+    compile_dag,
+    grade_compiled_dag,
+    lcs_partial_credit_compiled,
+    solve_dag,
+)
 from lxml import etree
 from typing_extensions import NotRequired, assert_never
 
+PARSED_ELEMENT = True
+
 
 class GradingMethodType(Enum):
     UNORDERED = "unordered"
@@ -80,6 +88,7 @@ SOLUTION_HEADER_DEFAULT = "Construct your solution here:"
 FILE_NAME_DEFAULT = "user_code.py"
 SOLUTION_PLACEMENT_DEFAULT = "right"
 WEIGHT_DEFAULT = 1
+DAG_PARAMS_KEY = "_order_blocks_dag"
 TAB_SIZE_PX = 50
 FIRST_WRONG_FEEDBACK = {
     "incomplete": "Your answer is correct so far, but it is incomplete.",
@@ -115,6 +124,39 @@ def extract_dag(
     return depends_graph, group_belonging
 
 
+def extract_ranking_dag(
+    answers_list: list[OrderBlocksAnswerData],
+) -> dict[str, list[str]]:
+    answers_list = sorted(answers_list, key=lambda x: int(x["ranking"]))
+    tag_to_rank = {answer["tag"]: answer["ranking"] for answer in answers_list}
+    lines_of_rank = {
+        rank: [tag for tag in tag_to_rank if tag_to_rank[tag] == rank]
+        for rank in set(tag_to_rank.values())
+    }
+
+    depends_graph = {}
+    cur_rank_depends = []
+    prev_rank = None
+    for answer in answers_list:
+        ranking = tag_to_rank[answer["tag"]]
+        if prev_rank is not None and ranking != prev_rank:
+            cur_rank_depends = lines_of_rank[prev_rank]
+        depends_graph[answer["tag"]] = cur_rank_depends
+        prev_rank = ranking
+    return depends_graph
+
+
+def compile_answer_dag(
+    answers_list: list[OrderBlocksAnswerData], grading_method: GradingMethodType
+) -> CompiledDag:
+    if grading_method is GradingMethodType.RANKING:
+        return compile_dag(extract_ranking_dag(answers_list), {})
+    elif grading_method is GradingMethodType.DAG:
+        return compile_dag(*extract_dag(answers_list))
+    else:
+        raise ValueError(f"{grading_method.value} grading does not use a DAG.")
+
+
 def solve_problem(
     answers_list: list[OrderBlocksAnswerData], grading_method: GradingMethodType
 ) -> list[OrderBlocksAnswerData]:
@@ -134,9 +176,7 @@ def solve_problem(
         assert_never(grading_method)
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
-
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = ["answers-name"]
     optional_attribs = [
         "source-blocks-order",
@@ -411,12 +451,18 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     data["params"][answer_name] = all_blocks
     data["correct_answers"][answer_name] = correct_answers
 
+    # validate the DAG and convert it into the form used for grading once, instead of every submission
+    if grading_method in [GradingMethodType.RANKING, GradingMethodType.DAG]:
+        data["params"].setdefault(DAG_PARAMS_KEY, {})[answer_name] = compile_answer_dag(
+            correct_answers, grading_method
+        )
+
     # if the order of the blocks in the HTML is a correct solution, leave it unchanged, but if it
     # isn't we need to change it into a solution before displaying it as such
     data_copy = deepcopy(data)
     data_copy["submitted_answers"] = {answer_name: correct_answers}
     data_copy["partial_scores"] = {}
-    grade(element_html, data_copy)
+    grade(element, data_copy)
     if data_copy["partial_scores"][answer_name]["score"] != 1:
         data["correct_answers"][answer_name] = solve_problem(
             correct_answers, grading_method
@@ -433,8 +479,7 @@ def get_distractors(
     ]
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     answer_name = pl.get_string_attrib(element, "answers-name")
     format = pl.get_enum_attrib(element, "format", FormatType, FormatType.DEFAULT)
 
@@ -624,8 +669,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         assert_never(data["panel"])
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     answer_name = pl.get_string_attrib(element, "answers-name")
     allow_blank_submission = pl.get_boolean_attrib(
         element, "allow-blank", ALLOW_BLANK_DEFAULT
@@ -735,8 +779,7 @@ def construct_feedback(
         return feedback
 
 
-def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     answer_name = pl.get_string_attrib(element, "answers-name")
 
     student_answer = data["submitted_answers"][answer_name]
@@ -786,35 +829,14 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
 
     elif grading_method in [GradingMethodType.RANKING, GradingMethodType.DAG]:
         submission = [ans["tag"] for ans in student_answer]
-        depends_graph = {}
-        group_belonging = {}
-
-        if grading_method is GradingMethodType.RANKING:
-            true_answer_list = sorted(true_answer_list, key=lambda x: int(x["ranking"]))
-            true_answer = [answer["tag"] for answer in true_answer_list]
-            tag_to_rank = {
-                answer["tag"]: answer["ranking"] for answer in true_answer_list
-            }
-            lines_of_rank = {
-                rank: [tag for tag in tag_to_rank if tag_to_rank[tag] == rank]
-                for rank in set(tag_to_rank.values())
-            }
-
-            cur_rank_depends = []
-            prev_rank = None
-            for tag in true_answer:
-                ranking = tag_to_rank[tag]
-                if prev_rank is not None and ranking != prev_rank:
-                    cur_rank_depends = lines_of_rank[prev_rank]
-                depends_graph[tag] = cur_rank_depends
-                prev_rank = ranking
 
-        elif grading_method is GradingMethodType.DAG:
-            depends_graph, group_belonging = extract_dag(true_answer_list)
+        # variants prepared before the DAG was stored in the params need to build it here
+        dag = data["params"].get(DAG_PARAMS_KEY, {}).get(answer_name)
+        if dag is None:
+            dag = compile_answer_dag(true_answer_list, grading_method)
+        group_belonging = dict(zip(dag["tags"], dag["groups"]))
 
-        num_initial_correct, true_answer_length = grade_dag(
-            submission, depends_graph, group_belonging
-        )
+        num_initial_correct, true_answer_length = grade_compiled_dag(submission, dag)
         first_wrong = (
             None if num_initial_correct == len(submission) else num_initial_correct
         )
@@ -836,18 +858,13 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
                     block["icon"] = ""
                     block["distractor_feedback"] = ""
 
-        num_initial_correct, true_answer_length = grade_dag(
-            submission, depends_graph, group_belonging
-        )
         if partial_credit_type is PartialCreditType.NONE:
             if num_initial_correct == true_answer_length:
                 final_score = 1
             elif num_initial_correct < true_answer_length:
                 final_score = 0
         elif partial_credit_type is PartialCreditType.LCS:
-            edit_distance = lcs_partial_credit(
-                submission, depends_graph, group_belonging
-            )
+            edit_distance = lcs_partial_credit_compiled(submission, dag)
             final_score = max(
                 0, float(true_answer_length - edit_distance) / true_answer_length
             )
@@ -876,8 +893,7 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
     }
 
 
-def test(element_html: str, data: pl.ElementTestData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element: lxml.html.HtmlElement, data: pl.ElementTestData) -> None:
     grading_method = pl.get_enum_attrib(
         element, "grading-method", GradingMethodType, GRADING_METHOD_DEFAULT
     )
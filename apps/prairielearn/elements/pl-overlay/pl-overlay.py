@@ -4,6 +4,8 @@ import chevron
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 VALIGN_DEFAULT = "middle"
 HALIGN_DEFAULT = "center"
 CLIP_DEFAULT = True
@@ -22,8 +24,7 @@ ALIGNMENT_TO_PERC = {
 }
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     num_backgrounds = 0
     for child in element:
         if isinstance(child, lxml.html.HtmlComment):
@@ -77,8 +78,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
         )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     width = pl.get_float_attrib(element, "width", None)
     height = pl.get_float_attrib(element, "height", None)
     background = None
@@ -1,24 +1,23 @@
 import os
 
 import chevron
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 PARAM_NAMES_DEFAULT = None
 WIDTH_DEFAULT = "500"
 HEIGHT_DEFAULT = "300"
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["script-name"]
     optional_attribs = ["param-names", "width", "height"]
     pl.check_attribs(element, required_attribs, optional_attribs)
     return data
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     script_name = pl.get_string_attrib(element, "script-name", None)
 
     with open(os.path.join(data["options"]["question_path"], script_name)) as f:
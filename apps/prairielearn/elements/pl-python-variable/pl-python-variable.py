@@ -4,6 +4,8 @@ import lxml.html
 import pandas
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 NO_HIGHLIGHT_DEFAULT = False
 PREFIX_DEFAULT = ""
 SUFFIX_DEFAULT = ""
@@ -26,8 +28,7 @@ COPY_CODE_BUTTON_DEFAULT = False
 SHOW_LINE_NUMBERS_DEFAULT = False
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     pl.check_attribs(
         element,
         required_attribs=["params-name"],
@@ -54,9 +55,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
-
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     varname = pl.get_string_attrib(element, "params-name")
     no_highlight = pl.get_boolean_attrib(element, "no-highlight", NO_HIGHLIGHT_DEFAULT)
     prefix = pl.get_string_attrib(element, "prefix", PREFIX_DEFAULT)
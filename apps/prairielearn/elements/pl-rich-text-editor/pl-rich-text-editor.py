@@ -6,6 +6,8 @@ import chevron
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 QUILL_THEME_DEFAULT = "snow"
 PLACEHOLDER_DEFAULT = "Your answer here"
 SOURCE_FILE_NAME_DEFAULT = None
@@ -32,8 +34,7 @@ def add_format_error(data, error_string):
     data["format_errors"]["_files"].append(error_string)
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["file-name"]
     optional_attribs = [
         "quill-theme",
@@ -70,8 +71,7 @@ def prepare(element_html, data):
         )
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     file_name = pl.get_string_attrib(element, "file-name", "")
     answer_name = get_answer_name(file_name)
     quill_theme = pl.get_string_attrib(element, "quill-theme", QUILL_THEME_DEFAULT)
@@ -145,8 +145,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     file_name = pl.get_string_attrib(element, "file-name", "")
     answer_name = get_answer_name(file_name)
 
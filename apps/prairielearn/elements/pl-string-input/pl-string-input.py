@@ -3,10 +3,11 @@ import random
 from html import escape
 
 import chevron
-import lxml.html
 import prairielearn as pl
 from text_unidecode import unidecode
 
+PARSED_ELEMENT = True
+
 WEIGHT_DEFAULT = 1
 CORRECT_ANSWER_DEFAULT = None
 LABEL_DEFAULT = None
@@ -22,8 +23,7 @@ SHOW_HELP_TEXT_DEFAULT = True
 NORMALIZE_TO_ASCII_DEFAULT = False
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -55,8 +55,7 @@ def prepare(element_html, data):
         data["correct_answers"][name] = correct_answer
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
     suffix = pl.get_string_attrib(element, "suffix", SUFFIX_DEFAULT)
@@ -213,8 +212,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     # Get allow-blank option
     allow_blank = pl.get_string_attrib(element, "allow-blank", ALLOW_BLANK_DEFAULT)
@@ -242,8 +240,7 @@ def parse(element_html, data):
         data["submitted_answers"][name] = pl.to_json(a_sub)
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     name = pl.get_string_attrib(element, "answers-name")
 
     # Get weight
@@ -305,8 +302,7 @@ def grade(element_html, data):
         data["partial_scores"][name] = {"score": 0, "weight": weight}
 
 
-def test(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element, data):
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     allow_blank = pl.get_string_attrib(element, "allow-blank", ALLOW_BLANK_DEFAULT)
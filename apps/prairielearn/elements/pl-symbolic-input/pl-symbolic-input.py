@@ -10,6 +10,8 @@ import python_helper_sympy as phs
 import sympy
 from typing_extensions import assert_never
 
+PARSED_ELEMENT = True
+
 
 class DisplayType(Enum):
     INLINE = "inline"
@@ -32,8 +34,7 @@ PLACEHOLDER_DEFAULT = "symbolic expression"
 SYMBOLIC_INPUT_MUSTACHE_TEMPLATE_NAME = "pl-symbolic-input.mustache"
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -69,8 +70,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
         raise ValueError("imaginary-unit-for-display must be either i or j")
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
     variables = phs.get_items_list(
@@ -237,8 +237,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     assert_never(data["panel"])
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variables", VARIABLES_DEFAULT)
@@ -310,8 +309,7 @@ def parse(element_html: str, data: pl.QuestionData) -> None:
         data["submitted_answers"][name] = None
 
 
-def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variables", VARIABLES_DEFAULT)
@@ -343,29 +341,32 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
         a_tru_sympy = phs.json_to_sympy(a_tru, allow_complex=allow_complex)
 
     def grade_function(a_sub: Union[str, phs.SympyJson]) -> tuple[bool, None]:
-        # Parse submitted answer
-        if isinstance(a_sub, str):
-            # this is for backward-compatibility
-            a_sub_sympy = phs.convert_string_to_sympy(
-                a_sub,
-                variables,
-                allow_complex=allow_complex,
-                allow_trig_functions=True,
-                custom_functions=custom_functions,
-                assumptions=a_tru_sympy.assumptions0,
-            )
-        else:
-            a_sub_sympy = phs.json_to_sympy(
-                a_sub, allow_complex=allow_complex, allow_trig_functions=True
-            )
+        try:
+            # Parse submitted answer
+            if isinstance(a_sub, str):
+                # this is for backward-compatibility
+                a_sub_sympy = phs.convert_string_to_sympy(
+                    a_sub,
+                    variables,
+                    allow_complex=allow_complex,
+                    allow_trig_functions=True,
+                    custom_functions=custom_functions,
+                    assumptions=a_tru_sympy.assumptions0,
+                )
+            else:
+                a_sub_sympy = phs.json_to_sympy(
+                    a_sub, allow_complex=allow_complex, allow_trig_functions=True
+                )
 
-        return a_tru_sympy.equals(a_sub_sympy) is True, None
+            return phs.is_equivalent(a_tru_sympy, a_sub_sympy), None
+        except phs.HasTimeoutError:
+            data["format_errors"][name] = phs.COMPARISON_TIMEOUT_MESSAGE
+            return False, None
 
     pl.grade_answer_parameterized(data, name, grade_function, weight=weight)
 
 
-def test(element_html: str, data: pl.ElementTestData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element: lxml.html.HtmlElement, data: pl.ElementTestData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     variables = phs.get_items_list(
         pl.get_string_attrib(element, "variables", VARIABLES_DEFAULT)
@@ -9,6 +9,8 @@ import lxml.etree
 import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 LOG_VARIABLE_WARNINGS_DEFAULT = False
 TRIM_WHITESPACE_DEFAULT = True
 DIRECTORY_CHOICE_DEFAULT = "serverFilesCourse"
@@ -74,8 +76,7 @@ def get_file_path(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     return os.path.join(file_directory, file_name)
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     required_attribs = ["file-name"]
     optional_attribs = [
         "directory",
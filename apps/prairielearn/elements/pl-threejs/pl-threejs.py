@@ -4,11 +4,12 @@ import math
 import os
 
 import chevron
-import lxml.html
 import numpy as np
 import prairielearn as pl
 import pyquaternion
 
+PARSED_ELEMENT = True
+
 BODY_POSITION_DEFAULT = [0, 0, 0]
 BODY_ORIENTATION_DEFAULT = "body-pose-format"
 CAMERA_POSITION_DEFAULT = [5, 2, 2]
@@ -25,8 +26,7 @@ TOL_ROTATION_DEFAULT = 5
 GRADE_DEFAULT = True
 
 
-def prepare(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element, data):
     required_attribs = [
         "answer-name",  # key for 'submitted_answers' and 'true_answers'
     ]
@@ -160,8 +160,7 @@ def get_objects(element, data):
     return obj_list
 
 
-def render(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element, data):
     answer_name = pl.get_string_attrib(element, "answer-name")
 
     uuid = pl.get_uuid()
@@ -383,8 +382,7 @@ def render(element_html, data):
     return html
 
 
-def parse(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element, data):
     name = pl.get_string_attrib(element, "answer-name")
 
     # Get submitted answer or return parse_error if it does not exist
@@ -407,8 +405,7 @@ def parse(element_html, data):
     data["submitted_answers"][name] = a_sub
 
 
-def grade(element_html, data):
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element, data):
     answer_name = pl.get_string_attrib(element, "answer-name")
 
     # Check if this element is intended to produce a grade
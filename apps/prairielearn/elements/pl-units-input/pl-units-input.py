@@ -10,6 +10,8 @@ import unit_utils as uu
 from pint import UnitRegistry, errors
 from typing_extensions import assert_never
 
+PARSED_ELEMENT = True
+
 
 class DisplayType(Enum):
     INLINE = "inline"
@@ -51,13 +53,12 @@ def get_with_units_atol(
 
     name = pl.get_string_attrib(element, "answers-name")
     correct_answer = data["correct_answers"].get(name)
-    correct_answer_units = str(ureg.Quantity(correct_answer).units)
+    correct_answer_units = str(pl.parse_quantity(ureg, correct_answer).units)
 
     return f"{ATOL_DEFAULT} {correct_answer_units}"
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = ["answers-name"]
     optional_attribs = [
         "weight",
@@ -115,7 +116,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
 
     # In with-units mode, absolute tolerance must have units. Otherwise just a float
     if grading_mode is GradingMode.WITH_UNITS:
-        parsed_atol = ureg.Quantity(get_with_units_atol(element, data, ureg))
+        parsed_atol = pl.parse_quantity(ureg, get_with_units_atol(element, data, ureg))
         if parsed_atol.dimensionless:
             atol = pl.get_string_attrib(element, "atol")
             raise ValueError(
@@ -136,7 +137,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
                 f'"magnitude-partial-credit" must be in the range [0.0, 1.0], not {partial_credit}'
             )
 
-        correct_answer_parsed = ureg.Quantity(correct_answer)
+        correct_answer_parsed = pl.parse_quantity(ureg, correct_answer)
 
         if (correct_answer_parsed is not None) and (
             not correct_answer_parsed.check(parsed_atol.dimensionality)
@@ -147,15 +148,14 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
             )
     else:
         atol = pl.get_string_attrib(element, "atol", ATOL_DEFAULT)
-        parsed_atol = ureg.Quantity(atol)
+        parsed_atol = pl.parse_quantity(ureg, atol)
         if not parsed_atol.dimensionless:
             raise ValueError(
                 f'"atol" attribute "{atol}" may only have units in with-units grading.'
             )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     name = pl.get_string_attrib(element, "answers-name")
     label = pl.get_string_attrib(element, "label", LABEL_DEFAULT)
     suffix = pl.get_string_attrib(element, "suffix", SUFFIX_DEFAULT)
@@ -295,7 +295,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         if a_tru is None:
             return ""
 
-        a_tru_parsed = ureg.Quantity(a_tru)
+        a_tru_parsed = pl.parse_quantity(ureg, a_tru)
 
         html_params = {
             "answer": True,
@@ -309,8 +309,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     assert_never(data["panel"])
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     allow_blank = pl.get_boolean_attrib(element, "allow-blank", ALLOW_BLANK_DEFAULT)
 
@@ -384,8 +383,7 @@ def parse(element_html: str, data: pl.QuestionData) -> None:
         data["submitted_answers"][name] = str(a_sub_parsed)
 
 
-def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def grade(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
     grading_mode = pl.get_enum_attrib(
@@ -429,8 +427,7 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
     pl.grade_answer_parameterized(data, name, grading_fn, weight)
 
 
-def test(element_html: str, data: pl.ElementTestData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def test(element: lxml.html.HtmlElement, data: pl.ElementTestData) -> None:
     name = pl.get_string_attrib(element, "answers-name")
     weight = pl.get_integer_attrib(element, "weight", WEIGHT_DEFAULT)
 
@@ -442,18 +439,20 @@ def test(element_html: str, data: pl.ElementTestData) -> None:
     result = data["test_type"]
     if result == "correct":
         if grading_mode is GradingMode.ONLY_UNITS:
-            data["raw_submitted_answers"][name] = str(ureg.Quantity(a_tru).units)
+            data["raw_submitted_answers"][name] = str(
+                pl.parse_quantity(ureg, a_tru).units
+            )
         else:
             data["raw_submitted_answers"][name] = a_tru
 
         data["partial_scores"][name] = {"score": 1, "weight": weight}
     elif result == "incorrect":
         if grading_mode is GradingMode.ONLY_UNITS:
-            answer = str((ureg.Quantity(a_tru) * ureg.meters).units)
+            answer = str((pl.parse_quantity(ureg, a_tru) * ureg.meters).units)
             partial_score = 0.0
             feedback = uu.INCORRECT_FEEDBACK
         elif grading_mode is GradingMode.EXACT_UNITS:
-            answer = ureg.Quantity(a_tru) * 2
+            answer = pl.parse_quantity(ureg, a_tru) * 2
 
             partial_credit = pl.get_float_attrib(
                 element, "magnitude-partial-credit", MAGNITUDE_PARTIAL_CREDIT_DEFAULT
@@ -462,7 +461,7 @@ def test(element_html: str, data: pl.ElementTestData) -> None:
             partial_score = 1.0 - partial_credit if partial_credit is not None else 0.0
             feedback = uu.CORRECT_UNITS_INCORRECT_MAGNITUDE_FEEDBACK
         elif grading_mode is GradingMode.WITH_UNITS:
-            answer = ureg.Quantity(a_tru) * 2
+            answer = pl.parse_quantity(ureg, a_tru) * 2
             partial_score = 0.0
             feedback = uu.INCORRECT_FEEDBACK
         else:
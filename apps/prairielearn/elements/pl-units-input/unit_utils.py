@@ -29,7 +29,7 @@ def get_only_units_grading_fn(
     *, ureg: UnitRegistry, correct_ans: str
 ) -> Callable[[str], Tuple[bool, Optional[str]]]:
     """Returns the grading function used for units only grading mode."""
-    parsed_correct_ans = ureg.Quantity(correct_ans)
+    parsed_correct_ans = pl.parse_quantity(ureg, correct_ans)
 
     def grade_only_units(submitted_ans: str) -> Tuple[bool, Optional[str]]:
         parsed_submission = ureg.Quantity(submitted_ans)
@@ -51,8 +51,8 @@ def get_exact_units_grading_fn(
     rtol: float,
     atol: str,
 ) -> Callable[[str], Tuple[float, Optional[str]]]:
-    parsed_correct_ans = ureg.Quantity(correct_ans)
-    parsed_atol = ureg.Quantity(atol)
+    parsed_correct_ans = pl.parse_quantity(ureg, correct_ans)
+    parsed_atol = pl.parse_quantity(ureg, atol)
 
     def magnitude_comparison_fn(
         submitted_magnitude: float, correct_magnitude: float
@@ -118,8 +118,8 @@ def get_with_units_grading_fn(
     *, ureg: UnitRegistry, correct_ans: str, rtol: float, atol: str
 ) -> Callable[[str], Tuple[bool, Optional[str]]]:
     # Assume atol and correct answer have same dimensionality, checked in prepare method
-    correct_ans_base_unit = ureg.Quantity(correct_ans).to_base_units()
-    parsed_atol = ureg.Quantity(atol).to_base_units()
+    correct_ans_base_unit = pl.parse_quantity(ureg, correct_ans).to_base_units()
+    parsed_atol = pl.parse_quantity(ureg, atol).to_base_units()
 
     def grade_with_units(submitted_ans: str) -> Tuple[bool, Optional[str]]:
         # will return no error, assuming parse() catches all of them
@@ -6,6 +6,8 @@ import lxml.html
 import numpy as np
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 
 class TabType(Enum):
     MATLAB = 1
@@ -24,8 +26,7 @@ SHOW_SYMPY_DEFAULT = True
 DEFAULT_TAB_DEFAULT = TabType.MATLAB
 
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+def prepare(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     required_attribs = []
     optional_attribs = [
         "digits",
@@ -39,8 +40,7 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     pl.check_attribs(element, required_attribs, optional_attribs)
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-    element = lxml.html.fragment_fromstring(element_html)
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     digits = pl.get_integer_attrib(element, "digits", DIGITS_DEFAULT)
     show_matlab = pl.get_boolean_attrib(element, "show-matlab", SHOW_MATLAB_DEFAULT)
     show_mathematica = pl.get_boolean_attrib(
@@ -161,27 +161,36 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             else:
                 mathematica_suffix = ""
 
-            # Create string for matlab and python format
+            # Create strings only for the tabs that are shown, since formatting
+            # a large variable is expensive
             var_name_disp = pl.inner_html(child)
-            var_matlab_data = pl.string_from_numpy(
-                var_data, language="matlab", digits=var_digits
-            )
-            var_mathematica = pl.string_from_numpy(
-                var_data, language="mathematica", digits=var_digits
-            )
-            var_python_data = pl.string_from_numpy(
-                var_data, language="python", digits=var_digits
-            )
-            var_r_data = pl.string_from_numpy(var_data, language="r", digits=var_digits)
-            var_sympy_data = pl.string_from_numpy(
-                var_data, language="sympy", digits=var_digits
-            )
-
-            matlab_data += f"{var_name_disp} = {var_matlab_data};{var_matlab_comment}\n"
-            mathematica_data += f"{var_name_disp}{mathematica_suffix} = {var_mathematica};{var_mathematica_comment}\n"
-            python_data += f"{var_name_disp} = {prefix}{var_python_data}{suffix}{var_python_comment}\n"
-            r_data += f"{var_name_disp} = {var_r_data}{var_r_comment}\n"
-            sympy_data += f"{var_name_disp} = {var_sympy_data}{var_sympy_comment}\n"
+            if show_matlab:
+                var_matlab_data = pl.string_from_numpy(
+                    var_data, language="matlab", digits=var_digits
+                )
+                matlab_data += (
+                    f"{var_name_disp} = {var_matlab_data};{var_matlab_comment}\n"
+                )
+            if show_mathematica:
+                var_mathematica = pl.string_from_numpy(
+                    var_data, language="mathematica", digits=var_digits
+                )
+                mathematica_data += f"{var_name_disp}{mathematica_suffix} = {var_mathematica};{var_mathematica_comment}\n"
+            if show_python:
+                var_python_data = pl.string_from_numpy(
+                    var_data, language="python", digits=var_digits
+                )
+                python_data += f"{var_name_disp} = {prefix}{var_python_data}{suffix}{var_python_comment}\n"
+            if show_r:
+                var_r_data = pl.string_from_numpy(
+                    var_data, language="r", digits=var_digits
+                )
+                r_data += f"{var_name_disp} = {var_r_data}{var_r_comment}\n"
+            if show_sympy:
+                var_sympy_data = pl.string_from_numpy(
+                    var_data, language="sympy", digits=var_digits
+                )
+                sympy_data += f"{var_name_disp} = {var_sympy_data}{var_sympy_comment}\n"
 
         elif child.tag is lxml.etree.Comment:
             continue
@@ -1,24 +1,23 @@
 import math
 
-import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 use_pl_variable_score = False
 
 
-def prepare(element_html, data):
+def prepare(element, data):
     if not use_pl_variable_score:
         return
 
-    element = lxml.html.fragment_fromstring(element_html)
     pl.check_attribs(element, required_attribs=["answers-name"], optional_attribs=[])
 
 
-def render(element_html, data):
+def render(element, data):
     if not use_pl_variable_score:
         return ""
 
-    element = lxml.html.fragment_fromstring(element_html)
     name = pl.get_string_attrib(element, "answers-name")
 
     if data["panel"] == "answer":
@@ -1,6 +1,9 @@
 import chevron
+import lxml.html
 import prairielearn as pl
 
+PARSED_ELEMENT = True
+
 
 def add_format_error(data: pl.QuestionData, error_string: str) -> None:
     if "_files" not in data["format_errors"]:
@@ -8,7 +11,7 @@ def add_format_error(data: pl.QuestionData, error_string: str) -> None:
     data["format_errors"]["_files"].append(error_string)
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
+def render(element: lxml.html.HtmlElement, data: pl.QuestionData) -> str:
     if data["panel"] != "question":
         return ""
 
@@ -26,7 +29,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         return chevron.render(f, html_params).strip()
 
 
-def parse(element_html: str, data: pl.QuestionData) -> None:
+def parse(element: lxml.html.HtmlElement, data: pl.QuestionData) -> None:
     workspace_required_file_names = data["params"].get(
         "_workspace_required_file_names", []
     )
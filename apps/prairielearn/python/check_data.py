@@ -1,3 +1,5 @@
+import copy
+import pickle
 from typing import Any, Literal, TypedDict
 
 Phase = Literal["generate", "prepare", "render", "parse", "grade", "test", "file"]
@@ -117,6 +119,72 @@ PROPS: dict[str, PropInfo] = {
 }
 
 
+# Values of these types are immutable, so they can be snapshotted as-is.
+IMMUTABLE_TYPES = (type(None), bool, int, float, str)
+
+
+class Fingerprint:
+    """
+    A snapshot of a value that compares equal to any value that is equal to
+    the original one.
+
+    The value is stored pickled, which is much cheaper than `copy.deepcopy()`
+    for large values. Comparisons first check if the other value pickles to the
+    same bytes; if it doesn't (e.g. because dict keys were reordered), the
+    original value is restored and compared with `==`.
+    """
+
+    __slots__ = ("pickled",)
+
+    def __init__(self, value: Any) -> None:
+        self.pickled = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __eq__(self, other: object) -> bool:
+        try:
+            if pickle.dumps(other, protocol=pickle.HIGHEST_PROTOCOL) == self.pickled:
+                return True
+        except Exception:
+            pass
+        return pickle.loads(self.pickled) == other
+
+    def __ne__(self, other: object) -> bool:
+        return not self.__eq__(other)
+
+    __hash__ = None  # type: ignore
+
+
+def snapshot_data(data: dict, phase: Phase, deepcopy: bool = False) -> dict:
+    """
+    Returns a snapshot of `data` that can be passed to `check_data()` as
+    `old_data` once question or element code has had a chance to modify `data`.
+
+    Only the props that can't be edited during `phase` are actually captured,
+    since `check_data()` only compares those. If `deepcopy` is true, or if a
+    value can't be pickled, a full deep copy is used instead of a fingerprint.
+    """
+    if deepcopy:
+        return copy.deepcopy(data)
+
+    snapshot = {}
+    for key, value in data.items():
+        prop_info = PROPS.get(key)
+        if (
+            prop_info is None
+            or phase not in prop_info["present_phases"]
+            or phase in prop_info["edit_phases"]
+        ):
+            # The old value won't be looked at.
+            snapshot[key] = None
+        elif isinstance(value, IMMUTABLE_TYPES):
+            snapshot[key] = value
+        else:
+            try:
+                snapshot[key] = Fingerprint(value)
+            except Exception:
+                snapshot[key] = copy.deepcopy(value)
+    return snapshot
+
+
 def check_prop(
     prop: str,
     old_value: Any,
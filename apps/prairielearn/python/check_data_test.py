@@ -1,5 +1,5 @@
 import pytest
-from check_data import check_data
+from check_data import check_data, snapshot_data
 
 
 def test_check_data_extra_props() -> None:
@@ -40,3 +40,51 @@ def test_check_data_number_keys() -> None:
             {"panel": "question", 1: "data", 2: "more data"},
             "render",
         )
+
+
+def test_snapshot_data_detects_nested_modification() -> None:
+    data = {"params": {"foo": ["bar"]}, "variant_seed": 1}
+    snapshot = snapshot_data(data, "render")
+    data["params"]["foo"].append("baz")
+
+    with pytest.raises(
+        ValueError, match=r'data\["params"\] has been illegally modified'
+    ):
+        check_data(snapshot, data, "render")
+
+
+def test_snapshot_data_allows_reordering() -> None:
+    data = {"params": {"a": 1, "b": 2}}
+    snapshot = snapshot_data(data, "render")
+    data["params"] = {"b": 2, "a": 1}
+
+    check_data(snapshot, data, "render")
+
+
+def test_snapshot_data_allows_editable_props() -> None:
+    data = {"params": {"a": 1}, "correct_answers": {}}
+    snapshot = snapshot_data(data, "grade")
+    assert snapshot["params"] is None
+
+    data["params"]["a"] = 2
+    data["correct_answers"]["x"] = 3
+    check_data(snapshot, data, "grade")
+
+
+def test_snapshot_data_unpicklable_value() -> None:
+    data = {"params": {"fn": lambda: None}}
+    snapshot = snapshot_data(data, "render")
+    data["params"]["other"] = 1
+
+    with pytest.raises(
+        ValueError, match=r'data\["params"\] has been illegally modified'
+    ):
+        check_data(snapshot, data, "render")
+
+
+def test_snapshot_data_deepcopy() -> None:
+    data = {"params": {"foo": "bar"}}
+    snapshot = snapshot_data(data, "render", deepcopy=True)
+
+    assert snapshot == data
+    assert snapshot["params"] is not data["params"]
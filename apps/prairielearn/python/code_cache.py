@@ -0,0 +1,211 @@
+# This module caches compiled code objects for Python files that are executed
+# over and over again by the zygote workers, namely element controllers and
+# question `server.py` files.
+#
+# Entries are keyed by the absolute path of the file and validated against its
+# mtime and size, so an edited file is transparently recompiled. The zygote
+# parent warms the cache before forking, which means that every worker inherits
+# the compiled code objects copy-on-write. The parent can also persist compiled
+# code to disk with `marshal` so that a freshly-started zygote doesn't need to
+# compile everything again.
+#
+# Workers never write to the on-disk cache. They may be running untrusted code
+# as a deprivileged user, and we don't want them to be able to influence what
+# code other workers will execute.
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import stat
+from types import CodeType
+from typing import Iterable, Optional, Tuple, TypedDict, Union
+
+StrPath = Union[str, "os.PathLike[str]"]
+
+# (mtime in nanoseconds, size in bytes)
+FileSignature = Tuple[int, int]
+
+
+class CodeCacheStats(TypedDict):
+    hits: int
+    misses: int
+    disk_hits: int
+    entries: int
+
+
+_cache: dict[str, Tuple[FileSignature, CodeType]] = {}
+
+_hits = 0
+_misses = 0
+_disk_hits = 0
+
+
+def _normalize_path(path: StrPath) -> str:
+    return os.path.normpath(os.path.abspath(path))
+
+
+def _signature(st: os.stat_result) -> FileSignature:
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _compile_file(path: str) -> CodeType:
+    with open(path, encoding="utf-8") as inf:
+        # use compile to associate filename with code object, so the
+        # filename appears in the traceback if there is an error
+        # (https://stackoverflow.com/a/437857)
+        return compile(inf.read(), path, "exec")
+
+
+def _disk_cache_file(cache_dir: str, path: str) -> str:
+    digest = hashlib.sha256(path.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{digest}.marshal")
+
+
+def _is_safe_cache_dir(cache_dir: str) -> bool:
+    """
+    Only trust a cache directory that is owned by us and that nobody else can
+    write to; otherwise, a different user could plant code for us to execute.
+    """
+    try:
+        st = os.stat(cache_dir)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def _read_disk_cache(
+    cache_dir: str, path: str, signature: FileSignature
+) -> Optional[CodeType]:
+    try:
+        with open(_disk_cache_file(cache_dir, path), "rb") as f:
+            magic, cached_path, mtime_ns, size, code = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if (
+        magic != importlib.util.MAGIC_NUMBER
+        or cached_path != path
+        or (mtime_ns, size) != signature
+        or not isinstance(code, CodeType)
+    ):
+        return None
+    return code
+
+
+def _write_disk_cache(
+    cache_dir: str, path: str, signature: FileSignature, code: CodeType
+) -> None:
+    cache_file = _disk_cache_file(cache_dir, path)
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "wb") as f:
+            marshal.dump(
+                (importlib.util.MAGIC_NUMBER, path, *signature, code),
+                f,
+            )
+        os.replace(temp_file, cache_file)
+    except OSError:
+        # Persisting is purely an optimization; ignore failures.
+        try:
+            os.unlink(temp_file)
+        except OSError:
+            pass
+
+
+def get_code(path: StrPath) -> CodeType:
+    """
+    Returns the compiled code object for the Python file at `path`, compiling
+    it only if it isn't in the cache or has changed since it was cached.
+    """
+    global _hits, _misses
+
+    path = _normalize_path(path)
+    signature = _signature(os.stat(path))
+
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == signature:
+        _hits += 1
+        return entry[1]
+
+    _misses += 1
+    code = _compile_file(path)
+    _cache[path] = (signature, code)
+    return code
+
+
+def warm(paths: Iterable[StrPath], cache_dir: Optional[str] = None) -> None:
+    """
+    Compiles each of the given files and stores the result in the cache. This
+    is meant to be called in the zygote before forking any workers.
+
+    If `cache_dir` is given, code is loaded from and persisted to that
+    directory with `marshal`. The directory is created if needed and is ignored
+    if it could be written to by anyone but the current user.
+    """
+    global _disk_hits
+
+    if cache_dir is not None:
+        try:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        except OSError:
+            cache_dir = None
+    if cache_dir is not None and not _is_safe_cache_dir(cache_dir):
+        cache_dir = None
+
+    for raw_path in paths:
+        path = _normalize_path(raw_path)
+        try:
+            signature = _signature(os.stat(path))
+        except OSError:
+            continue
+
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == signature:
+            continue
+
+        code = None
+        if cache_dir is not None:
+            code = _read_disk_cache(cache_dir, path, signature)
+            if code is not None:
+                _disk_hits += 1
+
+        if code is None:
+            try:
+                code = _compile_file(path)
+            except (OSError, SyntaxError, ValueError):
+                # Let the actual call surface the error to the user.
+                continue
+            if cache_dir is not None:
+                _write_disk_cache(cache_dir, path, signature, code)
+
+        _cache[path] = (signature, code)
+
+    # Warming shouldn't count towards the stats of the actual calls.
+    reset_stats()
+
+
+def get_stats() -> CodeCacheStats:
+    return {
+        "hits": _hits,
+        "misses": _misses,
+        "disk_hits": _disk_hits,
+        "entries": len(_cache),
+    }
+
+
+def reset_stats() -> None:
+    global _hits, _misses
+    _hits = 0
+    _misses = 0
+
+
+def clear() -> None:
+    global _disk_hits
+    _cache.clear()
+    _disk_hits = 0
+    reset_stats()
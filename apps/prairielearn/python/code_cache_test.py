@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+
+import code_cache
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_cache() -> None:
+    code_cache.clear()
+
+
+def write_module(path: Path, source: str) -> None:
+    path.write_text(source, encoding="utf-8")
+
+
+def test_get_code_caches_by_path(tmp_path: Path) -> None:
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+
+    first = code_cache.get_code(controller)
+    second = code_cache.get_code(str(controller))
+
+    assert first is second
+    assert code_cache.get_stats()["hits"] == 1
+    assert code_cache.get_stats()["misses"] == 1
+
+    mod: dict = {}
+    exec(first, mod)
+    assert mod["x"] == 1
+
+
+def test_get_code_recompiles_changed_file(tmp_path: Path) -> None:
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+    code_cache.get_code(controller)
+
+    write_module(controller, "x = 22\n")
+    mod: dict = {}
+    exec(code_cache.get_code(controller), mod)
+
+    assert mod["x"] == 22
+    assert code_cache.get_stats()["misses"] == 2
+
+
+def test_get_code_uses_filename_for_tracebacks(tmp_path: Path) -> None:
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+
+    assert code_cache.get_code(controller).co_filename == str(controller)
+
+
+def test_warm_persists_to_disk(tmp_path: Path) -> None:
+    cache_dir = tmp_path / "cache"
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+
+    code_cache.warm([controller], cache_dir=str(cache_dir))
+    assert len(os.listdir(cache_dir)) == 1
+    assert code_cache.get_stats()["disk_hits"] == 0
+
+    code_cache.clear()
+    code_cache.warm([controller], cache_dir=str(cache_dir))
+    assert code_cache.get_stats()["disk_hits"] == 1
+
+    code_cache.get_code(controller)
+    assert code_cache.get_stats()["hits"] == 1
+    assert code_cache.get_stats()["misses"] == 0
+
+
+def test_warm_ignores_stale_disk_entries(tmp_path: Path) -> None:
+    cache_dir = tmp_path / "cache"
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+    code_cache.warm([controller], cache_dir=str(cache_dir))
+
+    code_cache.clear()
+    write_module(controller, "x = 333\n")
+    code_cache.warm([controller], cache_dir=str(cache_dir))
+    assert code_cache.get_stats()["disk_hits"] == 0
+
+    mod: dict = {}
+    exec(code_cache.get_code(controller), mod)
+    assert mod["x"] == 333
+
+
+def test_warm_ignores_unsafe_cache_dir(tmp_path: Path) -> None:
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir(mode=0o777)
+    os.chmod(cache_dir, 0o777)
+    controller = tmp_path / "controller.py"
+    write_module(controller, "x = 1\n")
+
+    code_cache.warm([controller], cache_dir=str(cache_dir))
+
+    assert os.listdir(cache_dir) == []
+    assert code_cache.get_stats()["entries"] == 1
+
+
+def test_warm_skips_invalid_files(tmp_path: Path) -> None:
+    controller = tmp_path / "controller.py"
+    write_module(controller, "def broken(:\n")
+
+    code_cache.warm([controller, tmp_path / "missing.py"])
+
+    assert code_cache.get_stats()["entries"] == 0
+    with pytest.raises(SyntaxError):
+        code_cache.get_code(controller)
@@ -1,7 +1,11 @@
+import base64
 import collections
+import copy
+import functools
 import html
 import importlib
 import importlib.util
+import itertools
 import json
 import math
 import numbers
@@ -10,6 +14,7 @@ import random
 import re
 import unicodedata
 import uuid
+import zlib
 from enum import Enum
 from typing import (
     Any,
@@ -82,12 +87,111 @@ def check_answers_names(data: QuestionData, name: str) -> None:
         data["answers_names"][name] = True
 
 
+# The number of quantities that `parse_quantity()` keeps around.
+QUANTITY_CACHE_SIZE = 256
+
+
+# The settings of a pint registry that change how quantities are parsed,
+# converted or formatted. Settings that the installed version of pint doesn't
+# have are ignored.
+UNIT_REGISTRY_SETTINGS = (
+    "case_sensitive",
+    "autoconvert_offset_to_baseunit",
+    "auto_reduce_dimensions",
+    "default_as_delta",
+    "default_format",
+    "default_system",
+    "fmt_locale",
+    "force_ndarray",
+    "force_ndarray_like",
+    "mpl_formatter",
+    "non_int_type",
+    "separate_format_defaults",
+)
+
+
+class SharedUnitRegistry(UnitRegistry):
+    """
+    The unit registry returned by `get_unit_registry()`. It counts changes to
+    its definitions so that quantities that were parsed before a unit was
+    (re)defined are not reused by `parse_quantity()`.
+    """
+
+    definitions_version = 0
+    # The state right after construction, set by `get_unit_registry()`.
+    initial_state: tuple = ()
+
+    def state(self) -> tuple:
+        """
+        The definitions, settings, and enabled contexts of the registry, which
+        is everything that `Quantity()` and the quantities it returns depend on.
+        """
+        return (
+            self.definitions_version,
+            tuple(self.preprocessors),
+            self.Unit.default_format,
+            self.Quantity.default_format,
+            tuple(self._active_ctx.contexts),
+            # Contexts, systems, and groups can be added without `define()`.
+            len(self._contexts),
+            len(self._systems),
+            len(self._groups),
+            *(getattr(self, name, None) for name in UNIT_REGISTRY_SETTINGS),
+        )
+
+    def define(self, definition):
+        super().define(definition)
+        self.definitions_version += 1
+
+    def load_definitions(self, file, is_resource=False):
+        super().load_definitions(file, is_resource)
+        self.definitions_version += 1
+
+
+_unit_registry: Optional[SharedUnitRegistry] = None
+
+
 def get_unit_registry() -> UnitRegistry:
-    """Get a unit registry using cache folder valid on production machines."""
+    """
+    Get the unit registry shared by all code in this process, using a cache
+    folder valid on production machines. Constructing a registry is expensive,
+    so the zygote does it once before forking any workers (see `preload.py`).
+
+    The registry outlives the current question, so it must not leak changes
+    from one question to the next. Once its definitions, settings (e.g.,
+    `default_format` or `default_system`), or enabled contexts have been
+    changed, the caller keeps the changed registry and later calls get a new
+    one.
+    """
+    global _unit_registry
 
-    pid = os.getpid()
-    cache_dir = f"/tmp/pint_{pid}"
-    return UnitRegistry(cache_folder=cache_dir)
+    if _unit_registry is None or _unit_registry.state() != _unit_registry.initial_state:
+        pid = os.getpid()
+        cache_dir = f"/tmp/pint_{pid}"
+        _unit_registry = SharedUnitRegistry(cache_folder=cache_dir)
+        _unit_registry.initial_state = _unit_registry.state()
+    return _unit_registry
+
+
+@functools.lru_cache(maxsize=QUANTITY_CACHE_SIZE)
+def _parse_quantity(ureg: SharedUnitRegistry, state: tuple, s: str) -> Any:
+    return ureg.Quantity(s)
+
+
+def parse_quantity(ureg: UnitRegistry, s: str) -> Any:
+    """
+    Returns `ureg.Quantity(s)`. Quantities parsed with the registry from
+    `get_unit_registry()` are cached, which helps with strings like correct
+    answers and tolerances that are parsed in every phase. Changes to the
+    definitions or parsing options of the registry invalidate the cache.
+    """
+    if not isinstance(ureg, SharedUnitRegistry):
+        return ureg.Quantity(s)
+
+    state = ureg.state()
+    # Quantities can be modified in place (e.g., with `ito()`), so every caller
+    # gets its own copy.
+    return copy.copy(_parse_quantity(ureg, state, s))
 
 
 def grade_answer_parameterized(
@@ -238,6 +342,229 @@ def all_partial_scores_correct(data: QuestionData) -> bool:
     )
 
 
+# Kinds of dtypes (booleans, signed and unsigned integers, floats, and complex
+# numbers) that the 'ndarray_v3' encoding stores as raw bytes.
+NDARRAY_V3_KINDS = frozenset("biufc")
+
+# Arrays with at least this many bytes are compressed in the 'ndarray_v3' encoding,
+# unless compressing a sample of this size from the start of the array saves less
+# than a fifth of it. Random floats, for example, barely compress at all.
+NDARRAY_V3_COMPRESSION_THRESHOLD = 4096
+NDARRAY_V3_COMPRESSION_SAMPLE = 65536
+
+
+def ndarray_to_json_v3(v: np.ndarray) -> dict[str, Any]:
+    dtype = v.dtype.newbyteorder("<")
+    buffer = np.ascontiguousarray(v, dtype=dtype).tobytes()
+    encoded: dict[str, Any] = {
+        "_type": "ndarray_v3",
+        "_dtype": dtype.str,
+        "_shape": list(v.shape),
+    }
+    if len(buffer) >= NDARRAY_V3_COMPRESSION_THRESHOLD:
+        sample = buffer[:NDARRAY_V3_COMPRESSION_SAMPLE]
+        compressible = len(zlib.compress(sample, 1)) < 0.8 * len(sample)
+    else:
+        compressible = False
+    if compressible:
+        compressed = zlib.compress(buffer, 1)
+        if len(compressed) < len(buffer):
+            buffer = compressed
+            encoded["_compression"] = "zlib"
+    encoded["_value"] = base64.b64encode(buffer).decode("ascii")
+    return encoded
+
+
+def ndarray_from_json_v3(v: dict[str, Any]) -> np.ndarray:
+    buffer = base64.b64decode(v["_value"])
+    compression = v.get("_compression", None)
+    if compression == "zlib":
+        buffer = zlib.decompress(buffer)
+    elif compression is not None:
+        raise Exception(
+            f"variable of type ndarray_v3 has unknown compression {compression}"
+        )
+    # Decode from a bytearray so that the array is writable, like other decoded arrays.
+    dtype = np.dtype(v["_dtype"])
+    array = np.frombuffer(bytearray(buffer), dtype=dtype).reshape(v["_shape"])
+    return array.astype(dtype.newbyteorder("="), copy=False)
+
+
+# Extension arrays that store their values in a numpy array with a separate
+# mask of missing values.
+MASKED_ARRAY_TYPES = (
+    pandas.arrays.IntegerArray,
+    pandas.arrays.FloatingArray,
+    pandas.arrays.BooleanArray,
+)
+
+
+def is_missing_value(v: Any) -> bool:
+    return (
+        v is None
+        or v is pandas.NA
+        or v is pandas.NaT
+        or (isinstance(v, float) and math.isnan(v))
+    )
+
+
+def values_to_json_v3(values: Union[pandas.Series, pandas.Index]) -> dict[str, Any]:
+    """
+    Encodes the values of a DataFrame column or index for the 'dataframe_v3' encoding.
+    """
+    dtype = values.dtype
+    array = values.array
+
+    if isinstance(dtype, pandas.CategoricalDtype):
+        return {
+            "kind": "category",
+            "categories": values_to_json_v3(dtype.categories),
+            "codes": ndarray_to_json_v3(np.asarray(array.codes)),
+            "ordered": bool(dtype.ordered),
+        }
+    elif isinstance(dtype, pandas.DatetimeTZDtype):
+        return {
+            "kind": "datetime",
+            "unit": dtype.unit,
+            "tz": str(dtype.tz),
+            "data": ndarray_to_json_v3(array.asi8),
+        }
+    elif isinstance(array, MASKED_ARRAY_TYPES):
+        return {
+            "kind": "masked",
+            "dtype": str(dtype),
+            "data": ndarray_to_json_v3(
+                values.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+            ),
+            "mask": ndarray_to_json_v3(np.asarray(values.isna())),
+        }
+    elif isinstance(dtype, np.dtype) and dtype.kind in "mM":
+        return {
+            "kind": "datetime" if dtype.kind == "M" else "timedelta",
+            "unit": np.datetime_data(dtype)[0],
+            "data": ndarray_to_json_v3(np.asarray(values).view(np.int64)),
+        }
+    elif isinstance(dtype, np.dtype) and dtype.kind in NDARRAY_V3_KINDS:
+        return {"kind": "ndarray", "data": ndarray_to_json_v3(np.asarray(values))}
+    else:
+        # Strings are by far the most common, and don't need to be encoded.
+        if pandas.api.types.infer_dtype(values, skipna=True) == "string":
+            data = [None if is_missing_value(x) else x for x in values.tolist()]
+        else:
+            data = [
+                None if is_missing_value(x) else to_json(x, np_encoding_version=2)
+                for x in values.tolist()
+            ]
+            # Values that `to_json()` leaves as they are, like timestamps, periods
+            # and intervals in an object column, would only fail once the whole
+            # reply is encoded, without saying where they came from.
+            try:
+                json.dumps(data)
+            except TypeError as e:
+                kind = "column" if isinstance(values, pandas.Series) else "index"
+                raise ValueError(
+                    f"The values of {kind} {values.name!r} with dtype {dtype} can't be "
+                    f"encoded as dataframe_v3: {e}"
+                ) from e
+        return {"kind": "object", "dtype": str(dtype), "data": data}
+
+
+def values_from_json_v3(v: dict[str, Any]) -> Any:
+    """
+    Decodes the values of a DataFrame column or index that were encoded with
+    `values_to_json_v3()` into an array.
+    """
+    kind = v["kind"]
+    if kind == "category":
+        return pandas.Categorical.from_codes(
+            ndarray_from_json_v3(v["codes"]),
+            categories=pandas.Index(values_from_json_v3(v["categories"])),
+            ordered=v["ordered"],
+        )
+    elif kind == "datetime" or kind == "timedelta":
+        data = ndarray_from_json_v3(v["data"])
+        array = data.view(f"{'M' if kind == 'datetime' else 'm'}8[{v['unit']}]")
+        if "tz" in v:
+            return (
+                pandas.DatetimeIndex(array).tz_localize("UTC").tz_convert(v["tz"]).array
+            )
+        return array
+    elif kind == "masked":
+        array_type = pandas.api.types.pandas_dtype(v["dtype"]).construct_array_type()
+        return array_type(
+            ndarray_from_json_v3(v["data"]), ndarray_from_json_v3(v["mask"])
+        )
+    elif kind == "ndarray":
+        return ndarray_from_json_v3(v["data"])
+    elif kind == "object":
+        items = [from_json(x) for x in v["data"]]
+        if v["dtype"] != "object":
+            return pandas.array(items, dtype=v["dtype"])
+        # Fill the array one item at a time, since numpy would try to turn any
+        # lists into another dimension of the array.
+        array = np.empty(len(items), dtype=object)
+        for i, item in enumerate(items):
+            array[i] = item
+        return array
+    else:
+        raise Exception(f"variable of type dataframe_v3 has unknown kind {kind}")
+
+
+def index_to_json_v3(index: pandas.Index) -> dict[str, Any]:
+    name = to_json(index.name, np_encoding_version=2)
+    if isinstance(index, pandas.RangeIndex):
+        return {
+            "kind": "range",
+            "name": name,
+            "start": index.start,
+            "stop": index.stop,
+            "step": index.step,
+        }
+    encoded = {"name": name, **values_to_json_v3(index)}
+    if isinstance(index, (pandas.DatetimeIndex, pandas.TimedeltaIndex)):
+        encoded["freq"] = index.freqstr
+    return encoded
+
+
+def index_from_json_v3(v: dict[str, Any]) -> pandas.Index:
+    name = from_json(v["name"])
+    if v["kind"] == "range":
+        return pandas.RangeIndex(v["start"], v["stop"], v["step"], name=name)
+    values = values_from_json_v3(v)
+    if v.get("freq") is not None:
+        if v["kind"] == "datetime":
+            return pandas.DatetimeIndex(values, freq=v["freq"], name=name)
+        return pandas.TimedeltaIndex(values, freq=v["freq"], name=name)
+    return pandas.Index(values, name=name)
+
+
+def dataframe_to_json_v3(df: pandas.DataFrame) -> dict[str, Any]:
+    if isinstance(df.index, pandas.MultiIndex) or isinstance(
+        df.columns, pandas.MultiIndex
+    ):
+        raise ValueError(
+            "DataFrames with a MultiIndex can't be encoded as dataframe_v3"
+        )
+    return {
+        "_type": "dataframe_v3",
+        "_value": {
+            "index": index_to_json_v3(df.index),
+            "columns": index_to_json_v3(df.columns),
+            "data": [values_to_json_v3(df.iloc[:, i]) for i in range(df.shape[1])],
+        },
+    }
+
+
+def dataframe_from_json_v3(v: dict[str, Any]) -> pandas.DataFrame:
+    value = v["_value"]
+    df = pandas.DataFrame(
+        {i: values_from_json_v3(column) for i, column in enumerate(value["data"])},
+        index=index_from_json_v3(value["index"]),
+    )
+    df.columns = index_from_json_v3(value["columns"])
+    return df
+
+
 def to_json(v, *, df_encoding_version=1, np_encoding_version=1):
     """to_json(v)
 
@@ -248,10 +575,19 @@ def to_json(v, *, df_encoding_version=1, np_encoding_version=1):
 
         numpy scalar -> '_type': 'np_scalar'
 
+        If np_encoding_version is set to 3, will serialize numpy scalars like version 2,
+        and numeric ndarrays (including complex ones) as follows:
+
+        numeric ndarray -> '_type': 'ndarray_v3'
+
         If df_encoding_version is set to 2, will serialize pandas DataFrames as follows:
 
         pandas.DataFrame -> '_type': 'dataframe_v2'
 
+        If df_encoding_version is set to 3, will serialize pandas DataFrames as follows:
+
+        pandas.DataFrame -> '_type': 'dataframe_v3'
+
         Otherwise, the following mappings are used:
 
         any complex scalar (including numpy) -> '_type': 'complex'
@@ -264,21 +600,34 @@ def to_json(v, *, df_encoding_version=1, np_encoding_version=1):
 
     Note that the 'dataframe_v2' encoding allows for missing and date time values whereas
     the 'dataframe' (default) does not. However, the 'dataframe' encoding allows for complex
-    numbers while 'dataframe_v2' does not.
+    numbers while 'dataframe_v2' does not. The 'dataframe_v3' encoding allows for all of
+    these and preserves the dtype of every column, the index (including the frequency of
+    a date time index), and the column labels. It stores each column separately, with
+    numeric, date time, and nullable columns as binary data like 'ndarray_v3', so it is
+    much faster and smaller for large DataFrames. It does not support a MultiIndex, or
+    columns with values that can't be json serialized, like pandas periods, intervals,
+    or timestamps in an object column; both raise a ValueError.
 
     If v is an ndarray, this function preserves its dtype (by adding '_dtype' as
     a third field in the dictionary).
 
+    The 'ndarray_v3' encoding stores the raw little-endian bytes of the array as a
+    base64 string, along with its '_dtype' and '_shape'. Large arrays are compressed
+    with zlib if that makes them smaller, which is noted in '_compression'. This is
+    much smaller and faster to encode and decode than a list for large arrays.
+
     This function does not try to preserve information like the assumptions on
     variables in a sympy expression.
 
     If v can be json serialized or does not have a standard type, then it is
     returned without change.
     """
-    if np_encoding_version not in {1, 2}:
-        raise ValueError(f"Invaild np_encoding {np_encoding_version}, must be 1 or 2.")
+    if np_encoding_version not in {1, 2, 3}:
+        raise ValueError(
+            f"Invaild np_encoding {np_encoding_version}, must be 1, 2, or 3."
+        )
 
-    if np_encoding_version == 2 and isinstance(v, np.number):
+    if np_encoding_version >= 2 and isinstance(v, np.number):
         return {
             "_type": "np_scalar",
             "_concrete_type": type(v).__name__,
@@ -288,7 +637,9 @@ def to_json(v, *, df_encoding_version=1, np_encoding_version=1):
     if np.isscalar(v) and np.iscomplexobj(v):
         return {"_type": "complex", "_value": {"real": v.real, "imag": v.imag}}
     elif isinstance(v, np.ndarray):
-        if np.isrealobj(v):
+        if np_encoding_version == 3 and v.dtype.kind in NDARRAY_V3_KINDS:
+            return ndarray_to_json_v3(v)
+        elif np.isrealobj(v):
             return {"_type": "ndarray", "_value": v.tolist(), "_dtype": str(v.dtype)}
         elif np.iscomplexobj(v):
             return {
@@ -345,9 +696,12 @@ def to_json(v, *, df_encoding_version=1, np_encoding_version=1):
 
             return {"_type": "dataframe_v2", "_value": pure_json_df}
 
+        elif df_encoding_version == 3:
+            return dataframe_to_json_v3(v)
+
         else:
             raise ValueError(
-                f"Invalid df_encoding_version: {df_encoding_version}. Must be 1 or 2"
+                f"Invalid df_encoding_version: {df_encoding_version}. Must be 1, 2, or 3"
             )
     elif isinstance(v, (nx.Graph, nx.DiGraph, nx.MultiGraph, nx.MultiDiGraph)):
         return {"_type": "networkx_graph", "_value": nx.adjacency_data(v)}
@@ -365,10 +719,12 @@ def from_json(v):
         '_type': 'np_scalar' -> numpy scalar defined by '_concrete_type'
         '_type': 'ndarray' -> non-complex ndarray
         '_type': 'complex_ndarray' -> complex ndarray
+        '_type': 'ndarray_v3' -> ndarray
         '_type': 'sympy' -> sympy.Expr
         '_type': 'sympy_matrix' -> sympy.Matrix
         '_type': 'dataframe' -> pandas.DataFrame
         '_type': 'dataframe_v2' -> pandas.DataFrame
+        '_type': 'dataframe_v3' -> pandas.DataFrame
         '_type': 'networkx_graph' -> corresponding networkx graph
 
     If v encodes an ndarray and has the field '_dtype', this function recovers
@@ -408,6 +764,13 @@ def from_json(v):
                         return np.array(v["_value"])
                 else:
                     raise Exception("variable of type ndarray should have value")
+            elif v["_type"] == "ndarray_v3":
+                if "_value" in v and "_dtype" in v and "_shape" in v:
+                    return ndarray_from_json_v3(v)
+                else:
+                    raise Exception(
+                        "variable of type ndarray_v3 should have value, dtype, and shape"
+                    )
             elif v["_type"] == "complex_ndarray":
                 if (
                     ("_value" in v)
@@ -464,6 +827,13 @@ def from_json(v):
                 # pandas read_json() can process it.
                 value_str = json.dumps(v["_value"])
                 return pandas.read_json(value_str, orient="table")
+            elif v["_type"] == "dataframe_v3":
+                if "_value" in v and "index" in v["_value"] and "data" in v["_value"]:
+                    return dataframe_from_json_v3(v)
+                else:
+                    raise Exception(
+                        "variable of type dataframe_v3 should have value with index, columns, and data"
+                    )
             elif v["_type"] == "networkx_graph":
                 return nx.adjacency_graph(v["_value"])
             else:
@@ -749,6 +1119,34 @@ def get_color_attrib(element, name, *args):
             )
 
 
+def format_ndarray_entries(A, presentation_type="f", digits=2):
+    """format_ndarray_entries(A, presentation_type='f', digits=2)
+
+    Returns a list with every entry of the ndarray A, in row-major order,
+    formatted as a string in the same way as `string_from_numpy()`.
+    """
+    values = A.ravel().tolist()
+    if presentation_type != "sigfig":
+        return list(
+            map(format, values, itertools.repeat(f".{digits}{presentation_type}"))
+        )
+    if A.dtype.kind == "c":
+        return [_string_from_complex_sigfig(x, digits) for x in values]
+    if A.dtype.kind == "f":
+        return [to_precision.to_precision(x, digits) for x in values]
+    return [string_from_number_sigfig(x, digits) for x in values]
+
+
+def _matlab_from_entries(entries, shape):
+    # Joins the formatted entries of a 1D or 2D ndarray in MATLAB format.
+    if len(shape) == 1 or not entries:
+        return "[" + ", ".join(entries) + "]"
+    m, n = shape
+    return (
+        "[" + "; ".join(" ".join(entries[i * n : (i + 1) * n]) for i in range(m)) + "]"
+    )
+
+
 def numpy_to_matlab(A, ndigits=2, wtype="f"):
     """numpy_to_matlab(A, ndigits=2, wtype='f')
 
@@ -763,36 +1161,9 @@ def numpy_to_matlab(A, ndigits=2, wtype="f"):
     if np.isscalar(A):
         A_str = "{:.{indigits}{iwtype}}".format(A, indigits=ndigits, iwtype=wtype)
         return A_str
-    elif A.ndim == 1:
-        s = A.shape
-        m = s[0]
-        A_str = "["
-        for i in range(0, m):
-            A_str += "{:.{indigits}{iwtype}}".format(
-                A[i], indigits=ndigits, iwtype=wtype
-            )
-            if i < m - 1:
-                A_str += ", "
-        A_str += "]"
-        return A_str
-    else:
-        s = A.shape
-        m = s[0]
-        n = s[1]
-        A_str = "["
-        for i in range(0, m):
-            for j in range(0, n):
-                A_str += "{:.{indigits}{iwtype}}".format(
-                    A[i, j], indigits=ndigits, iwtype=wtype
-                )
-                if j == n - 1:
-                    if i == m - 1:
-                        A_str += "]"
-                    else:
-                        A_str += "; "
-                else:
-                    A_str += " "
-        return A_str
+    return _matlab_from_entries(
+        format_ndarray_entries(A, presentation_type=wtype, digits=ndigits), A.shape
+    )
 
 
 def string_from_numpy(A, language="python", presentation_type="f", digits=2):
@@ -863,28 +1234,40 @@ def string_from_numpy(A, language="python", presentation_type="f", digits=2):
             )
 
     # if A is a 1D or 2D ndarray
-    if language == "python":
-        if presentation_type == "sigfig":
-            formatter = {
-                "float_kind": lambda x: to_precision.to_precision(x, digits),
-                "complex_kind": lambda x: _string_from_complex_sigfig(x, digits),
-            }
-        else:
-            formatter = {
-                "float_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-                "complex_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-            }
-        return np.array2string(A, formatter=formatter, separator=", ").replace("\n", "")
-    elif language == "matlab":
+    if language == "matlab":
         if presentation_type == "sigfig":
             return numpy_to_matlab_sf(A, ndigits=digits)
         else:
             return numpy_to_matlab(A, ndigits=digits, wtype=presentation_type)
-    elif language == "mathematica":
+    elif language not in ("python", "mathematica", "r", "sympy"):
+        raise Exception(
+            'language "{:s}" must be either "python", "matlab", "mathematica", "r", or "sympy"'.format(
+                language
+            )
+        )
+
+    # All other languages start from the Python format. Format the entries of
+    # float and complex arrays in one go, unless numpy would summarize them
+    # (see `np.set_printoptions()`).
+    if (
+        A.dtype.kind in "fc"
+        and A.ndim in (1, 2)
+        and 0 < A.size <= np.get_printoptions()["threshold"]
+    ):
+        entries = format_ndarray_entries(A, presentation_type, digits)
+        if A.ndim == 1:
+            result = "[" + ", ".join(entries) + "]"
+        else:
+            m, n = A.shape
+            result = (
+                "["
+                + ", ".join(
+                    "[" + ", ".join(entries[i * n : (i + 1) * n]) + "]"
+                    for i in range(m)
+                )
+                + "]"
+            )
+    else:
         if presentation_type == "sigfig":
             formatter = {
                 "float_kind": lambda x: to_precision.to_precision(x, digits),
@@ -902,27 +1285,11 @@ def string_from_numpy(A, language="python", presentation_type="f", digits=2):
         result = np.array2string(A, formatter=formatter, separator=", ").replace(
             "\n", ""
         )
+
+    if language == "mathematica":
         result = result.replace("[", "{")
         result = result.replace("]", "}")
-        return result
     elif language == "r":
-        if presentation_type == "sigfig":
-            formatter = {
-                "float_kind": lambda x: to_precision.to_precision(x, digits),
-                "complex_kind": lambda x: _string_from_complex_sigfig(x, digits),
-            }
-        else:
-            formatter = {
-                "float_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-                "complex_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-            }
-        result = np.array2string(A, formatter=formatter, separator=", ").replace(
-            "\n", ""
-        )
         # Given as: [[1, 2, 3], [4, 5, 6]]
         result = result.replace("[", "")
         result = result.replace("]", "")
@@ -932,34 +1299,10 @@ def string_from_numpy(A, language="python", presentation_type="f", digits=2):
             nrow = A.shape[0]
             ncol = A.shape[1]
             result = f"matrix({result}, nrow = {nrow}, ncol = {ncol}, byrow = TRUE)"
-        return result
     elif language == "sympy":
-        if presentation_type == "sigfig":
-            formatter = {
-                "float_kind": lambda x: to_precision.to_precision(x, digits),
-                "complex_kind": lambda x: _string_from_complex_sigfig(x, digits),
-            }
-        else:
-            formatter = {
-                "float_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-                "complex_kind": lambda x: "{:.{digits}{presentation_type}}".format(
-                    x, digits=digits, presentation_type=presentation_type
-                ),
-            }
-        result = np.array2string(A, formatter=formatter, separator=", ").replace(
-            "\n", ""
-        )
         # Cast to a vector: Matrix([1, 2, 3, 4, 5, 6])
         result = f"Matrix({result})"
-        return result
-    else:
-        raise Exception(
-            'language "{:s}" must be either "python", "matlab", "mathematica", "r", or "sympy"'.format(
-                language
-            )
-        )
+    return result
 
 
 # Deprecated version, keeping for backwards compatibility
@@ -1012,38 +1355,9 @@ def numpy_to_matlab_sf(A, ndigits=2):
         else:
             A_str = to_precision.to_precision(A, ndigits)
         return A_str
-    elif A.ndim == 1:
-        s = A.shape
-        m = s[0]
-        A_str = "["
-        for i in range(0, m):
-            if np.iscomplexobj(A[i]):
-                A_str += _string_from_complex_sigfig(A[i], ndigits)
-            else:
-                A_str += to_precision.to_precision(A[i], ndigits)
-            if i < m - 1:
-                A_str += ", "
-        A_str += "]"
-        return A_str
-    else:
-        s = A.shape
-        m = s[0]
-        n = s[1]
-        A_str = "["
-        for i in range(0, m):
-            for j in range(0, n):
-                if np.iscomplexobj(A[i, j]):
-                    A_str += _string_from_complex_sigfig(A[i, j], ndigits)
-                else:
-                    A_str += to_precision.to_precision(A[i, j], ndigits)
-                if j == n - 1:
-                    if i == m - 1:
-                        A_str += "]"
-                    else:
-                        A_str += "; "
-                else:
-                    A_str += " "
-        return A_str
+    return _matlab_from_entries(
+        format_ndarray_entries(A, presentation_type="sigfig", digits=ndigits), A.shape
+    )
 
 
 def string_partition_first_interval(s, left="[", right="]"):
@@ -1204,6 +1518,113 @@ def string_fraction_to_number(a_sub, allow_fractions=True, allow_complex=True):
     return (value, data)
 
 
+# Delimiters between the entries of a row of a matrix in MATLAB format.
+MATLAB_DELIMITER_RE = re.compile(r"\s*[\s,]\s*")
+
+# A well-formed matrix in Python format, without its outer brackets.
+PYTHON_MATRIX_RE = re.compile(r"\s*\[[^\[\]]*\]\s*(?:,\s*\[[^\[\]]*\]\s*)*")
+PYTHON_ROW_RE = re.compile(r"\[([^\[\]]*)\]")
+
+
+def tokens_to_2darray(
+    tokens: list[str], m: int, n: int, allow_complex: bool
+) -> tuple[Optional[np.ndarray], Optional[int]]:
+    """
+    Converts the m * n entries of a matrix, in row-major order, into an ndarray
+    with type np.float64 or, if any entry is complex, np.complex128.
+
+    Returns a tuple with the ndarray, or None and the index of the first entry
+    that could not be converted (see `string_to_number()`) or isn't finite.
+    """
+    # Let numpy fill the array directly from the parsed entries, which works for
+    # all valid input.
+    A = None
+    try:
+        A = np.fromiter(map(float, tokens), dtype=np.float64, count=m * n)
+    except ValueError:
+        if allow_complex:
+            try:
+                A = np.fromiter(map(complex, tokens), dtype=np.complex128, count=m * n)
+            except ValueError:
+                pass
+    if A is not None and np.isfinite(A).all():
+        return A.reshape(m, n), None
+
+    # Otherwise, go through the entries one by one to find the invalid one.
+    A = np.zeros(m * n)
+    for k, token in enumerate(tokens):
+        ans = string_to_number(token, allow_complex=allow_complex)
+        if ans is None or not np.isfinite(ans):
+            return None, k
+        if np.iscomplexobj(ans):
+            A = A.astype(np.complex128, copy=False)
+        A[k] = ans
+    return A.reshape(m, n), None
+
+
+def string_to_2darray_single_pass(s, number_of_left_brackets, allow_complex):
+    """
+    Parses the string between the outer brackets of a 2D array in MATLAB or
+    Python format (see `string_to_2darray()`), without converting one entry at a
+    time.
+
+    Returns None if the structure of the array is not valid, so that the caller
+    can find out what exactly is wrong with it.
+    """
+    if number_of_left_brackets == 1:
+        # Split rows a la MATLAB, ignoring the first/last token if it's an empty
+        # string (occurs when a row leads/trails with a valid delimiter). Rows
+        # without commas split the same way on white space, which is faster.
+        rows = [
+            MATLAB_DELIMITER_RE.split(row) if "," in row else row.split()
+            for row in s.split(";")
+        ]
+        for row in rows:
+            if row and not row[0]:
+                row.pop(0)
+            if row and not row[-1]:
+                row.pop(-1)
+        format_type = "matlab"
+        location = "in the matrix"
+    else:
+        # Strip white space on either side of "+" or "-" wherever they occur
+        s = re.sub(r" *\+ *", "+", s)
+        s = re.sub(r" *\- *", "-", s)
+        if ";" in s or not PYTHON_MATRIX_RE.fullmatch(s):
+            return None
+        rows = [row.strip() for row in PYTHON_ROW_RE.findall(s)]
+        if not all(rows):
+            return None
+        rows = [row.split(",") for row in rows]
+        format_type = "python"
+        location = "of the matrix"
+
+    m = len(rows)
+    n = len(rows[0])
+    if n == 0 or any(len(row) != n for row in rows):
+        return None
+
+    tokens = [token for row in rows for token in row]
+    A, error_index = tokens_to_2darray(tokens, m, n, allow_complex)
+    if error_index is not None:
+        token = tokens[error_index]
+        i, j = divmod(error_index, n)
+        if format_type == "python" and not token.strip():
+            return (
+                None,
+                {
+                    "format_error": f"Entry at location (row={i + 1}, column={j + 1}) in the matrix is empty."
+                },
+            )
+        return (
+            None,
+            {
+                "format_error": f"Entry {escape_invalid_string(token)} at location (row={i + 1}, column={j + 1}) {location} has an invalid format."
+            },
+        )
+    return (A, {"format_type": format_type})
+
+
 def string_to_2darray(s, allow_complex=True):
     """string_to_2darray(s)
 
@@ -1273,6 +1694,12 @@ def string_to_2darray(s, allow_complex=True):
             },
         )
 
+    # Parse any well-formed matrix in one go. If that's not possible, the code
+    # below determines what's wrong with it.
+    result = string_to_2darray_single_pass(s, number_of_left_brackets, allow_complex)
+    if result is not None:
+        return result
+
     # If there is only one set of brackets, treat as MATLAB format
     if number_of_left_brackets == 1:
         # Can NOT strip white space on either side of "+" or "-" wherever they occur,
@@ -1569,30 +1996,75 @@ def latex_from_2darray(
     return "".join(rv)
 
 
+def get_correct_mask_ndarray2D_dd(a_sub, a_tru, digits=2) -> np.ndarray:
+    """
+    Compare a_sub and a_tru entry by entry using digits many digits after the
+    decimal place, like is_correct_scalar_dd. Returns a boolean array that is
+    True for every correct entry.
+    """
+    a_sub = np.asarray(a_sub)
+    a_tru = np.asarray(a_tru)
+
+    # If answers are complex, check real and imaginary parts separately
+    if np.iscomplexobj(a_sub) or np.iscomplexobj(a_tru):
+        return get_correct_mask_ndarray2D_dd(
+            a_sub.real, a_tru.real, digits=digits
+        ) & get_correct_mask_ndarray2D_dd(a_sub.imag, a_tru.imag, digits=digits)
+
+    # Get bounds on submitted answer
+    eps = 0.51 * (10**-digits)
+    lower_bound = a_tru - eps
+    upper_bound = a_tru + eps
+
+    # Check if submitted answer is in bounds
+    return (a_sub > lower_bound) & (a_sub < upper_bound)
+
+
+def get_correct_mask_ndarray2D_sf(a_sub, a_tru, digits=2) -> np.ndarray:
+    """
+    Compare a_sub and a_tru entry by entry using digits many significant
+    figures, like is_correct_scalar_sf. Returns a boolean array that is True
+    for every correct entry.
+    """
+    a_sub = np.asarray(a_sub)
+    a_tru = np.asarray(a_tru)
+
+    # If answers are complex, check real and imaginary parts separately
+    if np.iscomplexobj(a_sub) or np.iscomplexobj(a_tru):
+        return get_correct_mask_ndarray2D_sf(
+            a_sub.real, a_tru.real, digits=digits
+        ) & get_correct_mask_ndarray2D_sf(a_sub.imag, a_tru.imag, digits=digits)
+
+    # Get bounds on submitted answer, where n is the number of digits after the
+    # decimal place that are significant for each entry of a_tru
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(a_tru)))
+    n = np.where(a_tru == 0, digits - 1, -magnitude + (digits - 1))
+    eps = 0.51 * (10.0**-n)
+    lower_bound = a_tru - eps
+    upper_bound = a_tru + eps
+
+    # Check if submitted answer is in bounds
+    return (a_sub > lower_bound) & (a_sub < upper_bound)
+
+
+def get_correct_mask_ndarray2D_ra(a_sub, a_tru, rtol=1e-5, atol=1e-8) -> np.ndarray:
+    """
+    Compare a_sub and a_tru entry by entry using relative tolerance rtol and
+    absolute tolerance atol, like is_correct_scalar_ra. Returns a boolean array
+    that is True for every correct entry.
+    """
+    return np.isclose(a_sub, a_tru, rtol, atol)
+
+
 def is_correct_ndarray2D_dd(a_sub, a_tru, digits=2):
     # Check if each element is correct
-    m = a_sub.shape[0]
-    n = a_sub.shape[1]
-    for i in range(0, m):
-        for j in range(0, n):
-            if not is_correct_scalar_dd(a_sub[i, j], a_tru[i, j], digits):
-                return False
-
-    # All elements were close
-    return True
+    return bool(np.all(get_correct_mask_ndarray2D_dd(a_sub, a_tru, digits)))
 
 
 def is_correct_ndarray2D_sf(a_sub, a_tru, digits=2):
     # Check if each element is correct
-    m = a_sub.shape[0]
-    n = a_sub.shape[1]
-    for i in range(0, m):
-        for j in range(0, n):
-            if not is_correct_scalar_sf(a_sub[i, j], a_tru[i, j], digits):
-                return False
-
-    # All elements were close
-    return True
+    return bool(np.all(get_correct_mask_ndarray2D_sf(a_sub, a_tru, digits)))
 
 
 def is_correct_ndarray2D_ra(a_sub, a_tru, rtol=1e-5, atol=1e-8):
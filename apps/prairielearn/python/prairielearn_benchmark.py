@@ -0,0 +1,86 @@
+# Micro-benchmarks for the functions in `prairielearn.py` that process large
+# matrices, which students may paste into or receive from elements like
+# `pl-matrix-input`. Run them with:
+#
+#     python prairielearn_benchmark.py [--repeat N]
+
+import argparse
+import timeit
+from typing import Callable
+
+import numpy as np
+import prairielearn as pl
+
+SIZES = (10, 50, 100, 200, 500)
+
+
+def format_matlab(A: np.ndarray) -> str:
+    return "[" + "; ".join(" ".join(str(x) for x in row) for row in A) + "]"
+
+
+def format_python(A: np.ndarray) -> str:
+    return (
+        "[" + ", ".join("[" + ", ".join(str(x) for x in row) + "]" for row in A) + "]"
+    )
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def benchmark_string_to_2darray(repeat: int) -> None:
+    print("string_to_2darray")
+    rng = np.random.default_rng(0)
+    for n in SIZES:
+        real = rng.standard_normal((n, n))
+        complex_ = real + 1j * rng.standard_normal((n, n))
+        timings = [
+            time_call(lambda: pl.string_to_2darray(s), repeat)
+            for A in (real, complex_)
+            for s in (format_matlab(A), format_python(A))
+        ]
+        print(
+            f"  {n:3d}x{n:<3d}"
+            + "".join(
+                f" {label} {t * 1000:9.3f} ms"
+                for label, t in zip(
+                    ("matlab", "python", "matlab complex", "python complex"), timings
+                )
+            )
+        )
+
+
+def benchmark_string_from_numpy(repeat: int) -> None:
+    print("string_from_numpy")
+    rng = np.random.default_rng(0)
+    languages = ("python", "matlab", "mathematica", "r", "sympy")
+    for n in SIZES:
+        A = rng.standard_normal((n, n))
+        for presentation_type in ("f", "sigfig"):
+            timings = [
+                time_call(
+                    lambda: pl.string_from_numpy(A, language, presentation_type),
+                    repeat,
+                )
+                for language in languages
+            ]
+            print(
+                f"  {n:3d}x{n:<3d} {presentation_type:6s}"
+                + "".join(
+                    f" {language} {t * 1000:9.3f} ms"
+                    for language, t in zip(languages, timings)
+                )
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    benchmark_string_to_2darray(args.repeat)
+    benchmark_string_from_numpy(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
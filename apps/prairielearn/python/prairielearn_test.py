@@ -8,6 +8,7 @@ import lxml.html
 import networkx as nx
 import numpy as np
 import pandas as pd
+import pint
 import prairielearn as pl
 import pytest
 from pytest_lazyfixture import lazy_fixture
@@ -37,6 +38,62 @@ def test_encoding_pandas(df: pd.DataFrame) -> None:
     pd.testing.assert_frame_equal(deserialized_df, reference_df)
 
 
+@pytest.mark.parametrize(
+    "df",
+    lazy_fixture(["city_dataframe", "breast_cancer_dataframe", "r_types_dataframe"])
+    + [
+        pd.DataFrame(
+            {
+                "float": [1.5, np.nan, 3.0],
+                "complex": [1 + 2j, 3, 4j],
+                "string": pd.array(["x", None, "z"], dtype="string"),
+                "nullable": pd.array([1, None, 3], dtype="Int64"),
+                "boolean": pd.array([True, None, False], dtype="boolean"),
+                "datetime": pd.to_datetime(["2022-01-01", None, "2023-05-06"]),
+                "tz": pd.date_range("2023", periods=3, tz="US/Central"),
+                "timedelta": pd.to_timedelta([1, 2, None], unit="s"),
+                "category": pd.Categorical(["x", "y", "x"], ordered=True),
+                5: [[1, 2], {"a": 1}, None],
+            },
+            index=pd.Index(["r1", "r2", "r3"], name="row"),
+        ),
+        pd.DataFrame(index=pd.RangeIndex(2, 10, 2)),
+        pd.DataFrame(
+            {"x": [1.0, 2.0, 3.0]},
+            index=pd.date_range("2023", periods=3, freq="W-MON", tz="UTC"),
+        ),
+        pd.DataFrame(
+            {"x": [1, 2]},
+            index=pd.to_datetime(["2023-01-01", "2023-01-05"]),
+        ),
+        pd.DataFrame(
+            [[1, 2]], columns=pd.timedelta_range("1h", periods=2, freq="30min")
+        ),
+    ],
+)
+def test_encoding_pandas_v3(df: pd.DataFrame) -> None:
+    json_str = json.dumps(pl.to_json(df, df_encoding_version=3), allow_nan=False)
+    deserialized_df = cast(pd.DataFrame, pl.from_json(json.loads(json_str)))
+
+    # Unlike version 2, all types are preserved, and assert_frame_equal() also
+    # checks the frequency of date time indexes.
+    pd.testing.assert_frame_equal(deserialized_df, df)
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        pd.DataFrame({"when": pd.Series([pd.Timestamp("2023"), "x"], dtype=object)}),
+        pd.DataFrame({"when": pd.period_range("2023", periods=2, freq="M")}),
+        pd.DataFrame({"when": pd.interval_range(0, 2)}),
+        pd.DataFrame({"x": [1, 2]}, index=pd.period_range("2023", periods=2)),
+    ],
+)
+def test_encoding_pandas_v3_unsupported_values(df: pd.DataFrame) -> None:
+    with pytest.raises(ValueError, match="can't be encoded as dataframe_v3"):
+        pl.to_json(df, df_encoding_version=3)
+
+
 @pytest.mark.parametrize(
     "df",
     lazy_fixture(["city_dataframe", "breast_cancer_dataframe", "r_types_dataframe"]),
@@ -146,13 +203,17 @@ def test_set_score_data(
         np.array([[1, 2], [3, 4]], dtype=complex),
         np.array([[1, "stuff"], [3, None]], dtype=object),
         np.ones((2, 3, 4), dtype=np.int16),
+        np.array([True, False]),
+        np.array(2.5),
     ],
 )
-def test_numpy_serialization(numpy_object: Any) -> None:
+@pytest.mark.parametrize("np_encoding_version", [2, 3])
+def test_numpy_serialization(numpy_object: Any, np_encoding_version: int) -> None:
     """Test equality after conversion of various numpy objects."""
 
     json_object = json.dumps(
-        pl.to_json(numpy_object, np_encoding_version=2), allow_nan=False
+        pl.to_json(numpy_object, np_encoding_version=np_encoding_version),
+        allow_nan=False,
     )
     decoded_json_object = pl.from_json(json.loads(json_object))
 
@@ -160,6 +221,32 @@ def test_numpy_serialization(numpy_object: Any) -> None:
     np.testing.assert_array_equal(numpy_object, decoded_json_object, strict=True)
 
 
+@pytest.mark.parametrize(
+    "numpy_object, compression",
+    [
+        (np.arange(10).reshape(2, 5), None),
+        (np.zeros((0, 3)), None),
+        (np.zeros((100, 100)), "zlib"),
+        (np.random.default_rng(0).random((100, 100)), None),
+        (np.arange(2000, dtype=">i4"), "zlib"),
+        (np.full((50, 50), 1 - 2j), "zlib"),
+    ],
+)
+def test_numpy_serialization_v3(numpy_object: Any, compression: Optional[str]) -> None:
+    encoded = pl.to_json(numpy_object, np_encoding_version=3)
+    assert encoded["_type"] == "ndarray_v3"
+    assert encoded["_shape"] == list(numpy_object.shape)
+    assert encoded.get("_compression") == compression
+
+    decoded = pl.from_json(json.loads(json.dumps(encoded)))
+    np.testing.assert_array_equal(decoded, numpy_object)
+    assert decoded.dtype == numpy_object.dtype.newbyteorder("=")
+
+    # Decoded arrays can be modified.
+    decoded[...] = 1
+    assert np.all(decoded == 1)
+
+
 @pytest.mark.parametrize(
     "object_to_encode, expected_result",
     [(np.float64(5.0), 5.0), (np.complex128("12+3j"), complex("12+3j"))],
@@ -307,6 +394,193 @@ def test_grade_answer_parametrized_key_error_blank(
     assert question_data["format_errors"][question_name] == "No answer was submitted"
 
 
+@pytest.mark.parametrize(
+    "get_correct_mask, is_correct_scalar",
+    [
+        (pl.get_correct_mask_ndarray2D_sf, pl.is_correct_scalar_sf),
+        (pl.get_correct_mask_ndarray2D_dd, pl.is_correct_scalar_dd),
+    ],
+)
+@pytest.mark.parametrize("digits", [1, 2, 4])
+def test_get_correct_mask_ndarray2D(
+    get_correct_mask: Callable[[Any, Any, int], np.ndarray],
+    is_correct_scalar: Callable[[Any, Any, int], Any],
+    digits: int,
+) -> None:
+    a_tru = np.array(
+        [
+            [0.0, 1.0, -123.456, 0.001234],
+            [5e7, 3 + 4j, -0.5j, 9.999],
+        ]
+    )
+    for a_sub in [
+        a_tru,
+        np.round(a_tru, 2),
+        a_tru * 1.004,
+        a_tru + 0.01,
+        np.conj(a_tru),
+        np.zeros(a_tru.shape),
+    ]:
+        mask = get_correct_mask(a_sub, a_tru, digits)
+        expected = [
+            [
+                bool(is_correct_scalar(a_sub[i, j], a_tru[i, j], digits))
+                for j in range(4)
+            ]
+            for i in range(2)
+        ]
+        assert mask.tolist() == expected
+
+
+def test_is_correct_ndarray2D() -> None:
+    a_tru = np.array([[1.0, 2.0], [3.0, 4.0]])
+    a_sub = np.array([[1.0, 2.0], [3.0, 4.2]])
+
+    assert pl.is_correct_ndarray2D_sf(a_tru, a_tru, 2)
+    assert not pl.is_correct_ndarray2D_sf(a_sub, a_tru, 2)
+    assert pl.is_correct_ndarray2D_sf(a_sub, a_tru, 1)
+    assert pl.is_correct_ndarray2D_dd(a_tru, a_tru, 2)
+    assert not pl.is_correct_ndarray2D_dd(a_sub, a_tru, 2)
+    assert pl.get_correct_mask_ndarray2D_ra(a_sub, a_tru).tolist() == [
+        [True, True],
+        [True, False],
+    ]
+
+
+@pytest.mark.parametrize(
+    "s, expected, format_type",
+    [
+        ("[1 2 3; 4 5 6]", [[1, 2, 3], [4, 5, 6]], "matlab"),
+        ("[ 1, 2,3 ;4 ,5 6 ]", [[1, 2, 3], [4, 5, 6]], "matlab"),
+        ("[1.5e3 -2; 0 inf]", None, None),
+        ("[[1, 2], [3, 4]]", [[1, 2], [3, 4]], "python"),
+        ("[[1 + 2j, 3], [-4j, 5 - 6j]]", [[1 + 2j, 3], [-4j, 5 - 6j]], "python"),
+        ("[1+2j 3; -4j 5-6j]", [[1 + 2j, 3], [-4j, 5 - 6j]], "matlab"),
+    ],
+)
+def test_string_to_2darray(
+    s: str, expected: Optional[list], format_type: Optional[str]
+) -> None:
+    A, info = pl.string_to_2darray(s)
+    if expected is None:
+        assert A is None
+        assert "format_error" in info
+    else:
+        assert A is not None
+        assert A.tolist() == expected
+        assert info == {"format_type": format_type}
+
+
+@pytest.mark.parametrize(
+    "s, format_error",
+    [
+        (
+            "[1 2; 3 x]",
+            'Entry <code class="user-output-invalid">x</code> at location (row=2, column=2) in the matrix has an invalid format.',
+        ),
+        (
+            "[[1, 2], [3, x]]",
+            'Entry <code class="user-output-invalid"> x</code> at location (row=2, column=2) of the matrix has an invalid format.',
+        ),
+        (
+            "[[1, ], [3, 4]]",
+            "Entry at location (row=1, column=2) in the matrix is empty.",
+        ),
+        ("[1 2; 3]", "Rows 1 and 2 of the matrix have a different number of columns."),
+    ],
+)
+def test_string_to_2darray_format_error(s: str, format_error: str) -> None:
+    A, info = pl.string_to_2darray(s)
+    assert A is None
+    assert info == {"format_error": format_error}
+
+
+@pytest.mark.parametrize(
+    "language, presentation_type, expected",
+    [
+        ("python", "f", "[[1.00, -2.50], [0.00, 1234.57]]"),
+        ("python", "sigfig", "[[1.0, -2.5], [0.0, 1.2e3]]"),
+        ("matlab", "f", "[1.00 -2.50; 0.00 1234.57]"),
+        ("matlab", "sigfig", "[1.0 -2.5; 0.0 1.2e3]"),
+        ("mathematica", "e", "{{1.00e+00, -2.50e+00}, {0.00e+00, 1.23e+03}}"),
+        (
+            "r",
+            "f",
+            "matrix(c(1.00, -2.50, 0.00, 1234.57), nrow = 2, ncol = 2, byrow = TRUE)",
+        ),
+        ("sympy", "f", "Matrix([[1.00, -2.50], [0.00, 1234.57]])"),
+    ],
+)
+def test_string_from_numpy(
+    language: str, presentation_type: str, expected: str
+) -> None:
+    A = np.array([[1.0, -2.5], [0.0, 1234.5678]])
+    assert pl.string_from_numpy(A, language, presentation_type) == expected
+
+
+@pytest.mark.parametrize("language", ["python", "matlab"])
+def test_string_from_numpy_complex(language: str) -> None:
+    A = np.array([1 + 2j, -0.5j])
+    assert pl.string_from_numpy(A, language) == "[1.00+2.00j, -0.00-0.50j]"
+    assert pl.string_from_numpy(A, language, "sigfig") == "[1.0+2.0j, 0.0-0.50j]"
+
+
+def test_parse_quantity() -> None:
+    ureg = pl.get_unit_registry()
+    assert pl.get_unit_registry() is ureg
+
+    quantity = pl.parse_quantity(ureg, "9.81 m/s^2")
+    assert quantity == ureg.Quantity("9.81 m/s^2")
+
+    # Modifying a parsed quantity doesn't affect the next caller.
+    quantity.ito("ft/s^2")
+    assert str(pl.parse_quantity(ureg, "9.81 m/s^2").units) == "meter / second ** 2"
+
+    # Quantities are parsed again after the registry changes.
+    ureg.case_sensitive = False
+    try:
+        assert str(pl.parse_quantity(ureg, "2 METER").units) == "meter"
+    finally:
+        ureg.case_sensitive = True
+    with pytest.raises(pint.errors.UndefinedUnitError):
+        pl.parse_quantity(ureg, "2 METER")
+    assert pl.get_unit_registry() is ureg
+
+    # Changes to the registry don't reach later callers.
+    ureg.define("smoot = 1.7018 m")
+    assert pl.parse_quantity(ureg, "2 smoot") == ureg.Quantity("3.4036 m")
+    other = pl.get_unit_registry()
+    assert other is not ureg
+    assert pl.get_unit_registry() is other
+    with pytest.raises(pint.errors.UndefinedUnitError):
+        pl.parse_quantity(other, "2 smoot")
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda ureg: setattr(ureg, "default_system", "imperial"),
+        lambda ureg: setattr(ureg, "default_format", "~P"),
+        lambda ureg: setattr(ureg, "auto_reduce_dimensions", True),
+        lambda ureg: ureg.enable_contexts("sp"),
+    ],
+)
+def test_get_unit_registry_settings(change: Callable[[Any], None]) -> None:
+    ureg = pl.get_unit_registry()
+    assert pl.get_unit_registry() is ureg
+
+    # Contexts that are only enabled temporarily don't change the registry.
+    with ureg.context("sp"):
+        pass
+    assert pl.get_unit_registry() is ureg
+
+    change(ureg)
+    other = pl.get_unit_registry()
+    assert other is not ureg
+    quantity = pl.parse_quantity(other, "1 m/s")
+    assert str(quantity.to_base_units()) == "1.0 meter / second"
+
+
 @pytest.mark.repeat(100)
 def test_get_uuid() -> None:
     """Test basic properties of the pl.get_uuid() function."""
@@ -0,0 +1,175 @@
+# This module handles preloading modules in the zygote before it forks any
+# workers. Anything imported here is inherited by every worker copy-on-write,
+# so question and element code doesn't pay the import cost on each call. The
+# trade-off is memory: every preloaded module increases the size of the zygote.
+#
+# The default set of modules can be extended (or replaced) with a JSON manifest
+# whose path is given by the `PRELOAD_MANIFEST` environment variable:
+#
+#     {
+#         "include_defaults": true,
+#         "modules": ["scipy", "sympy.parsing.sympy_parser", "pandas"],
+#         "warmups": ["some_module:some_function"]
+#     }
+#
+# Additional modules can also be listed in the `PRELOAD_MODULES` environment
+# variable, separated by commas. Warmups are callables (given as
+# `module:function`) that are called without arguments after all modules have
+# been imported, e.g. to construct expensive objects ahead of time.
+#
+# Courses can list modules of their own (usually from `serverFilesCourse`) and
+# warmups in `serverFilesCourse/preload.json`, using the same format without
+# `include_defaults`. These are preloaded in a separate zygote for the course
+# that is forked from the base zygote; see `zygote.py`.
+#
+# Each module and warmup is timed, and the RSS growth of the process is
+# recorded. The resulting report can be written as JSON to the file given by
+# the `PRELOAD_REPORT_PATH` environment variable.
+
+import importlib
+import json
+import os
+import sys
+import time
+import traceback
+from typing import Literal, Mapping, Optional, TypedDict
+
+import psutil
+
+
+class PreloadManifest(TypedDict):
+    modules: list[str]
+    warmups: list[str]
+
+
+class PreloadReportEntry(TypedDict):
+    name: str
+    kind: Literal["module", "warmup"]
+    seconds: float
+    rss_delta_bytes: int
+    error: Optional[str]
+
+
+DEFAULT_MANIFEST: PreloadManifest = {
+    "modules": [
+        "html",
+        "math",
+        "random",
+        "chevron",
+        "lxml.html",
+        "matplotlib",
+        "matplotlib.font_manager",
+        "nltk",
+        "numpy",
+        "pint",
+        "prairielearn",
+        "sklearn",
+    ],
+    "warmups": [
+        # Construct the shared unit registry so that workers inherit it.
+        "prairielearn:get_unit_registry",
+    ],
+}
+
+
+def _dedupe(names: list[str]) -> list[str]:
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def load_manifest(env: Mapping[str, str]) -> PreloadManifest:
+    """
+    Builds the manifest to preload from the default manifest and the
+    `PRELOAD_MANIFEST` and `PRELOAD_MODULES` environment variables.
+    """
+    modules = list(DEFAULT_MANIFEST["modules"])
+    warmups = list(DEFAULT_MANIFEST["warmups"])
+
+    manifest_path = env.get("PRELOAD_MANIFEST")
+    if manifest_path:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if not manifest.get("include_defaults", True):
+            modules = []
+            warmups = []
+        modules.extend(manifest.get("modules", []))
+        warmups.extend(manifest.get("warmups", []))
+
+    modules.extend(name.strip() for name in env.get("PRELOAD_MODULES", "").split(","))
+
+    return {"modules": _dedupe(modules), "warmups": _dedupe(warmups)}
+
+
+def get_course_manifest_path(course_path: str) -> str:
+    return os.path.join(
+        os.path.abspath(course_path), "serverFilesCourse", "preload.json"
+    )
+
+
+def load_course_manifest(course_path: str) -> PreloadManifest:
+    """
+    Builds the manifest to preload for the given course. Courses without a
+    manifest don't preload anything beyond the default manifest.
+    """
+    try:
+        with open(get_course_manifest_path(course_path), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"modules": [], "warmups": []}
+
+    return {
+        "modules": _dedupe(manifest.get("modules", [])),
+        "warmups": _dedupe(manifest.get("warmups", [])),
+    }
+
+
+def _run_warmup(spec: str) -> None:
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError(f'Warmup "{spec}" must be of the form module:function')
+    getattr(importlib.import_module(module_name), function_name)()
+
+
+def preload(manifest: PreloadManifest) -> list[PreloadReportEntry]:
+    """
+    Imports every module and runs every warmup in the manifest, returning how
+    long each one took and how much it grew the process. Failures are recorded
+    in the report and printed to stderr instead of being raised so that one bad
+    entry doesn't prevent the zygote from starting.
+    """
+    process = psutil.Process()
+    report: list[PreloadReportEntry] = []
+
+    def run(name: str, kind: Literal["module", "warmup"]) -> None:
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+        error = None
+        try:
+            if kind == "module":
+                importlib.import_module(name)
+            else:
+                _run_warmup(name)
+        except Exception:
+            error = traceback.format_exc()
+            print(f'Error preloading {kind} "{name}":', file=sys.stderr)
+            traceback.print_exc()
+        report.append(
+            {
+                "name": name,
+                "kind": kind,
+                "seconds": time.perf_counter() - start,
+                "rss_delta_bytes": process.memory_info().rss - rss_before,
+                "error": error,
+            }
+        )
+
+    for module_name in manifest["modules"]:
+        run(module_name, "module")
+    for warmup in manifest["warmups"]:
+        run(warmup, "warmup")
+
+    return report
+
+
+def write_report(report: list[PreloadReportEntry], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+import pytest
+from preload import DEFAULT_MANIFEST, load_course_manifest, load_manifest, preload
+
+
+def test_load_manifest_defaults() -> None:
+    assert load_manifest({}) == DEFAULT_MANIFEST
+
+
+def test_load_manifest_from_file_and_env(tmp_path: Path) -> None:
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(
+        json.dumps({"modules": ["scipy", "numpy"], "warmups": ["json:loads"]})
+    )
+
+    manifest = load_manifest(
+        {"PRELOAD_MANIFEST": str(manifest_path), "PRELOAD_MODULES": "sympy, pandas,"}
+    )
+
+    assert manifest["modules"] == [
+        *DEFAULT_MANIFEST["modules"],
+        "scipy",
+        "sympy",
+        "pandas",
+    ]
+    assert manifest["warmups"] == [*DEFAULT_MANIFEST["warmups"], "json:loads"]
+
+
+def test_load_manifest_without_defaults(tmp_path: Path) -> None:
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(
+        json.dumps({"include_defaults": False, "modules": ["numpy"]})
+    )
+
+    assert load_manifest({"PRELOAD_MANIFEST": str(manifest_path)}) == {
+        "modules": ["numpy"],
+        "warmups": [],
+    }
+
+
+def test_preload_report(capsys: pytest.CaptureFixture[str]) -> None:
+    report = preload(
+        {
+            "modules": ["json", "this_module_does_not_exist"],
+            "warmups": ["gc:collect", "gc"],
+        }
+    )
+
+    assert [(entry["name"], entry["kind"]) for entry in report] == [
+        ("json", "module"),
+        ("this_module_does_not_exist", "module"),
+        ("gc:collect", "warmup"),
+        ("gc", "warmup"),
+    ]
+    assert all(entry["seconds"] >= 0 for entry in report)
+    assert report[0]["error"] is None
+    assert "ModuleNotFoundError" in (report[1]["error"] or "")
+    assert report[2]["error"] is None
+    assert "must be of the form module:function" in (report[3]["error"] or "")
+
+    stderr = capsys.readouterr().err
+    assert 'Error preloading module "this_module_does_not_exist"' in stderr
+    assert 'Error preloading warmup "gc"' in stderr
+    assert 'preloading module "json"' not in stderr
+
+
+def test_load_course_manifest(tmp_path: Path) -> None:
+    assert load_course_manifest(str(tmp_path)) == {"modules": [], "warmups": []}
+
+    (tmp_path / "serverFilesCourse").mkdir()
+    (tmp_path / "serverFilesCourse" / "preload.json").write_text(
+        json.dumps({"modules": ["course_lib", "scipy", "course_lib"]})
+    )
+
+    assert load_course_manifest(str(tmp_path)) == {
+        "modules": ["course_lib", "scipy"],
+        "warmups": [],
+    }
@@ -1,12 +1,28 @@
 import ast
 import builtins
-import copy
+import contextlib
+import functools
+import math
+import signal
+import threading
+import time
 import types
 from collections import deque
 from dataclasses import dataclass
 from tokenize import TokenError
-from typing import Any, Callable, Literal, Optional, Type, TypedDict, Union, cast
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    Type,
+    TypedDict,
+    Union,
+    cast,
+)
 
+import numpy as np
 import sympy
 from sympy.parsing.sympy_parser import (
     eval_expr,
@@ -110,6 +126,59 @@ class _Constants:
         }
 
 
+# Shared instance for the functions below, which only read from it or copy it.
+_CONSTANTS = _Constants()
+
+
+def _get_global_dict() -> dict[str, Any]:
+    # Based on code here:
+    # https://github.com/sympy/sympy/blob/26f7bdbe3f860e7b4492e102edec2d6b429b5aaf/sympy/parsing/sympy_parser.py#L1086
+    global_dict: dict[str, Any] = {}
+    exec("from sympy import *", global_dict)
+
+    builtins_dict = vars(builtins)
+    for name, obj in builtins_dict.items():
+        if isinstance(obj, types.BuiltinFunctionType):
+            global_dict[name] = obj
+
+    return global_dict
+
+
+# The globals for evaluating expressions. These are built once, since importing
+# everything from sympy is slow. Only expressions that pass `ast_check()` are
+# evaluated with them, so they can't be modified.
+_GLOBAL_DICT = _get_global_dict()
+
+_TRANSFORMATIONS = standard_transformations + (implicit_multiplication_application,)
+
+# Names that appear in expressions after sympy stringification.
+_STRINGIFIED_FUNCTIONS: SympyMapT = {
+    "Integer": sympy.Integer,
+    "Symbol": sympy.Symbol,
+    "Float": sympy.Float,
+}
+_STRINGIFIED_VARIABLES: SympyMapT = {
+    "I": sympy.I,
+    "oo": sympy.oo,
+}
+
+# The number of parsed expressions that `convert_string_to_sympy_with_source()`
+# keeps around.
+PARSE_CACHE_SIZE = 512
+
+# Defaults for the numeric comparison in `is_equivalent()`.
+NUMERIC_CHECK_SAMPLES = 20
+NUMERIC_CHECK_RTOL = 1e-6
+NUMERIC_CHECK_ATOL = 1e-10
+
+# Limits on the expressions that are evaluated, and on the time spent evaluating
+# and comparing them (in seconds). See the comment below.
+MAX_AST_NODES = 5000
+MAX_NUMBER_DIGITS = 1000
+EVALUATE_TIME_LIMIT = 1.0
+COMPARISON_TIME_LIMIT = 2.0
+
+
 # Safe evaluation of user input to convert from string to sympy expression.
 #
 # Adapted from:
@@ -133,10 +202,15 @@ class _Constants:
 # http://blog.delroth.net/2013/03/escaping-a-python-sandbox-ndh-2013-quals-writeup/
 #
 # Another class of attacks is those that try and consume excessive
-# memory or CPU (e.g., `10**100**100`). We handle these attacks by the
-# fact that the entire element code runs in an isolated subprocess, so
-# this type of input will be caught and treated as a question code
-# failure.
+# memory or CPU (e.g., `10**100**100`). Before evaluating an expression,
+# `ast_check()` rejects expressions with more than `MAX_AST_NODES` nodes,
+# and powers or factorials of numbers whose result could have more than
+# `MAX_NUMBER_DIGITS` digits. These are computed by Python's integer
+# arithmetic, which can't be interrupted. Everything else that sympy does
+# is Python code, so evaluating and comparing expressions is interrupted by
+# `time_limit()` if it takes too long. All of these are reported as format
+# errors instead of tying up the worker, which the isolated subprocess that
+# runs the element code would otherwise only stop by killing it.
 #
 # Other approaches for safe(r) eval in Python are:
 #
@@ -219,6 +293,71 @@ class HasInvalidSymbolError(BaseSympyError):
     symbol: str
 
 
+class HasLargeExpressionError(BaseSympyError):
+    pass
+
+
+@dataclass
+class HasLargeNumberError(BaseSympyError):
+    offset: int
+
+
+class HasTimeoutError(BaseSympyError):
+    pass
+
+
+# Feedback for a HasTimeoutError while checking a submitted answer, and while
+# grading it against the correct answer.
+EVALUATION_TIMEOUT_MESSAGE = (
+    "Your answer took too long to evaluate. Simplify it and try again."
+)
+COMPARISON_TIMEOUT_MESSAGE = (
+    "Your answer took too long to compare with the correct answer. "
+    "Simplify it and try again."
+)
+
+
+@contextlib.contextmanager
+def time_limit(seconds: float) -> Iterator[None]:
+    """
+    Raises HasTimeoutError in the block if it runs for longer than seconds.
+    This uses SIGALRM, so the block is only limited in the main thread, and
+    not while it's running code that doesn't release the GIL. The alarm is
+    repeated until the block exits, in case the code in it catches the error.
+    An enclosing time limit that expires first is left to expire, and any other
+    is restored afterwards, with the time it has left and its repeat interval.
+    """
+    if threading.current_thread() is not threading.main_thread() or not hasattr(
+        signal, "setitimer"
+    ):
+        yield
+        return
+
+    outer_remaining, outer_interval = signal.getitimer(signal.ITIMER_REAL)
+    if outer_remaining and outer_remaining <= seconds:
+        yield
+        return
+
+    def on_timeout(signum: int, frame: Any) -> None:
+        raise HasTimeoutError()
+
+    start = time.monotonic()
+    old_handler = signal.signal(signal.SIGALRM, on_timeout)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, seconds, 0.05)
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+        if outer_remaining:
+            elapsed = time.monotonic() - start
+            signal.setitimer(
+                signal.ITIMER_REAL,
+                max(outer_remaining - elapsed, 1e-6),
+                outer_interval,
+            )
+
+
 class CheckWhiteList(ast.NodeVisitor):
     def __init__(self, whitelist: ASTWhiteListT) -> None:
         self.whitelist = whitelist
@@ -255,6 +394,59 @@ class CheckVariables(ast.NodeVisitor):
         self.generic_visit(node)
 
 
+class CheckNumberSize(ast.NodeVisitor):
+    """
+    Returns an upper bound on the number of digits of the value of each node,
+    where variables and functions other than factorial count as 1. Nodes with
+    more than `MAX_NUMBER_DIGITS` digits are rejected.
+    """
+
+    def __init__(self, functions: SympyMapT) -> None:
+        self.functions = functions
+
+    def visit(self, node: ast.AST) -> float:
+        digits = super().visit(node)
+        if digits > MAX_NUMBER_DIGITS:
+            err_node = get_parent_with_location(node)
+            raise HasLargeNumberError(err_node.col_offset)
+        return digits
+
+    def generic_visit(self, node: ast.AST) -> float:
+        return max(map(self.visit, ast.iter_child_nodes(node)), default=0.0)
+
+    def visit_Constant(self, node: ast.Constant) -> float:
+        try:
+            value = abs(float(node.value))
+        except (TypeError, ValueError):
+            return 0.0
+        except OverflowError:
+            return math.inf
+        return math.log10(value) if value > 1 else 0.0
+
+    def visit_BinOp(self, node: ast.BinOp) -> float:
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if isinstance(node.op, ast.Pow):
+            return left * 10 ** min(right, 308) if left else 0.0
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            larger, smaller = max(left, right), min(left, right)
+            return larger + math.log10(1 + 10 ** (smaller - larger))
+        if isinstance(node.op, (ast.Mult, ast.Div)):
+            return left + right
+        return max(left, right)
+
+    def visit_Call(self, node: ast.Call) -> float:
+        digits = self.generic_visit(node)
+        if (
+            isinstance(node.func, ast.Name)
+            and self.functions.get(node.func.id) is sympy.factorial
+        ):
+            # Stirling's approximation is an upper bound for n! with n >= 1
+            n = 10 ** min(digits, 308)
+            return (n + 0.5) * math.log10(n) - n / math.log(10) + 1
+        return digits
+
+
 def is_name_of_function(node: ast.AST) -> bool:
     # The node is the name of a function if all of the following are true:
     # 1) it has type ast.Name
@@ -289,10 +481,16 @@ def ast_check(expr: str, locals_for_eval: LocalsForEval) -> None:
         raise HasParseError(offset)
 
     # Link each node to its parent
+    num_nodes = 0
     for node in ast.walk(root):
+        num_nodes += 1
         for child in ast.iter_child_nodes(node):
             child.parent = node  # type: ignore
 
+    # Disallow expressions that are too long to evaluate quickly
+    if num_nodes > MAX_AST_NODES:
+        raise HasLargeExpressionError()
+
     # Disallow functions that are not in locals_for_eval
     CheckFunctions(locals_for_eval["functions"]).visit(root)
 
@@ -330,6 +528,9 @@ def ast_check(expr: str, locals_for_eval: LocalsForEval) -> None:
 
     CheckWhiteList(whitelist).visit(root)
 
+    # Disallow numbers that are too large to compute
+    CheckNumberSize(locals_for_eval["functions"]).visit(root)
+
 
 def sympy_check(
     expr: sympy.Expr, locals_for_eval: LocalsForEval, allow_complex: bool
@@ -373,54 +574,37 @@ def evaluate_with_source(
         for k, v in cast(SympyMapT, inner_dict).items()
     }
 
-    # Based on code here:
-    # https://github.com/sympy/sympy/blob/26f7bdbe3f860e7b4492e102edec2d6b429b5aaf/sympy/parsing/sympy_parser.py#L1086
-
-    global_dict = {}
-    exec("from sympy import *", global_dict)
-
-    builtins_dict = vars(builtins)
-    for name, obj in builtins_dict.items():
-        if isinstance(obj, types.BuiltinFunctionType):
-            global_dict[name] = obj
-
-    transformations = standard_transformations + (implicit_multiplication_application,)
-
     try:
-        code = stringify_expr(expr, local_dict, global_dict, transformations)
+        code = stringify_expr(expr, local_dict, _GLOBAL_DICT, _TRANSFORMATIONS)
     except TokenError:
         raise HasParseError(-1)
 
-    # First do AST check, mainly for security
-    parsed_locals_to_eval = copy.deepcopy(locals_for_eval)
-
-    # Add locals that appear after sympy stringification
-    # This check is only for safety, so won't change what gets parsed
-    parsed_locals_to_eval["functions"].update(
-        {
-            "Integer": sympy.Integer,
-            "Symbol": sympy.Symbol,
-            "Float": sympy.Float,
-        }
-    )
-
-    parsed_locals_to_eval["variables"].update(
-        {
-            "I": sympy.I,
-            "oo": sympy.oo,
-        }
-    )
+    # First do AST check, mainly for security. Add locals that appear after
+    # sympy stringification. This check is only for safety, so won't change what
+    # gets parsed.
+    parsed_locals_to_eval: LocalsForEval = {
+        "functions": {**locals_for_eval["functions"], **_STRINGIFIED_FUNCTIONS},
+        "variables": {**locals_for_eval["variables"], **_STRINGIFIED_VARIABLES},
+        "helpers": locals_for_eval["helpers"],
+    }
 
-    ast_check(code, parsed_locals_to_eval)
+    try:
+        ast_check(code, parsed_locals_to_eval)
+    except RecursionError:
+        # Deeply nested expressions are too long to parse or check
+        raise HasLargeExpressionError()
 
     # Now that it's safe, get sympy expression
-    try:
-        res = eval_expr(code, local_dict, global_dict)
-    except Exception:
-        raise BaseSympyError()
+    with time_limit(EVALUATE_TIME_LIMIT):
+        try:
+            res = eval_expr(code, local_dict, _GLOBAL_DICT)
+        except HasTimeoutError:
+            raise
+        except Exception:
+            raise BaseSympyError()
 
-    # Finally, check for invalid symbols
-    sympy_check(res, locals_for_eval, allow_complex=allow_complex)
+        # Finally, check for invalid symbols
+        sympy_check(res, locals_for_eval, allow_complex=allow_complex)
 
     return res, code
 
@@ -456,13 +640,61 @@ def convert_string_to_sympy_with_source(
     custom_functions: Optional[list[str]] = None,
     assumptions: Optional[AssumptionsDictT] = None,
 ) -> tuple[sympy.Expr, str]:
-    const = _Constants()
+    """
+    Parses expr as a sympy expression, returning it and the code that was
+    evaluated to get it. The same expressions are often parsed in several
+    phases (and by several elements), so the most recently parsed ones are
+    cached; see `parse_cache_info()`.
+    """
+    return _convert_string_to_sympy_with_source(
+        expr,
+        None if variables is None else tuple(variables),
+        allow_hidden,
+        allow_complex,
+        allow_trig_functions,
+        None if custom_functions is None else tuple(custom_functions),
+        None
+        if assumptions is None
+        else tuple(
+            (variable, tuple(variable_assumptions.items()))
+            for variable, variable_assumptions in assumptions.items()
+        ),
+    )
+
+
+def parse_cache_info() -> "functools._CacheInfo":
+    """
+    Returns the hits, misses and size of the cache of parsed expressions used by
+    `convert_string_to_sympy_with_source()`.
+    """
+    return _convert_string_to_sympy_with_source.cache_info()
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _convert_string_to_sympy_with_source(
+    expr: str,
+    variables: Optional[tuple[str, ...]],
+    allow_hidden: bool,
+    allow_complex: bool,
+    allow_trig_functions: bool,
+    custom_functions: Optional[tuple[str, ...]],
+    frozen_assumptions: Optional[tuple[tuple[str, tuple[tuple[str, Any], ...]], ...]],
+) -> tuple[sympy.Expr, str]:
+    const = _CONSTANTS
+    assumptions = (
+        None
+        if frozen_assumptions is None
+        else {
+            variable: dict(variable_assumptions)
+            for variable, variable_assumptions in frozen_assumptions
+        }
+    )
 
     # Create a whitelist of valid functions and variables (and a special flag
     # for numbers that are converted to sympy integers).
     locals_for_eval: LocalsForEval = {
-        "functions": const.functions,
-        "variables": const.variables,
+        "functions": dict(const.functions),
+        "variables": dict(const.variables),
         "helpers": const.helpers,
     }
 
@@ -535,7 +767,7 @@ def point_to_error(expr: str, ind: int, w: int = 5) -> str:
 def sympy_to_json(
     a: sympy.Expr, *, allow_complex: bool = True, allow_trig_functions: bool = True
 ) -> SympyJson:
-    const = _Constants()
+    const = _CONSTANTS
 
     # Get list of variables in the sympy expression
     variables = list(map(str, a.free_symbols))
@@ -604,6 +836,165 @@ def json_to_sympy(
     )
 
 
+def _sample_symbol(
+    symbol: sympy.Symbol, rng: np.random.Generator, num_samples: int
+) -> Optional[np.ndarray]:
+    """
+    Returns random values for symbol that are consistent with its assumptions,
+    or None if this function doesn't know how to satisfy them.
+    """
+    if symbol.is_integer:
+        values = rng.integers(1, 10, num_samples).astype(np.float64)
+    else:
+        values = rng.uniform(0.5, 2.0, num_samples)
+
+    if symbol.is_negative or symbol.is_nonpositive:
+        values = -values
+    elif not (symbol.is_positive or symbol.is_nonnegative):
+        values *= rng.choice([-1.0, 1.0], num_samples)
+
+    for value in values:
+        number = sympy.Integer(int(value)) if symbol.is_integer else sympy.Float(value)
+        for assumption, expected in symbol.assumptions0.items():
+            if getattr(number, f"is_{assumption}") != expected:
+                return None
+
+    # Symbols that aren't known to be real are evaluated with complex numbers,
+    # so that e.g. the logarithm of a negative number is defined.
+    if not symbol.is_real:
+        values = values.astype(np.complex128)
+
+    return values
+
+
+def _replace_custom_functions(
+    expressions: list[sympy.Expr], rng: np.random.Generator
+) -> Optional[list[sympy.Expr]]:
+    """
+    Replaces every undefined function, such as the custom functions of
+    `pl-symbolic-input`, with the same random function in all expressions.
+    """
+    functions = set().union(
+        *(
+            expression.atoms(sympy.core.function.AppliedUndef)
+            for expression in expressions
+        )
+    )
+    replacements = {}
+    for function in sorted({f.func for f in functions}, key=str):
+        arities = {len(f.args) for f in functions if f.func == function}
+        if len(arities) != 1:
+            return None
+        args = sympy.symbols(f"_u0:{arities.pop()}")
+        coefficients = rng.uniform(0.5, 2.0, len(args) + 1)
+        replacements[function] = sympy.Lambda(
+            args,
+            sympy.sin(
+                sympy.Float(coefficients[-1])
+                + sum(sympy.Float(c) * arg for c, arg in zip(coefficients, args))
+            )
+            + sympy.Float(coefficients[0]),
+        )
+    return [expression.subs(replacements) for expression in expressions]
+
+
+def _is_mismatch(a_value: complex, b_value: complex, rtol: float, atol: float) -> bool:
+    return abs(a_value - b_value) > atol + rtol * max(abs(a_value), abs(b_value))
+
+
+def is_numerically_different(
+    a: sympy.Expr,
+    b: sympy.Expr,
+    *,
+    num_samples: int = NUMERIC_CHECK_SAMPLES,
+    rtol: float = NUMERIC_CHECK_RTOL,
+    atol: float = NUMERIC_CHECK_ATOL,
+) -> bool:
+    """
+    Returns True if a and b evaluate to different values at a random point
+    that is consistent with the assumptions on their symbols, which proves
+    that they are not equal. Returns False if no such point was found, which
+    is inconclusive.
+
+    The points are evaluated in bulk with numpy. A mismatch is then confirmed
+    at higher precision, so rounding errors can't make equal expressions
+    different. The random points only depend on the expressions, so the
+    result is always the same for the same expressions.
+    """
+    rng = np.random.default_rng(0)
+    symbols = sorted(a.free_symbols | b.free_symbols, key=str)
+
+    samples = []
+    for symbol in symbols:
+        values = _sample_symbol(symbol, rng, num_samples)
+        if values is None:
+            return False
+        samples.append(values)
+
+    expressions = _replace_custom_functions([a, b], rng)
+    if expressions is None:
+        return False
+
+    try:
+        with np.errstate(all="ignore"):
+            evaluated = sympy.lambdify(symbols, expressions, modules="numpy")(*samples)
+            a_values, b_values = (
+                np.broadcast_to(np.asarray(values, dtype=np.complex128), num_samples)
+                for values in evaluated
+            )
+    except Exception:
+        return False
+
+    with np.errstate(all="ignore"):
+        finite = np.isfinite(a_values) & np.isfinite(b_values)
+        mismatches = finite & (
+            np.abs(a_values - b_values)
+            > atol + rtol * np.maximum(np.abs(a_values), np.abs(b_values))
+        )
+
+    for i in np.flatnonzero(mismatches)[:3]:
+        point = {
+            symbol: (
+                sympy.Integer(int(values[i]))
+                if symbol.is_integer
+                else sympy.Float(values[i].real, 30)
+            )
+            for symbol, values in zip(symbols, samples)
+        }
+        try:
+            a_value, b_value = (
+                complex(expression.evalf(30, subs=point)) for expression in expressions
+            )
+        except Exception:
+            continue
+        if _is_mismatch(a_value, b_value, rtol, atol):
+            return True
+
+    return False
+
+
+def is_equivalent(
+    a: sympy.Expr,
+    b: sympy.Expr,
+    *,
+    num_samples: int = NUMERIC_CHECK_SAMPLES,
+    rtol: float = NUMERIC_CHECK_RTOL,
+    atol: float = NUMERIC_CHECK_ATOL,
+) -> bool:
+    """
+    Returns whether a and b are equal, as decided by `a.equals(b)`. Symbolic
+    comparison can be very slow, so expressions that are numerically different
+    (see `is_numerically_different()`) are rejected without it. Raises
+    HasTimeoutError if the comparison takes longer than `COMPARISON_TIME_LIMIT`.
+    """
+    with time_limit(COMPARISON_TIME_LIMIT):
+        if is_numerically_different(
+            a, b, num_samples=num_samples, rtol=rtol, atol=atol
+        ):
+            return False
+        return a.equals(b) is True
+
+
 def validate_string_as_sympy(
     expr: str,
     variables: Optional[list[str]],
@@ -685,6 +1076,16 @@ def validate_string_as_sympy(
             f"<br><br><pre>{point_to_error(expr, err.offset)}</pre>"
             "Note that the location of the syntax error is approximate."
         )
+    except HasLargeExpressionError:
+        return "Your answer is too long. Simplify it and try again."
+    except HasLargeNumberError as err:
+        return (
+            f"Your answer contains a power or factorial that is too large to evaluate. "
+            f"<br><br><pre>{point_to_error(expr, err.offset)}</pre>"
+            "Note that the location of the error is approximate."
+        )
+    except HasTimeoutError:
+        return EVALUATION_TIMEOUT_MESSAGE
     except Exception:
         return "Invalid format."
 
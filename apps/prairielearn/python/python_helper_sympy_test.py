@@ -1,4 +1,6 @@
 import json
+import time
+import warnings
 from itertools import chain, repeat
 from typing import Any, Optional
 
@@ -32,6 +34,132 @@ def test_evaluate() -> None:
         phs.evaluate("eval('dict')", locals_for_eval=locals_for_eval)
 
 
+def test_convert_string_to_sympy_cache() -> None:
+    """Test that cached expressions depend on all of the arguments"""
+
+    hits = phs.parse_cache_info().hits
+    x = phs.convert_string_to_sympy("x + 1", ["x"])
+    assert phs.convert_string_to_sympy("x + 1", ["x"]) is x
+    assert phs.parse_cache_info().hits == hits + 1
+
+    positive_x = phs.convert_string_to_sympy(
+        "x + 1", ["x"], assumptions={"x": {"positive": True}}
+    )
+    assert positive_x != x
+    assert positive_x.free_symbols == {sympy.Symbol("x", positive=True)}
+
+    with pytest.raises(phs.HasInvalidSymbolError):
+        phs.convert_string_to_sympy("x + i", ["x"])
+    assert phs.convert_string_to_sympy("x + i", ["x"], allow_complex=True) == (
+        sympy.Symbol("x") + sympy.I
+    )
+
+
+@pytest.mark.parametrize(
+    "a, b, equivalent, different",
+    [
+        ("(x + 1)^2", "x^2 + 2*x + 1", True, False),
+        ("sin(x)^2 + cos(x)^2", "1", True, False),
+        ("f(x) + f(y)", "f(y) + f(x)", True, False),
+        ("exp(x) * exp(y)", "exp(x + y)", True, False),
+        ("x", "abs(x)", False, True),
+        ("sqrt(x^2)", "x", False, True),
+        ("log(x*y)", "log(x) + log(y)", False, True),
+        ("f(x)", "f(x) + 1", False, True),
+        ("f(x, y)", "f(y, x)", False, True),
+    ],
+)
+def test_is_equivalent(a: str, b: str, equivalent: bool, different: bool) -> None:
+    a_sympy, b_sympy = (
+        phs.convert_string_to_sympy(s, ["x", "y"], custom_functions=["f"])
+        for s in (a, b)
+    )
+    assert phs.is_numerically_different(a_sympy, b_sympy) == different
+    assert phs.is_equivalent(a_sympy, b_sympy) == equivalent
+
+
+def test_is_numerically_different_assumptions() -> None:
+    x = sympy.Symbol("x", positive=True)
+    n = sympy.Symbol("n", integer=True)
+
+    # These are only equal for the values allowed by the assumptions.
+    assert not phs.is_numerically_different(sympy.sqrt(x**2), x)
+    assert not phs.is_numerically_different(
+        sympy.cos(2 * sympy.pi * n), sympy.Integer(1)
+    )
+    assert phs.is_equivalent(sympy.sqrt(x**2), x)
+
+    # Assumptions that can't be sampled are inconclusive.
+    even = sympy.Symbol("m", even=True)
+    assert not phs.is_numerically_different((-1) ** even, sympy.Integer(1))
+
+
+def test_is_numerically_different_overflow() -> None:
+    x = sympy.Symbol("x")
+
+    # Samples that overflow on both sides are skipped without a warning.
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        assert not phs.is_numerically_different(
+            sympy.exp(10000 * x**2), sympy.exp(10000 * x**2) + 1
+        )
+
+
+@pytest.mark.parametrize("expr", ["2**1000", "factorial(400)", "n**(10**100)"])
+def test_large_number_allowed(expr: str) -> None:
+    assert phs.validate_string_as_sympy(expr, ["n"]) is None
+
+
+def test_time_limit() -> None:
+    with pytest.raises(phs.HasTimeoutError):
+        with phs.time_limit(0.01):
+            while True:
+                pass
+
+    # An outer limit is restored, and an outer limit that expires first wins
+    with pytest.raises(phs.HasTimeoutError):
+        with phs.time_limit(0.05):
+            with phs.time_limit(0.01):
+                pass
+            with phs.time_limit(10):
+                while True:
+                    pass
+
+    # The restored outer limit keeps repeating, in case the code catches it
+    with pytest.raises(phs.HasTimeoutError):
+        with phs.time_limit(0.05):
+            with phs.time_limit(0.01):
+                pass
+            try:
+                while True:
+                    pass
+            except phs.HasTimeoutError:
+                pass
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline:
+                pass
+
+
+def test_evaluate_time_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(phs, "EVALUATE_TIME_LIMIT", 1e-6)
+    monkeypatch.setattr(phs, "COMPARISON_TIME_LIMIT", 1e-6)
+    a = sympy.Symbol("x")
+
+    # Busy-wait inside the block, like a long sympy computation would
+    def slow_eval_expr(*args: Any) -> sympy.Expr:
+        while True:
+            pass
+
+    monkeypatch.setattr(phs, "eval_expr", slow_eval_expr)
+    with pytest.raises(phs.HasTimeoutError):
+        phs.evaluate("x + 1", {"variables": {"x": a}, "functions": {}, "helpers": {}})
+    assert "too long" in (phs.validate_string_as_sympy("n + 2", ["n"]) or "")
+
+    monkeypatch.setattr(phs, "is_numerically_different", slow_eval_expr)
+    with pytest.raises(phs.HasTimeoutError):
+        phs.is_equivalent(a, a + 1)
+
+
 class TestSympy:
     SYMBOL_NAMES = ["n", "m", "alpha"]
     M, N, ALPHA = sympy.symbols("m n alpha")
@@ -257,6 +385,18 @@ class TestExceptions:
     INVALID_PARSE_CASES = ["(", "n**", "n**2+", "!"]
     INVALID_ESCAPE_CASES = ["\\", "n + 2 \\", "2 \\"]
     INVALID_COMMENT_CASES = ["#", "n + 2 # comment", "# x"]
+    LARGE_NUMBER_CASES = [
+        "10**100**100",
+        "10^10^10",
+        "2**5000",
+        "(2*n)**(10**10)",
+        "100000!",
+        "factorial(10**6)",
+    ]
+    LARGE_EXPRESSION_CASES = [
+        " + ".join(["n"] * 3000),
+        "max(" + ", ".join(["n"] * 6000) + ")",
+    ]
 
     # Test exception cases
 
@@ -309,6 +449,16 @@ class TestExceptions:
         with pytest.raises(phs.HasCommentError):
             phs.convert_string_to_sympy(a_sub, self.VARIABLES)
 
+    @pytest.mark.parametrize("a_sub", LARGE_NUMBER_CASES)
+    def test_large_number(self, a_sub: str) -> None:
+        with pytest.raises(phs.HasLargeNumberError):
+            phs.convert_string_to_sympy(a_sub, self.VARIABLES)
+
+    @pytest.mark.parametrize("a_sub", LARGE_EXPRESSION_CASES)
+    def test_large_expression(self, a_sub: str) -> None:
+        with pytest.raises(phs.HasLargeExpressionError):
+            phs.convert_string_to_sympy(a_sub, self.VARIABLES)
+
     # Test formatting strings from validation
 
     @pytest.mark.parametrize(
@@ -321,6 +471,8 @@ class TestExceptions:
             (INVALID_PARSE_CASES, "syntax error"),
             (INVALID_ESCAPE_CASES, 'must not contain the character "\\"'),
             (INVALID_COMMENT_CASES, 'must not contain the character "#"'),
+            (LARGE_NUMBER_CASES, "too large to evaluate"),
+            (LARGE_EXPRESSION_CASES, "too long"),
         ],
     )
     def test_invalid_format(self, a_sub_list: list[str], target_string: str) -> None:
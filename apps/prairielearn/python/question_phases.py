@@ -1,13 +1,14 @@
-import base64
 import copy
 import io
 import os
 import pathlib
 import sys
-from typing import Any, Literal, Optional, Tuple, TypedDict
+import time
+from typing import Any, Literal, Optional, Tuple, TypedDict, Union
 
+import code_cache
 import lxml.html
-from check_data import Phase, check_data
+from check_data import Phase, check_data, snapshot_data
 from traverse import traverse_and_execute, traverse_and_replace
 from typing_extensions import assert_never
 
@@ -15,6 +16,11 @@ PYTHON_PATH = pathlib.Path(__file__).parent.parent.resolve()
 CORE_ELEMENTS_PATH = (PYTHON_PATH / "elements").resolve()
 SAVED_PATH = copy.copy(sys.path)
 
+# By default, `data` is snapshotted with fingerprints of the props that can't be
+# edited in the current phase. Setting this makes every snapshot a full deep
+# copy instead, which can be useful when debugging `check_data()`.
+DEEPCOPY_DATA_SNAPSHOTS = os.environ.get("DEEPCOPY_DATA_SNAPSHOTS", "") == "1"
+
 
 class ElementInfo(TypedDict):
     name: str
@@ -22,6 +28,26 @@ class ElementInfo(TypedDict):
     type: Literal["core", "course"]
 
 
+class ElementTiming(TypedDict):
+    element: str
+    """The tag name of the element."""
+
+    load_seconds: float
+    """Time spent loading and executing the element controller module."""
+
+    deepcopy_seconds: float
+    """Time spent copying the element extensions and snapshotting `data`."""
+
+    call_seconds: float
+    """Wall time spent in the element function for the current phase."""
+
+    call_cpu_seconds: float
+    """CPU time spent in the element function for the current phase."""
+
+    check_data_seconds: float
+    """Time spent validating the changes that the element made to `data`."""
+
+
 class RenderContext(TypedDict):
     html: str
     """A string consisting of `question.html` with Mustache templating applied."""
@@ -36,7 +62,7 @@ class RenderContext(TypedDict):
     """The path to the course directory."""
 
 
-def filelike_to_string(filelike: Any) -> str:
+def filelike_to_bytes(filelike: Any) -> bytes:
     # if val is None, replace it with empty string
     if filelike is None:
         filelike = ""
@@ -52,12 +78,20 @@ def filelike_to_string(filelike: Any) -> str:
 
     # if this next call does not work, it will throw an error, because
     # the thing returned by file() does not have the correct format
-    return base64.b64encode(filelike).decode()
+    return bytes(filelike)
 
 
 def process(
-    phase: Phase, data: dict, context: RenderContext
-) -> Tuple[Optional[str], set[str]]:
+    phase: Phase,
+    data: dict,
+    context: RenderContext,
+    element_timings: Optional[list[ElementTiming]] = None,
+) -> Tuple[Union[str, bytes, None], set[str]]:
+    """
+    Runs the given phase for every element in the question. If a list is passed
+    as `element_timings`, a timing breakdown of every element invocation is
+    appended to it, in the order the elements were processed.
+    """
     html = context["html"]
     elements = context["elements"]
     element_extensions = context["element_extensions"]
@@ -67,7 +101,7 @@ def process(
     processed_elements: set[str] = set()
 
     # If we're in the `render` phase, we'll eventually capture the HTML here.
-    # If we're in the `file` phase, we'll capture file data here.
+    # If we're in the `file` phase, we'll capture file data here (as bytes).
     # Otherwise, this will remain `None`.
     result = None
 
@@ -102,20 +136,30 @@ def process(
                 sys.path.insert(0, str(pathlib.Path(course_path) / "serverFilesCourse"))
             sys.path.insert(0, str(element_path))
 
+            timing: ElementTiming = {
+                "element": element.tag,
+                "load_seconds": 0.0,
+                "deepcopy_seconds": 0.0,
+                "call_seconds": 0.0,
+                "call_cpu_seconds": 0.0,
+                "check_data_seconds": 0.0,
+            }
+            if element_timings is not None:
+                element_timings.append(timing)
+
+            start = time.perf_counter()
             mod = {}
-            with open(element_controller_path, encoding="utf-8") as inf:
-                # use compile to associate filename with code object, so the
-                # filename appears in the traceback if there is an error
-                # (https://stackoverflow.com/a/437857)
-                code = compile(inf.read(), element_controller_path, "exec")
-                exec(code, mod)
+            exec(code_cache.get_code(element_controller_path), mod)
+            timing["load_seconds"] = time.perf_counter() - start
 
             if phase not in mod:
                 return None
 
             # Make a deep copy of the data so that question/element code can't
             # modify the source data.
+            start = time.perf_counter()
             data["extensions"] = copy.deepcopy(element_extensions.get(element.tag, {}))
+            timing["deepcopy_seconds"] = time.perf_counter() - start
 
             # `base_url` and associated values are only present during the render phase.
             if phase == "render":
@@ -136,19 +180,32 @@ def process(
                     for extension in data["extensions"]
                 }
 
-            old_data = copy.deepcopy(data)
-
-            # Temporarily strip tail text from the element; the `parse_fragment`
-            # function will choke on it.
-            temp_tail = element.tail
-            element.tail = None
-
-            element_value = mod[phase](lxml.html.tostring(element), data)
-
-            # Restore the tail text.
-            element.tail = temp_tail
+            start = time.perf_counter()
+            old_data = snapshot_data(data, phase, deepcopy=DEEPCOPY_DATA_SNAPSHOTS)
+            timing["deepcopy_seconds"] += time.perf_counter() - start
 
+            if mod.get("PARSED_ELEMENT"):
+                # The controller works directly with a parsed element. Give it a
+                # detached copy so that it can't modify the document itself.
+                element_arg = copy.deepcopy(element)
+                element_arg.tail = None
+            else:
+                # Temporarily strip tail text from the element; the `parse_fragment`
+                # function will choke on it.
+                temp_tail = element.tail
+                element.tail = None
+                element_arg = lxml.html.tostring(element)
+                element.tail = temp_tail
+
+            start = time.perf_counter()
+            start_cpu = time.process_time()
+            element_value = mod[phase](element_arg, data)
+            timing["call_cpu_seconds"] = time.process_time() - start_cpu
+            timing["call_seconds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
             check_data(old_data, data, phase)
+            timing["check_data_seconds"] = time.perf_counter() - start
 
             if phase == "render":
                 # TODO: validate that return value was a string?
@@ -164,12 +221,12 @@ def process(
         process_element(element)
 
     if phase == "render":
-        result = traverse_and_replace(html, process_element)
+        result = traverse_and_replace(html, process_element, elements.keys())
     else:
-        traverse_and_execute(html, process_element_return_none)
+        traverse_and_execute(html, process_element_return_none, elements.keys())
 
     if phase == "file":
-        result = filelike_to_string(result)
+        result = filelike_to_bytes(result)
 
     # We may have added an `extensions` property to the `data` object; remove it.
     if "extensions" in data:
@@ -0,0 +1,156 @@
+import os
+import sys
+from pathlib import Path
+from typing import get_args
+
+import code_cache
+import pytest
+import question_phases
+from check_data import Phase
+
+
+@pytest.fixture(autouse=True)
+def restore_process_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    # `process()` changes the working directory and `sys.path` for each element.
+    monkeypatch.chdir(question_phases.PYTHON_PATH)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+
+def render_context(html: str) -> question_phases.RenderContext:
+    return {
+        "html": html,
+        "elements": {
+            "pl-question-panel": {
+                "name": "pl-question-panel",
+                "controller": "pl-question-panel.py",
+                "type": "core",
+            }
+        },
+        "element_extensions": {},
+        "course_path": "/course",
+    }
+
+
+def render_data() -> dict:
+    return {
+        "params": {},
+        "correct_answers": {},
+        "submitted_answers": {},
+        "format_errors": {},
+        "partial_scores": {},
+        "score": 0,
+        "feedback": {},
+        "variant_seed": 1,
+        "options": {"base_url": "/pl"},
+        "raw_submitted_answers": {},
+        "editable": True,
+        "panel": "question",
+        "num_valid_submissions": 0,
+        "manual_grading": False,
+    }
+
+
+def test_process_render() -> None:
+    data = render_data()
+    html, processed_elements = question_phases.process(
+        "render",
+        data,
+        render_context("<div><pl-question-panel><p>Hi</p></pl-question-panel></div>"),
+    )
+
+    assert html == "<div><p>Hi</p></div>"
+    assert processed_elements == {"pl-question-panel"}
+    assert "extensions" not in data
+
+
+def test_process_element_timings() -> None:
+    element_timings: list[question_phases.ElementTiming] = []
+    question_phases.process(
+        "render",
+        render_data(),
+        render_context(
+            "<pl-question-panel>a</pl-question-panel>"
+            "<pl-question-panel>b</pl-question-panel>"
+        ),
+        element_timings,
+    )
+
+    assert [timing["element"] for timing in element_timings] == [
+        "pl-question-panel",
+        "pl-question-panel",
+    ]
+    for timing in element_timings:
+        assert timing["load_seconds"] >= 0
+        assert timing["deepcopy_seconds"] >= 0
+        assert timing["call_seconds"] > 0
+        assert timing["call_cpu_seconds"] >= 0
+        assert timing["check_data_seconds"] >= 0
+
+
+def test_process_element_timings_missing_phase() -> None:
+    element_timings: list[question_phases.ElementTiming] = []
+    question_phases.process(
+        "grade",
+        {"params": {}, "correct_answers": {}, "variant_seed": 1, "options": {}},
+        render_context("<pl-question-panel>a</pl-question-panel>"),
+        element_timings,
+    )
+
+    assert len(element_timings) == 1
+    assert element_timings[0]["call_seconds"] == 0
+
+
+def test_process_parsed_element(tmp_path: Path) -> None:
+    element_path = tmp_path / "elements" / "pl-parsed"
+    element_path.mkdir(parents=True)
+    (element_path / "pl-parsed.py").write_text(
+        "PARSED_ELEMENT = True\n"
+        "\n"
+        "\n"
+        "def render(element, data):\n"
+        "    assert element.getparent() is None and element.tail is None\n"
+        "    element.text = element.text.upper()\n"
+        "    return element.text\n"
+    )
+    legacy_path = tmp_path / "elements" / "pl-legacy"
+    legacy_path.mkdir(parents=True)
+    (legacy_path / "pl-legacy.py").write_text(
+        "def render(element_html, data):\n    return type(element_html).__name__\n"
+    )
+
+    context = render_context(
+        "<div><pl-parsed>a</pl-parsed> tail <pl-legacy></pl-legacy></div>"
+    )
+    context["course_path"] = str(tmp_path)
+    for name in ("pl-parsed", "pl-legacy"):
+        context["elements"][name] = {
+            "name": name,
+            "controller": f"{name}.py",
+            "type": "course",
+        }
+
+    html, _ = question_phases.process("render", render_data(), context)
+
+    assert html == "<div>A tail bytes</div>"
+
+
+@pytest.mark.parametrize(
+    "element_path",
+    sorted(
+        path
+        for path in question_phases.CORE_ELEMENTS_PATH.iterdir()
+        if "PARSED_ELEMENT = True" in (path / f"{path.name}.py").read_text()
+    ),
+    ids=lambda path: path.name,
+)
+def test_parsed_element_controllers_load(element_path: Path) -> None:
+    # Controllers that take parsed elements annotate them with lxml types, so
+    # loading one catches a missing import.
+    os.chdir(element_path)
+    sys.path.insert(0, str(element_path))
+    mod = {}
+    try:
+        exec(code_cache.get_code(element_path / f"{element_path.name}.py"), mod)
+    except ModuleNotFoundError as e:
+        pytest.skip(f"{e.name} is not installed")
+    assert any(phase in mod for phase in get_args(Phase))
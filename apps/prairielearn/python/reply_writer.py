@@ -0,0 +1,120 @@
+# Writers for the replies that zygote workers send back on file descriptor 3.
+#
+# Two formats are supported, selected when the zygote starts:
+#
+# - "json-lines" (the default): each reply is a single line of JSON. File data
+#   is embedded in the JSON as a base64 string.
+#
+# - "length-prefixed": each reply is a sequence of frames. A frame is a 9-byte
+#   header (a one-byte frame kind followed by the payload length as a big-endian
+#   unsigned 64-bit integer) and the payload. Every reply starts with a JSON
+#   frame (kind `J`). File data is not embedded in the JSON; instead, it is
+#   replaced by `{"$binary": <index>}` and the raw bytes follow as binary frames
+#   (kind `B`), in index order. When a reply has binary frames, the JSON object
+#   has a top-level `binary_frames` key with their count.
+#
+# The JSON is encoded the same way in both formats, so they accept the same
+# replies. The length-prefixed format saves encoding file data as base64, which
+# makes it a third larger, and decoding it again in the caller.
+
+import base64
+import json
+import struct
+from typing import Any, BinaryIO, Callable, Optional, Union
+
+FRAME_HEADER = struct.Struct(">cQ")
+JSON_FRAME = b"J"
+BINARY_FRAME = b"B"
+
+
+class FileData(bytes):
+    """The raw contents of a file produced by a `file()` call."""
+
+
+# This function tries to convert a python object to valid JSON. If an exception
+# is raised, this function prints the object and re-raises the exception. This is
+# helpful because the object - which contains something that cannot be converted
+# to JSON - would otherwise never be displayed to the developer, making it hard to
+# debug the problem.
+def try_dumps(
+    obj: Any,
+    sort_keys: bool = False,
+    allow_nan: bool = False,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> str:
+    try:
+        return json.dumps(
+            obj,
+            sort_keys=sort_keys,
+            allow_nan=allow_nan,
+            default=default or _encode_file_data,
+        )
+    except Exception:
+        print(f"Error converting this object to json:\n{obj}\n")
+        raise
+
+
+def _encode_file_data(obj: Any) -> str:
+    if isinstance(obj, FileData):
+        return base64.b64encode(obj).decode()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonLinesReplyWriter:
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+
+    def write(self, reply: dict[str, Any]) -> None:
+        self.write_json(try_dumps(reply))
+
+    def write_json(self, json_reply: str) -> None:
+        """Writes a reply that has already been converted to JSON."""
+        self.f.write(json_reply.encode("utf-8"))
+        self.f.write(b"\n")
+        self.f.flush()
+
+
+class LengthPrefixedReplyWriter:
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+
+    def write(self, reply: dict[str, Any]) -> None:
+        binary_frames: list[FileData] = []
+
+        def default(obj: Any) -> Any:
+            if isinstance(obj, FileData):
+                binary_frames.append(obj)
+                return {"$binary": len(binary_frames) - 1}
+            return _encode_file_data(obj)
+
+        payload = try_dumps(reply, default=default).encode("utf-8")
+
+        if binary_frames:
+            # Replies are always non-empty objects, so we can splice the count
+            # in instead of encoding the whole reply again.
+            payload = b'{"binary_frames":%d,%s' % (len(binary_frames), payload[1:])
+
+        self._write_frame(JSON_FRAME, payload)
+        for data in binary_frames:
+            self._write_frame(BINARY_FRAME, data)
+        self.f.flush()
+
+    def write_json(self, json_reply: str) -> None:
+        """Writes a reply that has already been converted to JSON."""
+        self._write_frame(JSON_FRAME, json_reply.encode("utf-8"))
+        self.f.flush()
+
+    def _write_frame(self, kind: bytes, payload: bytes) -> None:
+        self.f.write(FRAME_HEADER.pack(kind, len(payload)))
+        self.f.write(payload)
+
+
+ReplyWriter = Union[JsonLinesReplyWriter, LengthPrefixedReplyWriter]
+
+
+def get_reply_writer(framing: str, f: BinaryIO) -> ReplyWriter:
+    if framing == "json-lines":
+        return JsonLinesReplyWriter(f)
+    elif framing == "length-prefixed":
+        return LengthPrefixedReplyWriter(f)
+    raise ValueError(f"Unknown reply framing: {framing}")
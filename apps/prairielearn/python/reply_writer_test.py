@@ -0,0 +1,138 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from reply_writer import (
+    FRAME_HEADER,
+    FileData,
+    JsonLinesReplyWriter,
+    LengthPrefixedReplyWriter,
+    get_reply_writer,
+)
+
+
+def read_frames(buf: bytes) -> list[tuple[bytes, bytes]]:
+    frames = []
+    offset = 0
+    while offset < len(buf):
+        kind, length = FRAME_HEADER.unpack_from(buf, offset)
+        offset += FRAME_HEADER.size
+        frames.append((kind, buf[offset : offset + length]))
+        offset += length
+    return frames
+
+
+def test_json_lines_file_data_is_base64() -> None:
+    f = io.BytesIO()
+    JsonLinesReplyWriter(f).write({"present": True, "val": FileData(b"hello")})
+
+    assert f.getvalue() == b'{"present": true, "val": "aGVsbG8="}\n'
+
+
+def test_json_lines_rejects_nan() -> None:
+    with pytest.raises(ValueError):
+        JsonLinesReplyWriter(io.BytesIO()).write({"val": float("nan")})
+
+
+def test_json_lines_rejects_plain_bytes() -> None:
+    with pytest.raises(TypeError):
+        JsonLinesReplyWriter(io.BytesIO()).write({"val": b"hello"})
+
+
+def test_length_prefixed_json_only() -> None:
+    f = io.BytesIO()
+    LengthPrefixedReplyWriter(f).write({"present": True, "val": {"a": [1, 2]}})
+
+    frames = read_frames(f.getvalue())
+    assert len(frames) == 1
+    assert frames[0][0] == b"J"
+    assert json.loads(frames[0][1]) == {"present": True, "val": {"a": [1, 2]}}
+
+
+def test_length_prefixed_binary_frames() -> None:
+    f = io.BytesIO()
+    LengthPrefixedReplyWriter(f).write(
+        {
+            "present": True,
+            "val": {"html": None, "file": FileData(b"\x00\xffdata"), "data": {}},
+        }
+    )
+
+    frames = read_frames(f.getvalue())
+    assert [kind for kind, _ in frames] == [b"J", b"B"]
+    assert json.loads(frames[0][1]) == {
+        "binary_frames": 1,
+        "present": True,
+        "val": {"html": None, "file": {"$binary": 0}, "data": {}},
+    }
+    assert frames[1][1] == b"\x00\xffdata"
+
+
+def write_reply(framing: str, reply: dict) -> object:
+    f = io.BytesIO()
+    get_reply_writer(framing, f).write(reply)
+    if framing == "json-lines":
+        return json.loads(f.getvalue())
+    return json.loads(read_frames(f.getvalue())[0][1])
+
+
+@pytest.mark.parametrize("framing", ["json-lines", "length-prefixed"])
+@pytest.mark.parametrize(
+    "val",
+    [
+        2**70,
+        -(2**64),
+        np.float64(1.5),
+        {1: "a", None: "b"},
+        ("a", [1, {"b": 2.5}]),
+        "\ud800",
+    ],
+)
+def test_formats_accept_the_same_values(framing: str, val: object) -> None:
+    assert write_reply(framing, {"val": val}) == json.loads(json.dumps({"val": val}))
+
+
+@pytest.mark.parametrize("framing", ["json-lines", "length-prefixed"])
+@pytest.mark.parametrize(
+    "val, error",
+    [
+        (np.arange(3), TypeError),
+        (np.int64(1), TypeError),
+        ({(1, 2): 3}, TypeError),
+        (float("nan"), ValueError),
+        ([1.0, float("inf")], ValueError),
+        (np.float64("-inf"), ValueError),
+    ],
+)
+def test_formats_reject_the_same_values(
+    framing: str, val: object, error: type[Exception]
+) -> None:
+    with pytest.raises(error):
+        write_reply(framing, {"html": None, "val": val})
+
+
+def test_length_prefixed_binary_frames_big_int() -> None:
+    f = io.BytesIO()
+    LengthPrefixedReplyWriter(f).write(
+        {"val": {"big": 2**70, "file": FileData(b"x")}}
+    )
+
+    frames = read_frames(f.getvalue())
+    assert json.loads(frames[0][1]) == {
+        "binary_frames": 1,
+        "val": {"big": 2**70, "file": {"$binary": 0}},
+    }
+    assert frames[1] == (b"B", b"x")
+
+
+def test_length_prefixed_prejsonified() -> None:
+    f = io.BytesIO()
+    LengthPrefixedReplyWriter(f).write_json('{"present": false}')
+
+    assert read_frames(f.getvalue()) == [(b"J", b'{"present": false}')]
+
+
+def test_get_reply_writer_unknown() -> None:
+    with pytest.raises(ValueError, match="Unknown reply framing: xml"):
+        get_reply_writer("xml", io.BytesIO())
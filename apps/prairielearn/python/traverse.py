@@ -1,14 +1,34 @@
+import functools
+import io
+import re
 from collections import deque
 from html import escape as html_escape
 from itertools import chain
-from typing import Callable, Deque, List, Optional, Tuple, Union
+from typing import (
+    Callable,
+    Collection,
+    Deque,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
+import lxml.etree
 import lxml.html
 
 ElementReplacement = Optional[
     Union[str, lxml.html.HtmlElement, List[lxml.html.HtmlElement]]
 ]
 
+# A tag name, or `lxml.etree.ProcessingInstruction` to match processing instructions.
+TagMatcher = Union[str, Callable]
+
+# Matches the tag name of every start tag in a string of HTML.
+START_TAG_RE = re.compile(r"<([a-zA-Z][^\s/>]*)")
+
 # https://developer.mozilla.org/en-US/docs/Glossary/Void_element
 VOID_ELEMENTS = frozenset(
     {
@@ -29,17 +49,54 @@ VOID_ELEMENTS = frozenset(
 )
 
 
-def traverse_and_execute(
-    html: str, fn: Callable[[lxml.html.HtmlElement], None]
-) -> None:
-    elements = lxml.html.fragments_fromstring(html)
+@functools.lru_cache(maxsize=8)
+def parse_fragments(html: str) -> Tuple[lxml.html.HtmlElement, ...]:
+    """
+    Parses the given HTML and returns its top-level elements, without any leading text.
+    The result is cached, since several phases often run over the same HTML in one worker,
+    so it must not be modified.
+    """
+    return tuple(
+        element
+        for element in lxml.html.fragments_fromstring(html)
+        if not isinstance(element, str)
+    )
 
-    # If there's leading text, the first element of the array will be a string.
-    # We can just discard that.
-    if isinstance(elements[0], str):
-        del elements[0]
 
-    for e in chain.from_iterable(element.iter() for element in elements):
+@functools.lru_cache(maxsize=8)
+def parse_start_tags(html: str) -> FrozenSet[str]:
+    """
+    Returns the tag names of the start tags in the given HTML, in lowercase. The
+    result is cached like `parse_fragments`.
+    """
+    return find_start_tags(html)
+
+
+def find_start_tags(html: str) -> FrozenSet[str]:
+    return frozenset(match.lower() for match in START_TAG_RE.findall(html))
+
+
+def traverse_and_execute(
+    html: str,
+    fn: Callable[[lxml.html.HtmlElement], None],
+    element_tags: Optional[Collection[str]] = None,
+) -> None:
+    """
+    Calls `fn` on every element in the given HTML in document order, or only on the
+    elements with one of the given `element_tags`. `fn` must not modify the elements.
+    """
+    elements = parse_fragments(html)
+
+    # Only the element tags that occur in the source can match. There are usually few
+    # of them, so lxml can match them against every node itself, which is faster than
+    # checking the tag of every node in Python.
+    tags: List[str] = []
+    if element_tags is not None:
+        tags = [tag for tag in parse_start_tags(html) if tag in element_tags]
+        if not tags:
+            return
+
+    for e in chain.from_iterable(element.iter(*tags) for element in elements):
         fn(e)
 
 
@@ -55,8 +112,47 @@ def get_source_definition(element: lxml.html.HtmlElement) -> str:
     return f"<{' '.join((element.tag, *attributes))}>"
 
 
+def write_static_subtree(element: lxml.html.HtmlElement, result: io.StringIO) -> None:
+    """
+    Writes an element, its descendants and its tail to `result` exactly as the full
+    traversal in `traverse_and_replace` would if `replace` returned every element
+    unchanged. lxml's own HTML serializer can't be used for this: it percent-encodes
+    URL attributes such as `href` and escapes tails, which the full traversal doesn't.
+    """
+    if isinstance(element, lxml.html.HtmlComment):
+        result.write(lxml.html.tostring(element, encoding="unicode"))
+        return
+
+    result.write(get_source_definition(element))
+    if element.text is not None:
+        result.write(html_escape(element.text))
+    for child in element:
+        write_static_subtree(child, result)
+    if element.tag not in VOID_ELEMENTS:
+        result.write(f"</{element.tag}>")
+    if element.tail is not None:
+        result.write(element.tail)
+
+
+def find_tags_to_visit(html: str, element_tags: Collection[str]) -> Set[TagMatcher]:
+    """
+    Returns the tags in the given HTML that need to be visited: the element tags
+    that occur in it, and processing instructions, which have to be rewritten as
+    comments. This is only a scan of the source, so it can't miss a tag but
+    might include one that ends up e.g. inside a comment.
+    """
+    tags: Set[TagMatcher] = {
+        tag for tag in find_start_tags(html) if tag in element_tags
+    }
+    if "<?" in html:
+        tags.add(lxml.etree.ProcessingInstruction)
+    return tags
+
+
 def traverse_and_replace(
-    html: str, replace: Callable[[lxml.html.HtmlElement], ElementReplacement]
+    html: str,
+    replace: Callable[[lxml.html.HtmlElement], ElementReplacement],
+    element_tags: Optional[Collection[str]] = None,
 ) -> str:
     """
     Perform traversal and element replacement on HTML with the given replace function.
@@ -64,12 +160,25 @@ def traverse_and_replace(
     The count_stack tracks how many children each unclosed tag (contained in the tail_stack) has.
     The top entry in count_stack is decremented every time something is moved onto result,
     and when an entry hits zero, the corresponding tag from tail_stack is moved onto result as well.
+
+    If `element_tags` is given, subtrees that don't contain an element with one of those tags are
+    written out in one go, without calling `replace` on anything in them. Strings returned
+    by `replace` that don't contain such an element aren't parsed at all, but copied to the output
+    as they are. This is much faster for the large amounts of static HTML that elements usually
+    render.
     """
 
     # Initialize result and work data structures
-    result: Deque[str] = deque()
+    result = io.StringIO()
 
     initial_list = lxml.html.fragments_fromstring(html)
+
+    # The tags that have to go through `replace()`, if we know which ones they are.
+    # This grows as replacements add new content to the document.
+    tags_to_visit: Optional[Set[TagMatcher]] = None
+    if element_tags is not None:
+        tags_to_visit = find_tags_to_visit(html, element_tags)
+
     count_stack: Deque[int] = deque([len(initial_list)])
     work_stack: Deque[Union[str, lxml.html.HtmlElement]] = deque(reversed(initial_list))
     tail_stack: Deque[Tuple[str, Optional[str]]] = deque()
@@ -77,13 +186,36 @@ def traverse_and_replace(
     while work_stack:
         element = work_stack.pop()
 
-        # For just a string, append to final result
+        # For just a string, write it to the final result
         if isinstance(element, str):
-            result.append(element)
+            result.write(element)
+
+        elif (
+            tags_to_visit is not None
+            and len(element) > 0
+            and (not tags_to_visit or next(element.iter(*tags_to_visit), None) is None)
+        ):
+            # Nothing in here needs to be replaced, so the whole subtree can be
+            # written at once. Leaves are cheap enough to handle one by one.
+            write_static_subtree(element, result)
 
         else:
             new_elements = replace(element)
 
+            # Anything new may contain elements to replace as well.
+            if tags_to_visit is not None and element_tags is not None:
+                if isinstance(new_elements, str):
+                    new_tags = find_tags_to_visit(new_elements, element_tags)
+                    if new_tags:
+                        tags_to_visit |= new_tags
+                    else:
+                        # There's nothing to replace in here, so there's no need to
+                        # parse it. Strings on the work stack are output as they are.
+                        new_elements = [new_elements]
+                elif new_elements is not None and new_elements is not element:
+                    tags_to_visit.update(element_tags)
+                    tags_to_visit.add(lxml.etree.ProcessingInstruction)
+
             # Turn new_elements into a list containing we can process
             if new_elements is None:
                 new_elements = []
@@ -107,7 +239,7 @@ def traverse_and_replace(
                 continue
 
             if isinstance(new_elements, lxml.html.HtmlComment):
-                result.append(lxml.html.tostring(new_elements, encoding="unicode"))
+                result.write(lxml.html.tostring(new_elements, encoding="unicode"))
             elif isinstance(new_elements, lxml.html.HtmlProcessingInstruction):
                 # Handling processing instructions is necessary for elements like `<pl-graph>`
                 # that produce SVG documents.
@@ -121,15 +253,15 @@ def traverse_and_replace(
                     .removeprefix("<?")
                     .removesuffix("?>")
                 )
-                result.append(f"<!--?{instruction}?-->")
+                result.write(f"<!--?{instruction}?-->")
                 if tail:
-                    result.append(tail)
+                    result.write(tail)
             else:
                 # Add opening tag and text
-                result.append(get_source_definition(new_elements))
+                result.write(get_source_definition(new_elements))
 
                 if new_elements.text is not None:
-                    result.append(html_escape(new_elements.text))
+                    result.write(html_escape(new_elements.text))
 
                 # Add all children to the work stack
                 children = list(new_elements)
@@ -146,9 +278,9 @@ def traverse_and_replace(
             tail_tag, tail_text = tail_stack.pop()
 
             if tail_tag not in VOID_ELEMENTS and tail_tag is not None:
-                result.append(f"</{tail_tag}>")
+                result.write(f"</{tail_tag}>")
             if tail_text is not None:
-                result.append(tail_text)
+                result.write(tail_text)
         else:
             count_stack[-1] -= 1
 
@@ -158,4 +290,4 @@ def traverse_and_replace(
     # assert count_stack == deque([0])
     # assert not tail_stack
 
-    return "".join(result)
+    return result.getvalue()
@@ -0,0 +1,90 @@
+# Micro-benchmark for `traverse_and_replace()` over every `question.html` in
+# `exampleCourse`. Every element is replaced with the same static HTML, which
+# is roughly what a rendered input element looks like, so this measures the
+# traversal itself rather than any element code. Run it with:
+#
+#     python traverse_benchmark.py [--repeat N] [--top N]
+
+import argparse
+import pathlib
+import timeit
+from typing import Collection, Optional
+
+import lxml.html
+from traverse import ElementReplacement, traverse_and_replace
+
+APPS_PATH = pathlib.Path(__file__).parent.parent.parent.resolve()
+EXAMPLE_COURSE_PATH = APPS_PATH.parent / "exampleCourse"
+
+RENDERED_ELEMENT = (
+    '<div class="card my-2"><div class="card-body">'
+    + "".join(
+        f'<div class="form-check"><input class="form-check-input" type="radio"'
+        f' name="ans" value="{i}" id="ans-{i}"><label class="form-check-label"'
+        f' for="ans-{i}"><span>({chr(ord("a") + i)})</span> Option <code>{i}</code>'
+        "</label></div>\n"
+        for i in range(5)
+    )
+    + '</div><span class="badge">Correct</span></div>'
+)
+
+
+def get_element_tags() -> set[str]:
+    element_dirs = [APPS_PATH / "prairielearn" / "elements"]
+    element_dirs.append(EXAMPLE_COURSE_PATH / "elements")
+    return {path.name for element_dir in element_dirs for path in element_dir.iterdir()}
+
+
+def time_traversal(
+    html: str,
+    element_tags: Collection[str],
+    fast_path_tags: Optional[Collection[str]],
+    repeat: int,
+) -> float:
+    def replace(element: lxml.html.HtmlElement) -> ElementReplacement:
+        if element.tag in element_tags:
+            return RENDERED_ELEMENT
+        return element
+
+    return min(
+        timeit.repeat(
+            lambda: traverse_and_replace(html, replace, fast_path_tags),
+            number=1,
+            repeat=repeat,
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    element_tags = get_element_tags()
+    results = []
+    for path in sorted(EXAMPLE_COURSE_PATH.glob("questions/**/question.html")):
+        html = path.read_text(encoding="utf-8")
+        if not html.strip():
+            continue
+        slow = time_traversal(html, element_tags, None, args.repeat)
+        fast = time_traversal(html, element_tags, element_tags, args.repeat)
+        results.append((path.relative_to(EXAMPLE_COURSE_PATH), len(html), slow, fast))
+
+    total_slow = sum(slow for _, _, slow, _ in results)
+    total_fast = sum(fast for _, _, _, fast in results)
+    print(f"{len(results)} questions")
+    print(f"full traversal:   {total_slow * 1000:8.2f} ms")
+    print(f"element-aware:    {total_fast * 1000:8.2f} ms")
+    print(f"speedup:          {total_slow / total_fast:8.2f}x")
+    print()
+    print(f"{args.top} largest questions:")
+    for name, size, slow, fast in sorted(results, key=lambda r: -r[1])[: args.top]:
+        print(
+            f"  {size:7d} chars {slow * 1000:7.3f} ms -> {fast * 1000:7.3f} ms"
+            f" ({slow / fast:5.2f}x) {name}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 from typing import List
 
-from traverse import ElementReplacement, traverse_and_execute, traverse_and_replace
+import lxml.etree
+from traverse import (
+    ElementReplacement,
+    parse_fragments,
+    traverse_and_execute,
+    traverse_and_replace,
+)
 
 
 def test_traverse_and_execute() -> None:
@@ -18,6 +24,33 @@ def test_traverse_and_execute() -> None:
     assert tags == ["p", "i", "strong"]
 
 
+def test_traverse_and_execute_element_tags() -> None:
+    html = "Hi <pl-a>1<pl-b>2</pl-b></pl-a> <p><pl-b>3</pl-b><i>x</i></p>"
+    tags: List[str] = []
+    text: List[str] = []
+
+    def capture_element(element) -> None:
+        tags.append(element.tag)
+        text.append(element.text)
+
+    traverse_and_execute(html, capture_element, {"pl-a", "pl-b"})
+    assert tags == ["pl-a", "pl-b", "pl-b"]
+    assert text == ["1", "2", "3"]
+
+    # Running again over the same HTML reuses the parsed elements.
+    elements: List = []
+    traverse_and_execute(html, elements.append, {"pl-b"})
+    assert elements[0] is parse_fragments(html)[0][0]
+
+    tags.clear()
+    traverse_and_execute(html, capture_element, set())
+    assert tags == []
+
+    # Tags are found in the source case-insensitively, like the parser does.
+    traverse_and_execute("<PL-A>4</PL-A>", capture_element, {"pl-a", "pl-c"})
+    assert tags == ["pl-a"]
+
+
 def test_traverse_and_replace_text() -> None:
     html = traverse_and_replace("Hello", lambda e: "Goodbye")
     assert html == "Hello"
@@ -316,3 +349,69 @@ def test_traverse_and_replace_empty_paragraph() -> None:
 
     html = traverse_and_replace("<p></p>", replace)
     assert html == "<p></p>"
+
+
+def test_traverse_and_replace_element_tags() -> None:
+    visited: List[str] = []
+
+    def replace(e) -> ElementReplacement:
+        visited.append(e.tag)
+        if e.tag == "pl-outer":
+            return '<pl-inner></pl-inner> <span class="x">static</span>'
+        if e.tag == "pl-inner":
+            return "<em>inner</em>"
+        return e
+
+    original_html = (
+        "Hello <div><p>static <b>text</b></p><pl-outer></pl-outer> tail</div>"
+        '<table><tr><td a="b">1</td></tr></table> <?xml version="1.0"?> world'
+    )
+    expected_html = traverse_and_replace(original_html, replace)
+    visited.clear()
+    html = traverse_and_replace(original_html, replace, {"pl-outer", "pl-inner"})
+
+    assert html == expected_html
+    assert html == (
+        "Hello <div><p>static <b>text</b></p><em>inner</em> "
+        '<span class="x">static</span> tail</div>'
+        '<table><tr><td a="b">1</td></tr></table> <!--?xml version="1.0"?--> world'
+    )
+    # Subtrees without elements are not visited, apart from single leaves, and
+    # output without elements is not parsed at all.
+    assert [tag for tag in visited if tag not in ("pl-outer", "pl-inner")] == [
+        "div",
+        "span",
+        lxml.etree.ProcessingInstruction,
+    ]
+
+
+def test_traverse_and_replace_element_tags_output_as_is() -> None:
+    def replace(e) -> ElementReplacement:
+        if e.tag == "pl-a":
+            return '<div class="a"><input type="checkbox" checked>A</div>'
+        return e
+
+    html = traverse_and_replace(
+        "<p><pl-a></pl-a> text</p><pl-a></pl-a>", replace, {"pl-a"}
+    )
+    assert html == (
+        '<p><div class="a"><input type="checkbox" checked>A</div> text</p>'
+        '<div class="a"><input type="checkbox" checked>A</div>'
+    )
+
+
+def test_traverse_and_replace_element_tags_static_subtree() -> None:
+    # Static subtrees keep attribute values as written, and their tails are
+    # output like anywhere else in the document.
+    original_html = (
+        '<div><a href="my file é.pdf">file</a> this &amp; that'
+        "<!-- note --> <br>more</div> and &amp; <pl-a></pl-a>"
+    )
+    expected_html = traverse_and_replace(original_html, lambda e: e)
+    html = traverse_and_replace(original_html, lambda e: e, {"pl-a"})
+
+    assert html == expected_html
+    assert html == (
+        '<div><a href="my file é.pdf">file</a> this & that'
+        "<!-- note --> <br>more</div> and & <pl-a></pl-a>"
+    )
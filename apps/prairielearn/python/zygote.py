@@ -8,29 +8,44 @@
 # It is intended that this process will be terminated by sending
 # SIGTERM (or SIGKILL if it's stuck).
 #
-# Input is formatted as JSON on STDIN
+# Input is formatted as JSON on STDIN; several calls can be combined into a
+# single "batch" input (see `run_batch()`), and calls can ask for timing and
+# profiling data (see `run_instrumented_call()`)
 # Output is formatted as JSON on file descriptor 3
 # Anything written to STDOUT or STDERR will be captured and logged, but it has no meaning
 # Errors are signaled by exiting with non-zero exit code
-# Exceptions are not caught and so will trigger a process exit with non-zero exit code (signaling an error)
+# Exceptions are not caught and so will trigger a process exit with non-zero exit code (signaling an error),
+# except for exceptions in the calls of a "batch" input, which are reported in its reply (see `run_batch()`)
 
-import base64
+import collections
 import copy
+import cProfile
 import io
 import json
 import os
+import pstats
 import signal
 import subprocess
 import sys
+import tempfile
 import time
+import traceback
 from inspect import signature
 
+import code_cache
+import lxml.html
 import question_phases
+import zygote_metrics
+from reply_writer import FileData, get_reply_writer, try_dumps
 
 saved_path = copy.copy(sys.path)
 
 drop_privileges = os.environ.get("DROP_PRIVILEGES", False)
 
+# How replies are written to file descriptor 3; see `reply_writer.py` for the
+# supported formats. The caller selects this when it starts the zygote.
+reply_framing = os.environ.get("REPLY_FRAMING", "json-lines")
+
 # If we're configured to drop privileges (that is, if we're running in a
 # Docker container), various tools like matplotlib and fontconfig will be
 # unable to write to their default config/cache directories. This is because
@@ -61,47 +76,325 @@ import logging
 
 logging.getLogger("matplotlib.font_manager").disabled = True
 
-# Pre-load commonly used modules
+# Pre-load commonly used modules; see `preload.py` for how to configure this.
 sys.path.insert(0, os.path.abspath("../question-servers/freeformPythonLib"))
-import html
-import math
+import preload
+
+preload_report = preload.preload(preload.load_manifest(os.environ))
+if "PRELOAD_REPORT_PATH" in os.environ:
+    preload.write_report(preload_report, os.environ["PRELOAD_REPORT_PATH"])
+
 import random
 
-import chevron
-import lxml.html
 import matplotlib
-import matplotlib.font_manager
-import nltk
 import numpy
-import pint
-import prairielearn
-import sklearn
 
 matplotlib.use("PDF")
 
-# Construct initial unit registry to create initial cache file.
-prairielearn.get_unit_registry()
 
+def get_core_element_controller_paths():
+    paths = []
+    for info_path in sorted(question_phases.CORE_ELEMENTS_PATH.glob("*/info.json")):
+        try:
+            with open(info_path, encoding="utf-8") as f:
+                controller = json.load(f).get("controller")
+        except (OSError, ValueError):
+            continue
+        if controller:
+            paths.append(info_path.parent / controller)
+    return paths
+
+
+# Compile all core element controllers before forking so that every worker
+# inherits the compiled code instead of compiling each controller again for
+# every element it processes. The compiled code is also persisted to disk so
+# that future zygotes can skip compilation entirely.
+code_cache.warm(
+    get_core_element_controller_paths(),
+    cache_dir=os.environ.get(
+        "PL_CODE_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), f"pl_code_cache_{os.getuid()}"),
+    ),
+)
+
+
+# whether the PRNGs have already been seeded in this worker
+seeded = False
+
+# The number of functions to include in profiles of instrumented calls.
+PROFILE_MAX_ROWS = 50
+
+
+def run_v2_question(args, cwd):
+    # We've shoehorned legacy v2 questions into the v3 code caller
+    # so that we can reuse the same worker processes, and specifically
+    # so that we can reuse the container pool.
+    #
+    # Node doesn't support POSIX-style forks, so we can't use a zygote
+    # process like we do with Python. Instead, we'll exec a Node subprocess.
+    # Node generally boots up very quickly, so this should be fine.
+    result = subprocess.run(
+        [
+            "node",
+            "./apps/prairielearn/dist/question-servers/calculation-worker.js",
+        ],
+        cwd=cwd,
+        capture_output=True,
+        # By convention, the first argument is an object that contains all
+        # the call information.
+        input=json.dumps(args[0]),
+        encoding="utf-8",
+    )
+
+    # Proxy any output from the subprocess back to the caller.
+    # Note that we only deal with stderr, as the Node process rewrote
+    # the output streams so that writes to stdout actually go to stderr.
+    # This allows us to use stdout for the actual return value.
+    if result.stderr:
+        print(result.stderr, file=sys.stderr)
+        sys.stderr.flush()
+
+    # If the subprocess exited with a non-zero exit code, raise an exception.
+    result.check_returncode()
+
+    return result.stdout
+
+
+def run_call(file, fcn, args, cwd, paths, element_timings=None):
+    """
+    Runs a single call to a Python file and returns the reply as a dict of the
+    form `{"present": bool, "val": any}`, ready to be converted to JSON.
+    """
+    global seeded
+
+    # Here, we re-seed the PRNGs if not already seeded in this worker.
+    # We only want to seed the PRNGs once per worker, so that if a
+    # question happens to contain multiple occurrences of the same element, the
+    # randomizations for each occurrence are independent of each other but still
+    # dependent on the variant seed.
+    if type(args[-1]) is dict and not seeded:
+        variant_seed = args[-1].get("variant_seed", None)
+        random.seed(variant_seed)
+        numpy.random.seed(variant_seed)
+        seeded = True
+
+    # reset and then set up the path
+    sys.path = copy.copy(saved_path)
+    for path in reversed(paths):
+        sys.path.insert(0, path)
+    sys.path.insert(0, cwd)
+
+    # change to the desired working directory
+    os.chdir(cwd)
+
+    if file == "question.html":
+        # This is an experimental implementation of question processing
+        # that does all HTML parsing and rendering in Python. This should
+        # be much faster than the current implementation that does an IPC
+        # call for each element.
 
-# This function tries to convert a python object to valid JSON. If an exception
-# is raised, this function prints the object and re-raises the exception. This is
-# helpful because the object - which contains something that cannot be converted
-# to JSON - would otherwise never be displayed to the developer, making it hard to
-# debug the problem.
-def try_dumps(obj, sort_keys=False, allow_nan=False):
+        data = args[0]
+        context = args[1]
+
+        result, processed_elements = question_phases.process(
+            fcn, data, context, element_timings
+        )
+        val = {
+            "html": result if fcn == "render" else None,
+            "file": FileData(result) if fcn == "file" else None,
+            "data": data,
+            "processed_elements": list(processed_elements),
+        }
+        return {"present": True, "val": val}
+
+    mod = {}
+    file_path = os.path.join(cwd, file + ".py")
+    exec(code_cache.get_code(file_path), mod)
+
+    # check whether we have the desired fcn in the module
+    if fcn not in mod:
+        # the function wasn't present, so report this
+        return {"present": False}
+
+    # get the desired function in the loaded module
+    method = mod[fcn]
+
+    # check if the desired function is a legacy element function - if
+    # so, we add an argument for element_index
+    arg_names = list(signature(method).parameters.keys())
+    if (
+        len(arg_names) == 3
+        and arg_names[0] == "element_html"
+        and arg_names[1] == "element_index"
+        and arg_names[2] == "data"
+    ):
+        args.insert(1, None)
+
+    # elements that set `PARSED_ELEMENT` expect a parsed element instead of
+    # its HTML source
+    if mod.get("PARSED_ELEMENT") and isinstance(args[0], str):
+        args[0] = lxml.html.fragment_fromstring(args[0])
+
+    # call the desired function in the loaded module
+    val = method(*args)
+
+    if fcn == "file":
+        val = FileData(question_phases.filelike_to_bytes(val))
+
+    # Any function that is not 'file' or 'render' will modify 'data' and
+    # should not be returning anything (because 'data' is mutable).
+    if (fcn != "file") and (fcn != "render"):
+        if val is None:
+            return {"present": True, "val": args[-1]}
+
+        json_outp_passed = try_dumps(args[-1], sort_keys=True, allow_nan=False)
+        json_outp = try_dumps(val, sort_keys=True, allow_nan=False)
+        if json_outp_passed != json_outp:
+            sys.stderr.write(
+                'WARNING: Passed and returned value of "data" differ in the function '
+                + str(fcn)
+                + "() in the file "
+                + str(cwd)
+                + "/"
+                + str(file)
+                + ".py.\n\n passed:\n  "
+                + str(args[-1])
+                + "\n\n returned:\n  "
+                + str(val)
+                + '\n\nThere is no need to be returning "data" at all (it is mutable, i.e., passed by reference). In future, this code will throw a fatal error. For now, the returned value of "data" was used and the passed value was discarded.'
+            )
+
+    return {"present": True, "val": val}
+
+
+def run_instrumented_call(file, fcn, args, cwd, paths, instrument):
+    """
+    Like `run_call()`, but if `instrument` is "timing" or "profile", a `metrics`
+    entry is added to the reply with the wall and CPU time of the call, the
+    code cache hits and misses of the call and, for `question.html`, a
+    breakdown per element invocation. With "profile", the call also runs under
+    cProfile and the formatted stats are included.
+    """
+    if not instrument:
+        return run_call(file, fcn, args, cwd, paths)
+    if instrument not in ("timing", "profile"):
+        raise ValueError(f"Unknown instrumentation mode: {instrument}")
+
+    element_timings = []
+    profiler = cProfile.Profile() if instrument == "profile" else None
+
+    code_cache.reset_stats()
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    if profiler is not None:
+        profiler.enable()
     try:
-        return json.dumps(obj, sort_keys=sort_keys, allow_nan=allow_nan)
-    except Exception:
-        print(f"Error converting this object to json:\n{obj}\n")
-        raise
+        reply = run_call(file, fcn, args, cwd, paths, element_timings)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    metrics = {
+        "wall_seconds": time.perf_counter() - start,
+        "cpu_seconds": time.process_time() - start_cpu,
+        "elements": element_timings,
+        "code_cache": code_cache.get_stats(),
+    }
+    if profiler is not None:
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(PROFILE_MAX_ROWS)
+        metrics["profile"] = stream.getvalue()
+
+    reply["metrics"] = metrics
+    return reply
+
+
+def run_batch(inp):
+    """
+    Runs an ordered list of calls in this worker and returns a single reply for
+    all of them. This saves a round-trip and a JSON encoding of `data` for each
+    call compared to issuing the calls one at a time.
+
+    The input has the following form:
+
+        {
+            "fcn": "batch",
+            "data": {...},
+            "calls": [
+                {"file": ..., "fcn": ..., "args": [...], "cwd": ..., "paths": [...], "data_arg": 0},
+                ...
+            ],
+        }
+
+    `data` is shared between all calls. If the input has an `instrument` key,
+    it applies to every call; see `run_instrumented_call()`. If a call specifies `data_arg`, the
+    shared `data` is inserted into its `args` at that index. When such a call
+    modifies `data` (that is, any function other than `render` and `file`), the
+    resulting `data` is used for all subsequent calls. `cwd` and `paths`
+    default to the values given at the top level of the input.
+
+    The reply value is `{"results": [...], "data": {...}}`, with one result per
+    call in the same order. Each result is either a normal reply (without
+    the `data` that is returned once for the whole batch) or, if the call
+    raised an exception, `{"present": False, "error": "<traceback>"}`.
+
+    Unlike a single call, a call in a batch that raises an `Exception` doesn't
+    end the worker. The error is reported in its result, subsequent calls still
+    run, and the worker keeps handling inputs after the batch. A failed call
+    doesn't replace the shared `data`, but changes that it made to `data` in
+    place before raising are kept. Other exceptions, such as `SystemExit`, end
+    the worker like they do for a single call.
+    """
+    data = inp.get("data", None)
+    results = []
+
+    for call in inp.get("calls", []):
+        file = call.get("file", None)
+        fcn = call.get("fcn", None)
+        args = list(call.get("args", None) or [])
+        cwd = call.get("cwd", inp.get("cwd", None))
+        paths = call.get("paths", inp.get("paths", None)) or []
+        data_arg = call.get("data_arg", None)
+
+        if data_arg is not None:
+            args.insert(data_arg, data)
+
+        start = time.perf_counter()
+        try:
+            if file is None or file.endswith(".js"):
+                raise ValueError(f"Unsupported call in batch: {file}:{fcn}")
+
+            reply = run_instrumented_call(
+                file, fcn, args, cwd, paths, inp.get("instrument", None)
+            )
+        except Exception:
+            aggregate_metrics.observe_call(fcn, time.perf_counter() - start, error=True)
+            traceback.print_exc()
+            results.append({"present": False, "error": traceback.format_exc()})
+            continue
+        aggregate_metrics.observe_call(fcn, time.perf_counter() - start, error=False)
+
+        if data_arg is not None and reply["present"]:
+            if file == "question.html":
+                data = reply["val"].pop("data")
+            elif fcn != "file" and fcn != "render":
+                data = reply.pop("val")
+
+        results.append(reply)
+
+    return {"present": True, "val": {"results": results, "data": data}}
 
 
 def worker_loop():
-    # whether the PRNGs have already been seeded in this worker_loop() call
-    seeded = False
+    # Only the caller may select a course, so the write end of the switch pipe
+    # is closed before any question code runs in this worker.
+    switch_fd = switch_write_fd
 
     # file descriptor 3 is for output data
-    with open(3, "w", encoding="utf-8") as outf:
+    with open(3, "wb") as outf:
+        writer = get_reply_writer(reply_framing, outf)
+
         # Infinite loop where we wait for an input command, do it, and
         # return the results. The caller should terminate us with a
         # SIGTERM.
@@ -117,23 +410,20 @@ def worker_loop():
             args = inp.get("args", None)
             cwd = inp.get("cwd", None)
             paths = inp.get("paths", None)
+            instrument = inp.get("instrument", None)
 
             # "ping" is a special fake function name that the parent process
             # will use to check if the worker is active and able to respond to
             # calls. We just reply with "pong" to indicate that we're alive.
             if file is None and fcn == "ping":
-                json.dump({"present": True, "val": "pong"}, outf)
-                outf.write("\n")
-                outf.flush()
+                writer.write({"present": True, "val": "pong"})
                 continue
 
             # "restart" is a special fake function name that causes
             # the forked worker to exit, returning control to the
             # zygote parent process
             if file is None and fcn == "restart":
-                json.dump({"present": True, "val": "success"}, outf)
-                outf.write("\n")
-                outf.flush()
+                writer.write({"present": True, "val": "success"})
 
                 # `sys.exit()` allows the process to gracefully shut down. however, that
                 # makes things much slower than necessary, because we can't reuse this
@@ -145,262 +435,602 @@ def worker_loop():
                 # fast as possible.
                 os._exit(0)
 
-            if file.endswith(".js"):
-                # We've shoehorned legacy v2 questions into the v3 code caller
-                # so that we can reuse the same worker processes, and specifically
-                # so that we can reuse the container pool.
-                #
-                # Node doesn't support POSIX-style forks, so we can't use a zygote
-                # process like we do with Python. Instead, we'll exec a Node subprocess.
-                # Node generally boots up very quickly, so this should be fine.
-                result = subprocess.run(
-                    [
-                        "node",
-                        "./apps/prairielearn/dist/question-servers/calculation-worker.js",
-                    ],
-                    cwd=cwd,
-                    capture_output=True,
-                    # By convention, the first argument is an object that contains all
-                    # the call information.
-                    input=json.dumps(args[0]),
-                    encoding="utf-8",
-                )
-
-                # Proxy any output from the subprocess back to the caller.
-                # Note that we only deal with stderr, as the Node process rewrote
-                # the output streams so that writes to stdout actually go to stderr.
-                # This allows us to use stdout for the actual return value.
-                if result.stderr:
-                    print(result.stderr, file=sys.stderr)
-                    sys.stderr.flush()
-
-                # If the subprocess exited with a non-zero exit code, raise an exception.
-                result.check_returncode()
+            # "course" is a special fake function name that asks for all
+            # following calls to be handled by workers forked from a zygote
+            # that has preloaded the modules of the given course, with
+            # `args` being `[course_path, course_key]`. A `course_path` of
+            # `None` switches back to the base zygote. Like "restart", this
+            # ends the worker, and the exit confirmation is written to file
+            # descriptor 4 once a worker of the selected zygote is ready; see
+            # `run_course_zygote()` for details. It must be the first call
+            # after a restart that runs any code.
+            if file is None and fcn == "course":
+                if switch_fd is None:
+                    error = 'A "course" call must come before any code runs in a worker'
+                    writer.write({"present": False, "error": error})
+                    continue
+                course_path = args[0] if args else None
+                course_key = args[1] if args and len(args) > 1 else course_path
+                request = {"path": course_path, "key": course_key}
+                os.write(switch_fd, (json.dumps(request) + "\n").encode())
+                writer.write({"present": True, "val": "success"})
+                os._exit(0)
 
-                outf.write(result.stdout)
-                outf.write("\n")
-                outf.flush()
+            # "stats" is a special fake function name that returns the
+            # aggregate metrics of the zygote and all of its workers; see
+            # `zygote_metrics.py`.
+            if file is None and fcn == "stats":
+                writer.write({"present": True, "val": aggregate_metrics.snapshot()})
                 continue
 
-            # Here, we re-seed the PRNGs if not already seeded in this worker_loop() call.
-            # We only want to seed the PRNGs once per worker_loop() call, so that if a
-            # question happens to contain multiple occurrences of the same element, the
-            # randomizations for each occurrence are independent of each other but still
-            # dependent on the variant seed.
-            if type(args[-1]) is dict and not seeded:
-                variant_seed = args[-1].get("variant_seed", None)
-                random.seed(variant_seed)
-                numpy.random.seed(variant_seed)
-                seeded = True
-
-            # reset and then set up the path
-            sys.path = copy.copy(saved_path)
-            for path in reversed(paths):
-                sys.path.insert(0, path)
-            sys.path.insert(0, cwd)
-
-            # change to the desired working directory
-            os.chdir(cwd)
-
-            if file == "question.html":
-                # This is an experimental implementation of question processing
-                # that does all HTML parsing and rendering in Python. This should
-                # be much faster than the current implementation that does an IPC
-                # call for each element.
-
-                data = args[0]
-                context = args[1]
-
-                result, processed_elements = question_phases.process(fcn, data, context)
-                val = {
-                    "html": result if fcn == "render" else None,
-                    "file": result if fcn == "file" else None,
-                    "data": data,
-                    "processed_elements": list(processed_elements),
-                }
-
-                # make sure all output streams are flushed
-                sys.stderr.flush()
-                sys.stdout.flush()
-
-                # write the return value (JSON on a single line)
-                outf.write(try_dumps({"present": True, "val": val}))
-                outf.write("\n")
-                outf.flush()
-
-                continue
+            if switch_fd is not None:
+                os.close(switch_fd)
+                switch_fd = None
 
-            mod = {}
-            file_path = os.path.join(cwd, file + ".py")
-            with open(file_path, encoding="utf-8") as inf:
-                # use compile to associate filename with code object, so the
-                # filename appears in the traceback if there is an error
-                # (https://stackoverflow.com/a/437857)
-                code = compile(inf.read(), file_path, "exec")
-                exec(code, mod)
-
-            # check whether we have the desired fcn in the module
-            if fcn in mod:
-                # get the desired function in the loaded module
-                method = mod[fcn]
-
-                # check if the desired function is a legacy element function - if
-                # so, we add an argument for element_index
-                arg_names = list(signature(method).parameters.keys())
-                if (
-                    len(arg_names) == 3
-                    and arg_names[0] == "element_html"
-                    and arg_names[1] == "element_index"
-                    and arg_names[2] == "data"
-                ):
-                    args.insert(1, None)
-
-                # call the desired function in the loaded module
-                val = method(*args)
-
-                if fcn == "file":
-                    # if val is None, replace it with empty string
-                    if val is None:
-                        val = ""
-                    # if val is a file-like object, read whatever is inside
-                    if isinstance(val, io.IOBase):
-                        val.seek(0)
-                        val = val.read()
-                    # if val is a string, treat it as utf-8
-                    if isinstance(val, str):
-                        val = bytes(val, "utf-8")
-                    # if this next call does not work, it will throw an error, because
-                    # the thing returned by file() does not have the correct format
-                    val = base64.b64encode(val).decode()
-
-                # Any function that is not 'file' or 'render' will modify 'data' and
-                # should not be returning anything (because 'data' is mutable).
-                if (fcn != "file") and (fcn != "render"):
-                    if val is None:
-                        json_outp = try_dumps(
-                            {"present": True, "val": args[-1]}, allow_nan=False
-                        )
-                    else:
-                        json_outp_passed = try_dumps(
-                            {"present": True, "val": args[-1]},
-                            sort_keys=True,
-                            allow_nan=False,
-                        )
-                        json_outp = try_dumps(
-                            {"present": True, "val": val},
-                            sort_keys=True,
-                            allow_nan=False,
-                        )
-                        if json_outp_passed != json_outp:
-                            sys.stderr.write(
-                                'WARNING: Passed and returned value of "data" differ in the function '
-                                + str(fcn)
-                                + "() in the file "
-                                + str(cwd)
-                                + "/"
-                                + str(file)
-                                + ".py.\n\n passed:\n  "
-                                + str(args[-1])
-                                + "\n\n returned:\n  "
-                                + str(val)
-                                + '\n\nThere is no need to be returning "data" at all (it is mutable, i.e., passed by reference). In future, this code will throw a fatal error. For now, the returned value of "data" was used and the passed value was discarded.'
-                            )
+            start = time.perf_counter()
+            try:
+                if file is None and fcn == "batch":
+                    # "batch" is a special fake function name that runs several
+                    # calls in one go; see `run_batch()` for details.
+                    reply = run_batch(inp)
+                    json_reply = None
+                elif file.endswith(".js"):
+                    reply = None
+                    json_reply = run_v2_question(args, cwd)
                 else:
-                    json_outp = try_dumps(
-                        {"present": True, "val": val}, allow_nan=False
+                    reply = run_instrumented_call(
+                        file, fcn, args, cwd, paths, instrument
                     )
-            else:
-                # the function wasn't present, so report this
-                json_outp = try_dumps({"present": False}, allow_nan=False)
+                    json_reply = None
+            except BaseException:
+                aggregate_metrics.observe_call(
+                    fcn, time.perf_counter() - start, error=True
+                )
+                raise
+            aggregate_metrics.observe_call(
+                fcn, time.perf_counter() - start, error=False
+            )
 
             # make sure all output streams are flushed
             sys.stderr.flush()
             sys.stdout.flush()
 
-            # write the return value (JSON on a single line)
-            outf.write(json_outp)
-            outf.write("\n")
-            outf.flush()
+            # write the return value
+            if reply is not None:
+                writer.write(reply)
+            else:
+                writer.write_json(json_reply)
+
 
+# Aggregate metrics, shared with every process forked from here on.
+aggregate_metrics = zygote_metrics.ZygoteMetrics()
+
+# `ru_maxrss` is in kilobytes, except on macOS, where it's in bytes.
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
 
 worker_pid = 0
 
+# Number of workers to fork ahead of time. A standby worker is forked while
+# the active worker is still handling calls and then just waits until it's
+# activated, which takes forking off the critical path between one worker
+# exiting and the next one being ready to accept calls.
+standby_worker_count = max(0, int(os.environ.get("STANDBY_WORKERS", "1")))
+
+# Standby workers as (pid, activation fd) pairs, in the order they were forked.
+standby_workers = collections.deque()
+
+# A worker that handles a "course" call writes the requested course to this
+# pipe before exiting. Every zygote that forks workers has its own pipe.
+# Workers close the write end before they run any question code (see
+# `worker_loop()`), so question code can't select a course.
+switch_read_fd, switch_write_fd = os.pipe()
+os.set_blocking(switch_read_fd, False)
+
+# Course zygotes are forked from this (base) zygote and have additionally
+# preloaded the modules that a course lists in `serverFilesCourse/preload.json`.
+# Workers for that course are then forked from the course zygote instead. Only
+# one zygote hands out workers at any time; the others are paused. Paused
+# course zygotes are evicted, least recently used first, when there are more
+# than `course_zygote_limit` of them or when they use more than
+# `course_zygote_memory_budget` bytes of memory in total.
+CourseZygote = collections.namedtuple(
+    "CourseZygote",
+    ["pid", "uid", "control_fd", "reply_file", "file_signatures", "report"],
+)
+course_zygotes = collections.OrderedDict()
+course_zygote_limit = max(0, int(os.environ.get("COURSE_ZYGOTE_LIMIT", "4")))
+course_zygote_memory_budget = (
+    int(os.environ.get("COURSE_ZYGOTE_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024
+)
+
+# When privileges are dropped, each course zygote and its workers run as a user
+# of their own instead of `executor`. A paused course zygote outlives the
+# requests for other courses, and this keeps their workers from signaling or
+# tracing it. There is one more user than `course_zygote_limit`, for the course
+# zygote that is started before the least recently used one is evicted. These
+# users don't need to exist, but nothing else may run as them.
+course_zygote_first_uid = int(os.environ.get("COURSE_ZYGOTE_FIRST_UID", "20000"))
+course_zygote_uids = range(
+    course_zygote_first_uid, course_zygote_first_uid + max(1, course_zygote_limit) + 1
+)
+
+# Look up the deprivileged user once instead of in every worker. Workers run as
+# `worker_uid`, which course zygotes change to their own user.
+if drop_privileges:
+    import pwd
+
+    executor_user = pwd.getpwnam("executor")
+    worker_uid = executor_user.pw_uid
+
 
 def terminate_worker(signum, stack):
     if worker_pid > 0:
         os.kill(worker_pid, signal.SIGKILL)
+    for pid, _ in standby_workers:
+        os.kill(pid, signal.SIGKILL)
+    for zygote in course_zygotes.values():
+        os.kill(zygote.pid, signal.SIGTERM)
     os._exit(0)
 
 
 signal.signal(signal.SIGTERM, terminate_worker)
 signal.signal(signal.SIGINT, terminate_worker)  # Ctrl-C case
 
-with open(4, "w", encoding="utf-8") as exitf:
-    while True:
-        worker_pid = os.fork()
-        if worker_pid == 0:
-            # Ensure that no code running in the worker can interact with
-            # file descriptor 4
-            exitf.close()
 
-            # If configured to do so, drop to a deprivileged user before running
-            # any user code. This should generally only be enabled when running
-            # in Docker, as the `prairielearn/executor` image will be guaranteed
-            # to have the user that we drop to.
-            if drop_privileges:
-                import pwd
+def fork_worker(exitf):
+    """
+    Forks a worker that blocks until a byte is written to the returned file
+    descriptor, and then starts handling calls. Returns a (pid, fd) pair.
+    """
+    global worker_pid
+
+    activation_read_fd, activation_write_fd = os.pipe()
+    pid = os.fork()
+    if pid != 0:
+        os.close(activation_read_fd)
+        return pid, activation_write_fd
 
-                user = pwd.getpwnam("executor")
-                os.setgid(user.pw_gid)
-                os.setuid(user.pw_uid)
+    # This is the worker. It must not try to kill anything on SIGTERM, and it
+    # must not hold on to any other worker's activation fd.
+    worker_pid = 0
+    os.close(activation_write_fd)
+    for _, fd in standby_workers:
+        os.close(fd)
+    standby_workers.clear()
+    os.close(switch_read_fd)
+    for zygote in course_zygotes.values():
+        os.close(zygote.control_fd)
+        zygote.reply_file.close()
+    course_zygotes.clear()
 
-            worker_loop()
+    # Ensure that no code running in the worker can interact with
+    # file descriptor 4
+    exitf.close()
 
+    # Wait until we're activated. If the zygote goes away first, we'll read
+    # EOF and should just go away too.
+    activated = os.read(activation_read_fd, 1)
+    os.close(activation_read_fd)
+    if not activated:
+        os._exit(0)
+
+    # If configured to do so, drop to a deprivileged user before running
+    # any user code. This should generally only be enabled when running
+    # in Docker, as the `prairielearn/executor` image will be guaranteed
+    # to have the user that we drop to.
+    #
+    # Standby workers of the base zygote only do this once they're activated:
+    # the cleanup after the previous worker kills every process belonging to
+    # `executor`, which would otherwise include the standby workers. Workers
+    # of a course zygote already run as the course zygote's user.
+    if drop_privileges:
+        os.setgid(executor_user.pw_gid)
+        os.setuid(worker_uid)
+
+    worker_loop()
+
+    # `worker_loop()` never returns normally.
+    os._exit(0)
+
+
+def activate_worker(exitf):
+    """
+    Activates the oldest standby worker, forking a new one if there are no
+    live standby workers. Returns the pid of the activated worker and whether
+    it was a standby worker.
+    """
+    while standby_workers:
+        pid, fd = standby_workers.popleft()
+        try:
+            os.write(fd, b"\0")
+            return pid, True
+        except OSError:
+            # The standby worker died; reap it and try the next one.
+            os.waitpid(pid, os.WNOHANG)
+        finally:
+            os.close(fd)
+
+    pid, fd = fork_worker(exitf)
+    os.write(fd, b"\0")
+    os.close(fd)
+    return pid, False
+
+
+def replenish_standby_workers(exitf):
+    while len(standby_workers) < standby_worker_count:
+        standby_workers.append(fork_worker(exitf))
+
+
+def retire_standby_workers():
+    # Standby workers exit by themselves once their activation fd is closed.
+    while standby_workers:
+        pid, fd = standby_workers.popleft()
+        os.close(fd)
+        os.waitpid(pid, 0)
+
+
+def kill_user_processes(uid, protected_pids):
+    """
+    Kills all processes of the given user, except for the given processes,
+    and checks that they are all gone.
+    """
+    import psutil
+
+    def remaining_processes():
+        # Killed processes that haven't been reaped yet can't do anything.
+        return [
+            p
+            for p in psutil.process_iter(["uids", "status"])
+            if p.info["uids"].real == uid
+            and p.info["status"] != psutil.STATUS_ZOMBIE
+            and p.pid not in protected_pids
+        ]
+
+    if not protected_pids:
+        os.system(f"pkill -U {uid} --signal SIGKILL")
+    else:
+        for p in remaining_processes():
+            try:
+                p.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+    # Check that all processes are gone. If they're not,
+    # that probably means that someone is trying to escape
+    # by repeatedly forking. In that case, we'll refuse to
+    # write an exit confirmation to FD 4. This process will
+    # be killed, and if we're running inside a Docker container,
+    # the entire container should be killed too.
+    if remaining_processes():
+        raise Exception(f"found remaining processes belonging to user {uid}")
+
+
+def read_course_request():
+    """
+    Returns the course that the worker that just exited asked for, or `None`
+    if it didn't ask for a course.
+    """
+    chunks = []
+    while True:
+        try:
+            chunk = os.read(switch_read_fd, 65536)
+        except BlockingIOError:
             break
-        else:
-            pid, status = os.waitpid(worker_pid, 0)
-            worker_pid = 0
-            if os.WIFEXITED(status):
-                if os.WEXITSTATUS(status) == 0:
-                    # Everything is ok, the worker exited gracefully,
-                    # just repeat
-
-                    exited = True
-
-                    # Once this child exits, clean up after it if we
-                    # were running as the `executor` user
-                    if drop_privileges:
-                        # Kill all processes started by `executor`.
-                        os.system("pkill -u executor --signal SIGKILL")
-
-                        # Check that all processes are gone. If they're not,
-                        # that probably means that someone is trying to escape
-                        # by repeatedly forking. In that case, we'll refuse to
-                        # write an exit confirmation to FD 4. This process will
-                        # be killed, and if we're running inside a Docker container,
-                        # the entire container should be killed too.
-                        import psutil
-
-                        if any(
-                            p.username() == "executor" for p in psutil.process_iter()
-                        ):
-                            raise Exception(
-                                "found remaining processes belonging to executor user"
-                            )
-
-                    # We'll need to write a confirmation message on file
-                    # descriptor 4 so that PL knows that control was actually
-                    # returned to the zygote.
-                    json.dump({"exited": True}, exitf)
-                    exitf.write("\n")
-                    exitf.flush()
-                else:
-                    # The worker did not exit gracefully
-                    raise Exception(
-                        "worker process exited unexpectedly with status %d" % status
-                    )
+        if not chunk:
+            break
+        chunks.append(chunk)
+    if not chunks:
+        return None
+    return json.loads(b"".join(chunks).splitlines()[-1])
+
+
+def write_exit_confirmation(exitf, exited_at, cleaned_up_at, used_standby_worker):
+    """
+    Writes a confirmation message on file descriptor 4 so that PL knows that
+    control was actually returned to a zygote. We include how long it took
+    until the next worker was ready to accept calls.
+    """
+    ready_at = time.monotonic()
+    aggregate_metrics.observe_time_to_ready(ready_at - exited_at)
+    json.dump(
+        {
+            "exited": True,
+            "metrics": {
+                "cleanup_ms": (cleaned_up_at - exited_at) * 1000,
+                "time_to_ready_ms": (ready_at - exited_at) * 1000,
+                "used_standby_worker": used_standby_worker,
+            },
+        },
+        exitf,
+    )
+    exitf.write("\n")
+    exitf.flush()
+
+
+def serve(exitf, course_key=None, switch=None):
+    """
+    Hands out workers one after another until a worker asks for a course other
+    than `course_key`, and returns that course. If this zygote takes over from
+    another one after a worker asked for a course, `switch` is that request,
+    which is confirmed once the first worker is ready.
+    """
+    global worker_pid
+
+    worker_pid, used_standby_worker = activate_worker(exitf)
+    if switch is not None:
+        write_exit_confirmation(
+            exitf, switch["exited_at"], switch["cleaned_up_at"], used_standby_worker
+        )
+    replenish_standby_workers(exitf)
+
+    while True:
+        pid, status, rusage = os.wait4(worker_pid, 0)
+        worker_pid = 0
+        exited_at = time.monotonic()
+        aggregate_metrics.observe_worker_max_rss(rusage.ru_maxrss * MAXRSS_UNIT)
+        if os.WIFEXITED(status):
+            if os.WEXITSTATUS(status) == 0:
+                # Everything is ok, the worker exited gracefully,
+                # just repeat
+
+                # Once this child exits, clean up after it if we
+                # were running as a deprivileged user. A course zygote
+                # runs as the same user as its workers, and so do its
+                # standby workers, which are forked from it. Standby
+                # workers of the base zygote are still root until
+                # they're activated, so they don't need to be spared.
+                if drop_privileges:
+                    if course_key is None:
+                        kill_user_processes(worker_uid, frozenset())
+                    else:
+                        kill_user_processes(
+                            worker_uid,
+                            {os.getpid()} | {pid for pid, _ in standby_workers},
+                        )
+
+                cleaned_up_at = time.monotonic()
+                aggregate_metrics.observe_cleanup(cleaned_up_at - exited_at)
+
+                # The zygote that takes over confirms the exit. Monotonic
+                # times are comparable between processes.
+                course = read_course_request()
+                if course is not None and course["key"] != course_key:
+                    course["exited_at"] = exited_at
+                    course["cleaned_up_at"] = cleaned_up_at
+                    return course
+
+                worker_pid, used_standby_worker = activate_worker(exitf)
+                write_exit_confirmation(
+                    exitf, exited_at, cleaned_up_at, used_standby_worker
+                )
+
+                # Fork the next standby worker while the new worker is busy.
+                replenish_standby_workers(exitf)
             else:
-                # Something else happened that is weird
+                # The worker did not exit gracefully
                 raise Exception(
                     "worker process exited unexpectedly with status %d" % status
                 )
+        else:
+            # Something else happened that is weird
+            raise Exception(
+                "worker process exited unexpectedly with status %d" % status
+            )
+
+
+def get_course_file_signatures(course_path):
+    """
+    Returns the mtime of the course's preload manifest and of every module that
+    was loaded from `serverFilesCourse`, so that a course zygote can be
+    replaced once any of them changes.
+    """
+    server_files_path = os.path.join(os.path.abspath(course_path), "serverFilesCourse")
+    paths = {preload.get_course_manifest_path(course_path)}
+    for module in list(sys.modules.values()):
+        module_path = getattr(module, "__file__", None)
+        if module_path and module_path.startswith(server_files_path + os.sep):
+            paths.add(module_path)
+
+    signatures = {}
+    for path in paths:
+        try:
+            signatures[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            signatures[path] = None
+    return signatures
+
+
+def course_zygote_main(course, uid, exitf, control_fd, reply_fd):
+    """
+    Preloads the modules of the given course, reports back to the base zygote
+    and then serves workers for the course every time it's resumed.
+    """
+    global worker_uid
+
+    # Course modules are course code, so they must not run as root. Changing
+    # credentials also makes this process non-dumpable, which keeps workers
+    # from attaching to it.
+    if drop_privileges:
+        os.setgid(executor_user.pw_gid)
+        os.setuid(uid)
+        worker_uid = uid
+
+    sys.path.insert(
+        0, os.path.join(os.path.abspath(course["path"]), "serverFilesCourse")
+    )
+    try:
+        manifest = preload.load_course_manifest(course["path"])
+    except Exception:
+        traceback.print_exc()
+        manifest = {"modules": [], "warmups": []}
+    report = preload.preload(manifest)
+    sys.stderr.flush()
+
+    with os.fdopen(control_fd, "r", encoding="utf-8") as control, os.fdopen(
+        reply_fd, "w", encoding="utf-8"
+    ) as reply:
+        json.dump(
+            {
+                "file_signatures": get_course_file_signatures(course["path"]),
+                "report": report,
+            },
+            reply,
+        )
+        reply.write("\n")
+        reply.flush()
+
+        while True:
+            line = control.readline()
+            if not line:
+                # The base zygote is gone.
+                os._exit(0)
+
+            next_course = serve(exitf, course["key"], json.loads(line))
+
+            # While paused, the course zygote is the only process that runs
+            # as its user.
+            retire_standby_workers()
+
+            json.dump({"course": next_course}, reply)
+            reply.write("\n")
+            reply.flush()
+
+
+def start_course_zygote(course, uid, exitf):
+    global switch_read_fd, switch_write_fd
+
+    control_read_fd, control_write_fd = os.pipe()
+    reply_read_fd, reply_write_fd = os.pipe()
+    pid = os.fork()
+    if pid != 0:
+        os.close(control_read_fd)
+        os.close(reply_write_fd)
+        reply_file = os.fdopen(reply_read_fd, "r", encoding="utf-8")
+        ready = json.loads(reply_file.readline() or "null")
+        if ready is None:
+            os.waitpid(pid, 0)
+            raise Exception("course zygote exited unexpectedly")
+        return CourseZygote(
+            pid,
+            uid,
+            control_write_fd,
+            reply_file,
+            ready["file_signatures"],
+            ready["report"],
+        )
+
+    # This is the course zygote. Like a worker, it must not hold on to anything
+    # that belongs to the base zygote.
+    os.close(control_write_fd)
+    os.close(reply_read_fd)
+    for _, fd in standby_workers:
+        os.close(fd)
+    standby_workers.clear()
+    for zygote in course_zygotes.values():
+        os.close(zygote.control_fd)
+        zygote.reply_file.close()
+    course_zygotes.clear()
+    os.close(switch_read_fd)
+    os.close(switch_write_fd)
+    switch_read_fd, switch_write_fd = os.pipe()
+    os.set_blocking(switch_read_fd, False)
+
+    try:
+        course_zygote_main(course, uid, exitf, control_read_fd, reply_write_fd)
+    except BaseException:
+        traceback.print_exc()
+        sys.stderr.flush()
+    os._exit(1)
+
+
+def stop_course_zygote(zygote):
+    os.close(zygote.control_fd)
+    zygote.reply_file.close()
+    try:
+        os.kill(zygote.pid, signal.SIGTERM)
+        os.waitpid(zygote.pid, 0)
+    except (ProcessLookupError, ChildProcessError):
+        # It already exited and was reaped.
+        pass
+
+    # Nothing of the course may be left behind once its user is reused.
+    if drop_privileges:
+        kill_user_processes(zygote.uid, frozenset())
+
+
+def is_course_zygote_current(zygote):
+    try:
+        pid, _ = os.waitpid(zygote.pid, os.WNOHANG)
+    except ChildProcessError:
+        return False
+    if pid != 0:
+        return False
+    for path, mtime_ns in zygote.file_signatures.items():
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            if mtime_ns is not None:
+                return False
+    return True
+
+
+def evict_course_zygotes(keep_key):
+    import psutil
+
+    def memory_usage(zygote):
+        try:
+            return psutil.Process(zygote.pid).memory_full_info().uss
+        except psutil.Error:
+            return 0
+
+    usage = {key: memory_usage(zygote) for key, zygote in course_zygotes.items()}
+    for key in list(course_zygotes):
+        if key == keep_key:
+            continue
+        if (
+            len(course_zygotes) <= course_zygote_limit
+            and sum(usage.values()) <= course_zygote_memory_budget
+        ):
+            break
+        stop_course_zygote(course_zygotes.pop(key))
+        del usage[key]
+
+
+def run_course_zygote(course, exitf):
+    """
+    Resumes the zygote for the given course, starting it if needed, and waits
+    until one of its workers asks for a different course, which is returned.
+    """
+    key = course["key"]
+    zygote = course_zygotes.pop(key, None)
+    if zygote is not None and not is_course_zygote_current(zygote):
+        stop_course_zygote(zygote)
+        zygote = None
+
+    # The most recently used course zygote goes last.
+    if zygote is None:
+        used_uids = {z.uid for z in course_zygotes.values()}
+        uid = next(uid for uid in course_zygote_uids if uid not in used_uids)
+        course_zygotes[key] = start_course_zygote(course, uid, exitf)
+        evict_course_zygotes(key)
+    else:
+        course_zygotes[key] = zygote
+    zygote = course_zygotes[key]
+
+    # Resume the course zygote, which confirms the switch.
+    os.write(zygote.control_fd, (json.dumps(course) + "\n").encode())
+
+    line = zygote.reply_file.readline()
+    if not line:
+        raise Exception("course zygote exited unexpectedly")
+    return json.loads(line)["course"]
+
+
+with open(4, "w", encoding="utf-8") as exitf:
+    course = serve(exitf)
+    while True:
+        if course["key"] is None:
+            course = serve(exitf, switch=course)
+        else:
+            course = run_course_zygote(course, exitf)
@@ -0,0 +1,171 @@
+# Aggregate metrics for the zygote and its workers, which can be read with the
+# special "stats" call (see `zygote.py`).
+#
+# Workers only live for a single request, so they can't keep aggregate numbers
+# themselves. Instead, the metrics are stored in an anonymous shared memory
+# mapping that the zygote creates before it forks anything. Every process that
+# is forked from the zygote, directly or through a course zygote, writes to
+# the same mapping, and reading it always gives the current values. No locking
+# is needed: each value is only ever written by one process at a time, since
+# only one worker is active at a time and the zygote only records its own
+# values (e.g. how long it took to clean up after a worker).
+#
+# Histograms have fixed buckets and are reported with the number of
+# observations in each bucket (not cumulative), where a bucket contains the
+# values that are less than or equal to its upper bound and greater than the
+# previous bound. The last bucket has no upper bound.
+
+import bisect
+import mmap
+import time
+from typing import Optional, Sequence, TypedDict
+
+# Upper bounds of the buckets for durations, in seconds.
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Upper bounds of the buckets for memory usage, in bytes.
+MEMORY_BUCKETS = tuple(
+    size * 1024 * 1024 for size in (64, 128, 256, 512, 1024, 2048, 4096)
+)
+
+# Calls are grouped by function name. Anything not listed here is counted
+# under "other" so that the shared mapping can have a fixed size.
+CALL_FUNCTIONS = (
+    "generate",
+    "prepare",
+    "render",
+    "parse",
+    "grade",
+    "test",
+    "file",
+    "batch",
+    "other",
+)
+
+
+class HistogramSnapshot(TypedDict):
+    count: int
+    sum: float
+    buckets: list[tuple[Optional[float], int]]
+
+
+class CallSnapshot(HistogramSnapshot):
+    errors: int
+
+
+class MetricsSnapshot(TypedDict):
+    uptime_seconds: float
+    calls: dict[str, CallSnapshot]
+    time_to_ready_seconds: HistogramSnapshot
+    cleanup_seconds: HistogramSnapshot
+    worker_max_rss_bytes: HistogramSnapshot
+
+
+class Histogram:
+    def __init__(self, values: memoryview, offset: int, bounds: Sequence[float]):
+        self._values = values
+        self._offset = offset
+        self._bounds = bounds
+
+    @staticmethod
+    def size(bounds: Sequence[float]) -> int:
+        # The count, the sum, and one value per bucket.
+        return 2 + len(bounds) + 1
+
+    def observe(self, value: float) -> None:
+        self._values[self._offset] += 1
+        self._values[self._offset + 1] += value
+        bucket = bisect.bisect_left(self._bounds, value)
+        self._values[self._offset + 2 + bucket] += 1
+
+    def snapshot(self) -> HistogramSnapshot:
+        counts = self._values[self._offset + 2 : self._offset + self.size(self._bounds)]
+        return {
+            "count": int(self._values[self._offset]),
+            "sum": self._values[self._offset + 1],
+            "buckets": [
+                (bound, int(count))
+                for bound, count in zip([*self._bounds, None], counts)
+            ],
+        }
+
+
+class ZygoteMetrics:
+    """
+    Metrics that are shared with every process that's forked after this
+    object is created.
+    """
+
+    def __init__(self) -> None:
+        histograms = [
+            *((f"calls.{fcn}", DURATION_BUCKETS) for fcn in CALL_FUNCTIONS),
+            ("time_to_ready_seconds", DURATION_BUCKETS),
+            ("cleanup_seconds", DURATION_BUCKETS),
+            ("worker_max_rss_bytes", MEMORY_BUCKETS),
+        ]
+        # The start time, then the number of errors for each function, then
+        # the histograms.
+        size = 1 + len(CALL_FUNCTIONS)
+        size += sum(Histogram.size(bounds) for _, bounds in histograms)
+
+        # An anonymous mapping is shared with forked processes.
+        self._mmap = mmap.mmap(-1, size * 8)
+        self._values = memoryview(self._mmap).cast("d")
+        self._values[0] = time.time()
+
+        self._histograms: dict[str, Histogram] = {}
+        offset = 1 + len(CALL_FUNCTIONS)
+        for name, bounds in histograms:
+            self._histograms[name] = Histogram(self._values, offset, bounds)
+            offset += Histogram.size(bounds)
+
+    def observe_call(self, fcn: Optional[str], seconds: float, error: bool) -> None:
+        if fcn not in CALL_FUNCTIONS:
+            fcn = "other"
+        self._histograms[f"calls.{fcn}"].observe(seconds)
+        if error:
+            self._values[1 + CALL_FUNCTIONS.index(fcn)] += 1
+
+    def observe_time_to_ready(self, seconds: float) -> None:
+        self._histograms["time_to_ready_seconds"].observe(seconds)
+
+    def observe_cleanup(self, seconds: float) -> None:
+        self._histograms["cleanup_seconds"].observe(seconds)
+
+    def observe_worker_max_rss(self, size: int) -> None:
+        self._histograms["worker_max_rss_bytes"].observe(size)
+
+    def snapshot(self) -> MetricsSnapshot:
+        calls: dict[str, CallSnapshot] = {}
+        for i, fcn in enumerate(CALL_FUNCTIONS):
+            histogram = self._histograms[f"calls.{fcn}"].snapshot()
+            calls[fcn] = {
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "buckets": histogram["buckets"],
+                "errors": int(self._values[1 + i]),
+            }
+
+        return {
+            "uptime_seconds": time.time() - self._values[0],
+            "calls": calls,
+            "time_to_ready_seconds": self._histograms[
+                "time_to_ready_seconds"
+            ].snapshot(),
+            "cleanup_seconds": self._histograms["cleanup_seconds"].snapshot(),
+            "worker_max_rss_bytes": self._histograms["worker_max_rss_bytes"].snapshot(),
+        }
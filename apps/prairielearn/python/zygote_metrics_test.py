@@ -0,0 +1,42 @@
+import os
+
+import pytest
+from zygote_metrics import DURATION_BUCKETS, ZygoteMetrics
+
+
+def test_observe_call() -> None:
+    metrics = ZygoteMetrics()
+    metrics.observe_call("render", 0.001, error=False)
+    metrics.observe_call("render", 0.3, error=True)
+    metrics.observe_call("render", 60, error=False)
+    metrics.observe_call("some_custom_function", 0.02, error=False)
+
+    render = metrics.snapshot()["calls"]["render"]
+    assert render["count"] == 3
+    assert render["sum"] == pytest.approx(60.301)
+    assert render["errors"] == 1
+    assert len(render["buckets"]) == len(DURATION_BUCKETS) + 1
+    assert render["buckets"][0] == (0.001, 1)
+    assert dict(render["buckets"])[0.5] == 1
+    assert render["buckets"][-1] == (None, 1)
+
+    other = metrics.snapshot()["calls"]["other"]
+    assert other["count"] == 1
+    assert other["errors"] == 0
+
+
+def test_metrics_are_shared_with_forked_processes() -> None:
+    metrics = ZygoteMetrics()
+
+    pid = os.fork()
+    if pid == 0:
+        metrics.observe_cleanup(0.002)
+        metrics.observe_worker_max_rss(100 * 1024 * 1024)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["cleanup_seconds"]["count"] == 1
+    assert snapshot["worker_max_rss_bytes"]["count"] == 1
+    assert snapshot["time_to_ready_seconds"]["count"] == 0
+    assert snapshot["uptime_seconds"] >= 0
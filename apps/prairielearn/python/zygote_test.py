@@ -0,0 +1,491 @@
+import fcntl
+import json
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import psutil
+import pytest
+
+ZYGOTE_PATH = Path(__file__).parent / "zygote.py"
+
+WORKER_CODE = """\
+import json
+import os
+import subprocess
+import sys
+
+
+def render(data):
+    return json.dumps(
+        {
+            "pid": os.getpid(),
+            "ppid": os.getppid(),
+            "uid": os.getuid(),
+            "preloaded": "course_helper" in sys.modules,
+        }
+    )
+
+
+def spawn(data):
+    # Leaves a process behind for the cleanup after this worker.
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    return json.dumps({"pid": process.pid})
+
+
+def count(data):
+    data["count"] = data.get("count", 0) + 1
+
+
+def fail(data):
+    data["failed"] = True
+    raise ValueError("failed on purpose")
+
+
+def switch(data):
+    # Tries to select a course like a "course" call would.
+    import __main__
+
+    request = json.dumps({"path": data["path"], "key": data["path"]}) + "\\n"
+    try:
+        os.write(__main__.switch_write_fd, request.encode())
+    except OSError:
+        pass
+    return json.dumps(None)
+
+
+def can_signal(data):
+    try:
+        os.kill(data["pid"], 0)
+    except PermissionError:
+        return json.dumps(False)
+    return json.dumps(True)
+"""
+
+
+def can_drop_privileges() -> bool:
+    if os.getuid() != 0:
+        return False
+    try:
+        import pwd
+
+        pwd.getpwnam("executor")
+    except KeyError:
+        return False
+    return True
+
+
+requires_privileges = pytest.mark.skipif(
+    not can_drop_privileges(), reason="needs root and an executor user"
+)
+
+
+class Zygote:
+    """Runs `zygote.py` and talks to it like the code callers do."""
+
+    def __init__(self, tmp_path: Path, **env: str) -> None:
+        manifest_path = tmp_path / "preload.json"
+        manifest_path.write_text(json.dumps({"include_defaults": False}))
+        # Workers may run as `executor`, which can't read `tmp_path`.
+        self.worker_path = Path(tempfile.mkdtemp())
+        self.worker_path.chmod(0o755)
+        (self.worker_path / "worker.py").write_text(WORKER_CODE)
+
+        reply_read_fd, reply_write_fd = os.pipe()
+        exit_read_fd, exit_write_fd = os.pipe()
+
+        def move_fds() -> None:
+            # Replies are written to file descriptor 3 and exit confirmations
+            # to file descriptor 4.
+            fds = [
+                fcntl.fcntl(fd, fcntl.F_DUPFD, 10)
+                for fd in (reply_write_fd, exit_write_fd)
+            ]
+            for target, fd in zip((3, 4), fds):
+                os.dup2(fd, target)
+
+        with open(tmp_path / "stderr", "w") as stderr:
+            self.process = subprocess.Popen(
+                [sys.executable, str(ZYGOTE_PATH)],
+                cwd=ZYGOTE_PATH.parent,
+                stdin=subprocess.PIPE,
+                stdout=stderr,
+                stderr=stderr,
+                env={
+                    **os.environ,
+                    "PRELOAD_MANIFEST": str(manifest_path),
+                    "PL_CODE_CACHE_DIR": str(tmp_path / "code_cache"),
+                    **env,
+                },
+                close_fds=False,
+                preexec_fn=move_fds,
+            )
+        os.close(reply_write_fd)
+        os.close(exit_write_fd)
+        self.reply_fd = reply_read_fd
+        self.exit_fd = exit_read_fd
+        self.buffers = {reply_read_fd: b"", exit_read_fd: b""}
+
+    def readline(self, fd: int, timeout: float = 30) -> Any:
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.buffers[fd]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError("no reply from the zygote")
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError("the zygote exited")
+            self.buffers[fd] += chunk
+        line, self.buffers[fd] = self.buffers[fd].split(b"\n", 1)
+        return json.loads(line)
+
+    def has_exit_confirmation(self, timeout: float = 0.1) -> bool:
+        if b"\n" in self.buffers[self.exit_fd]:
+            return True
+        return bool(select.select([self.exit_fd], [], [], timeout)[0])
+
+    def call(
+        self, fcn: str, file: Any = None, args: Any = None, instrument: Any = None
+    ) -> Any:
+        return self.send(
+            {"file": file, "fcn": fcn, "args": args, "instrument": instrument}
+        )
+
+    def send(self, inp: dict) -> Any:
+        inp = {"cwd": str(self.worker_path), "paths": [], **inp}
+        assert self.process.stdin is not None
+        self.process.stdin.write((json.dumps(inp) + "\n").encode())
+        self.process.stdin.flush()
+        return self.readline(self.reply_fd)
+
+    def make_course(self, name: str) -> str:
+        server_files_path = self.worker_path / name / "serverFilesCourse"
+        server_files_path.mkdir(parents=True)
+        (server_files_path / "preload.json").write_text(
+            json.dumps({"modules": ["course_helper"]})
+        )
+        (server_files_path / "course_helper.py").write_text("")
+        return str(server_files_path.parent)
+
+    def switch_course(self, course_path: Any) -> dict:
+        # A course can only be selected before any code runs in a worker.
+        self.restart()
+        assert self.call("course", None, [course_path])["val"] == "success"
+        return self.readline(self.exit_fd)
+
+    def worker_info(self) -> dict:
+        return json.loads(self.call("render", "worker", [{}])["val"])
+
+    def restart(self) -> dict:
+        assert self.call("restart")["val"] == "success"
+        return self.readline(self.exit_fd)
+
+    def children(self) -> set[int]:
+        return {
+            child.pid
+            for child in psutil.Process(self.process.pid).children()
+            if child.status() != psutil.STATUS_ZOMBIE
+        }
+
+    def wait_for_children(self, count: int) -> set[int]:
+        deadline = time.monotonic() + 10
+        while len(self.children()) != count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.children()
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(10)
+        assert self.process.stdin is not None
+        self.process.stdin.close()
+        os.close(self.reply_fd)
+        os.close(self.exit_fd)
+        shutil.rmtree(self.worker_path)
+
+
+@pytest.fixture
+def start_zygote(tmp_path: Path):
+    zygotes = []
+
+    def start(**env: str) -> Zygote:
+        zygote = Zygote(tmp_path, **env)
+        zygotes.append(zygote)
+        return zygote
+
+    yield start
+    for zygote in zygotes:
+        zygote.close()
+
+
+def is_gone(pid: int) -> bool:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            if psutil.Process(pid).status() == psutil.STATUS_ZOMBIE:
+                return True
+        except psutil.NoSuchProcess:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_instrumented_call_code_cache(start_zygote) -> None:
+    zygote = start_zygote()
+    first = zygote.call("render", "worker", [{}], instrument="timing")
+    second = zygote.call("render", "worker", [{}], instrument="timing")
+
+    assert first["metrics"]["code_cache"]["misses"] == 1
+    assert first["metrics"]["code_cache"]["hits"] == 0
+    assert second["metrics"]["code_cache"]["misses"] == 0
+    assert second["metrics"]["code_cache"]["hits"] == 1
+
+
+def test_batch(start_zygote) -> None:
+    zygote = start_zygote()
+    pid = zygote.worker_info()["pid"]
+    reply = zygote.send(
+        {
+            "fcn": "batch",
+            "data": {},
+            "calls": [
+                {"file": "worker", "fcn": "count", "args": [], "data_arg": 0},
+                {"file": "worker", "fcn": "count", "args": [], "data_arg": 0},
+                {"file": "worker", "fcn": "render", "args": [], "data_arg": 0},
+            ],
+        }
+    )
+
+    assert reply["present"]
+    results = reply["val"]["results"]
+    assert [result["present"] for result in results] == [True, True, True]
+    assert json.loads(results[2]["val"])["pid"] == pid
+    assert reply["val"]["data"] == {"count": 2}
+
+
+def test_batch_error(start_zygote) -> None:
+    zygote = start_zygote()
+    pid = zygote.worker_info()["pid"]
+    reply = zygote.send(
+        {
+            "fcn": "batch",
+            "data": {},
+            "calls": [
+                {"file": "worker", "fcn": "count", "args": [], "data_arg": 0},
+                {"file": "worker", "fcn": "fail", "args": [], "data_arg": 0},
+                {"file": "worker", "fcn": "count", "args": [], "data_arg": 0},
+            ],
+        }
+    )
+
+    # The failed call is reported, and the calls after it still run.
+    results = reply["val"]["results"]
+    assert [result["present"] for result in results] == [True, False, True]
+    assert "failed on purpose" in results[1]["error"]
+    assert reply["val"]["data"] == {"count": 2, "failed": True}
+
+    # The worker keeps handling calls, and restarts as usual.
+    assert zygote.worker_info()["pid"] == pid
+    assert zygote.restart()["exited"]
+    assert zygote.worker_info()["pid"] != pid
+
+
+def test_standby_worker_is_activated(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="1")
+    first = zygote.worker_info()
+    children = zygote.wait_for_children(2)
+    assert first["pid"] in children
+    (standby_pid,) = children - {first["pid"]}
+
+    confirmation = zygote.restart()
+    assert confirmation["exited"]
+    assert confirmation["metrics"]["used_standby_worker"]
+    assert zygote.worker_info()["pid"] == standby_pid
+
+    # A new standby worker is forked for the next restart.
+    assert len(zygote.wait_for_children(2)) == 2
+
+
+def test_dead_standby_worker_is_replaced(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="1")
+    first = zygote.worker_info()
+    (standby_pid,) = zygote.wait_for_children(2) - {first["pid"]}
+    os.kill(standby_pid, signal.SIGKILL)
+    assert is_gone(standby_pid)
+
+    confirmation = zygote.restart()
+    assert not confirmation["metrics"]["used_standby_worker"]
+    assert zygote.worker_info()["pid"] not in (first["pid"], standby_pid)
+
+
+def test_no_standby_workers(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="0")
+    first = zygote.worker_info()
+    assert zygote.wait_for_children(1) == {first["pid"]}
+
+    confirmation = zygote.restart()
+    assert not confirmation["metrics"]["used_standby_worker"]
+    assert zygote.worker_info()["pid"] != first["pid"]
+
+
+def test_terminate_ends_standby_workers(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="2")
+    zygote.worker_info()
+    children = zygote.wait_for_children(3)
+
+    zygote.process.terminate()
+    zygote.process.wait(10)
+    assert all(is_gone(pid) for pid in children)
+
+
+@requires_privileges
+def test_cleanup_spares_privileged_standby_worker(start_zygote) -> None:
+    import pwd
+
+    zygote = start_zygote(STANDBY_WORKERS="1", DROP_PRIVILEGES="1")
+    first = zygote.worker_info()
+    assert first["uid"] == pwd.getpwnam("executor").pw_uid
+    (standby_pid,) = zygote.wait_for_children(2) - {first["pid"]}
+    assert psutil.Process(standby_pid).uids().real == 0
+
+    leftover_pid = json.loads(zygote.call("spawn", "worker", [{}])["val"])["pid"]
+    confirmation = zygote.restart()
+    assert is_gone(leftover_pid)
+    assert confirmation["metrics"]["used_standby_worker"]
+    assert zygote.worker_info()["pid"] == standby_pid
+
+
+def test_course_zygote(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="1")
+    course_path = zygote.make_course("course")
+    base = zygote.worker_info()
+    assert base["ppid"] == zygote.process.pid
+    assert not base["preloaded"]
+
+    zygote.switch_course(course_path)
+    course = zygote.worker_info()
+    assert course["preloaded"]
+    course_zygote_pid = course["ppid"]
+    assert course_zygote_pid in zygote.children()
+
+    # Restarts stay within the course zygote.
+    assert zygote.restart()["exited"]
+    assert zygote.worker_info()["ppid"] == course_zygote_pid
+
+    # The course zygote is paused without any standby workers.
+    zygote.switch_course(None)
+    assert zygote.worker_info()["ppid"] == zygote.process.pid
+    assert psutil.Process(course_zygote_pid).children() == []
+
+    zygote.switch_course(course_path)
+    assert zygote.worker_info()["ppid"] == course_zygote_pid
+
+
+def test_course_zygote_switch_is_confirmed(start_zygote) -> None:
+    zygote = start_zygote(STANDBY_WORKERS="1")
+    course_path = zygote.make_course("course")
+
+    confirmation = zygote.switch_course(course_path)
+    assert confirmation["exited"]
+    assert confirmation["metrics"]["time_to_ready_ms"] >= 0
+    assert zygote.switch_course(None)["exited"]
+    assert zygote.restart()["exited"]
+    assert not zygote.has_exit_confirmation()
+
+
+def test_worker_cannot_switch_course(start_zygote) -> None:
+    zygote = start_zygote()
+    course_path = zygote.make_course("course")
+
+    zygote.call("switch", "worker", [{"path": course_path}])
+    assert zygote.restart()["exited"]
+    for _ in range(3):
+        info = zygote.worker_info()
+        assert info["ppid"] == zygote.process.pid
+        assert not info["preloaded"]
+        assert zygote.restart()["exited"]
+
+    # Once code has run in a worker, only a restart allows selecting a course.
+    zygote.worker_info()
+    reply = zygote.call("course", None, [course_path])
+    assert not reply["present"]
+    assert not zygote.worker_info()["preloaded"]
+    zygote.switch_course(course_path)
+    assert zygote.worker_info()["preloaded"]
+
+
+def test_course_zygote_replacement(start_zygote) -> None:
+    zygote = start_zygote(COURSE_ZYGOTE_LIMIT="1")
+    first_path = zygote.make_course("first")
+    second_path = zygote.make_course("second")
+
+    zygote.switch_course(first_path)
+    first_pid = zygote.worker_info()["ppid"]
+    zygote.switch_course(second_path)
+    second_pid = zygote.worker_info()["ppid"]
+    assert second_pid != first_pid
+
+    # Only one course zygote is kept.
+    assert is_gone(first_pid)
+
+    # A course zygote is replaced once one of its preloaded modules changes.
+    helper_path = Path(second_path) / "serverFilesCourse" / "course_helper.py"
+    os.utime(helper_path, (time.time() + 10, time.time() + 10))
+    zygote.switch_course(None)
+    zygote.switch_course(second_path)
+    assert zygote.worker_info()["ppid"] != second_pid
+    assert is_gone(second_pid)
+
+
+@requires_privileges
+def test_course_zygote_users(start_zygote) -> None:
+    import pwd
+
+    executor_uid = pwd.getpwnam("executor").pw_uid
+    zygote = start_zygote(
+        DROP_PRIVILEGES="1", COURSE_ZYGOTE_LIMIT="2", COURSE_ZYGOTE_FIRST_UID="20000"
+    )
+    course_paths = [zygote.make_course(name) for name in ("a", "b", "c")]
+
+    zygote.switch_course(course_paths[0])
+    first = zygote.worker_info()
+    assert first["uid"] in range(20000, 20003)
+    assert psutil.Process(first["ppid"]).uids().real == first["uid"]
+
+    # The cleanup within a course zygote spares only the course zygote.
+    leftover_pid = json.loads(zygote.call("spawn", "worker", [{}])["val"])["pid"]
+    zygote.restart()
+    assert is_gone(leftover_pid)
+    assert zygote.worker_info()["ppid"] == first["ppid"]
+
+    # Workers of other courses can't reach the paused course zygote.
+    zygote.switch_course(None)
+    assert zygote.worker_info()["uid"] == executor_uid
+    reply = zygote.call("can_signal", "worker", [{"pid": first["ppid"]}])
+    assert not json.loads(reply["val"])
+
+    zygote.switch_course(course_paths[1])
+    second = zygote.worker_info()
+    assert second["uid"] in range(20000, 20003)
+    assert second["uid"] != first["uid"]
+    reply = zygote.call("can_signal", "worker", [{"pid": first["ppid"]}])
+    assert not json.loads(reply["val"])
+
+    # Once the least recently used course zygote is evicted, nothing runs as
+    # its user anymore.
+    zygote.switch_course(course_paths[2])
+    third = zygote.worker_info()
+    assert third["uid"] not in (first["uid"], second["uid"])
+    assert is_gone(first["ppid"])
+    assert not any(
+        p.uids().real == first["uid"]
+        for p in psutil.process_iter()
+        if p.status() != psutil.STATUS_ZOMBIE
+    )